@@ -1,12 +1,13 @@
-import sys
+import sys, concurrent.futures
 import json
+from contextlib import ExitStack
+from functools import partial
 from typing import Optional
 from pprint import pprint
 import pandas as pd
 from tqdm import tqdm
 import torch
 import torchio
-import SimpleITK as sitk
 import numpy as np
 
 from GANDLF.config_manager import ConfigManager
@@ -21,11 +22,11 @@ from GANDLF.metrics import (
     mean_absolute_error,
     ncc_metrics,
 )
-from GANDLF.losses.segmentation import dice
 from GANDLF.metrics.segmentation import (
     _calculator_generic_all_surface_distances,
-    _calculator_sensitivity_specificity,
-    _calculator_jaccard,
+    get_segmentation_statistics,
+    get_label_overlap_measures,
+    segmentation_statistics_metrics,
 )
 
 
@@ -59,6 +60,228 @@ def __update_header_location_case_insensitive(
         return input_df
 
 
+def _fix_2d_tensor(input_tensor: torch.Tensor) -> torch.Tensor:
+    """
+    This function checks for 2d images and change the shape to [B, C, H, W]
+
+    Args:
+        input_tensor (torch.Tensor): The input tensor.
+
+    Returns:
+        torch.Tensor: The output tensor in the format that torchmetrics expects.
+    """
+    if input_tensor.shape[-1] == 1:
+        return input_tensor.squeeze(-1).unsqueeze(0)
+    else:
+        return input_tensor
+
+
+def _percentile_clip(
+    input_tensor: torch.Tensor,
+    reference_tensor: torch.Tensor = None,
+    p_min: Optional[float] = 0.5,
+    p_max: Optional[float] = 99.5,
+    strictlyPositive: Optional[bool] = True,
+) -> torch.Tensor:
+    """
+    Normalizes a tensor based on percentiles. Clips values below and above the percentile.
+    Percentiles for normalization can come from another tensor.
+
+    Args:
+        input_tensor (torch.Tensor): Tensor to be normalized based on the data from the reference_tensor. If reference_tensor is None, the percentiles from this tensor will be used.
+        reference_tensor (torch.Tensor, optional): The tensor used for obtaining the percentiles.
+        p_min (float, optional): Lower end percentile. Defaults to 0.5.
+        p_max (float, optional): Upper end percentile. Defaults to 99.5.
+        strictlyPositive (bool, optional): Ensures that really all values are above 0 before normalization. Defaults to True.
+
+    Returns:
+        torch.Tensor: The input_tensor normalized based on the percentiles of the reference tensor.
+    """
+    reference_tensor = input_tensor if reference_tensor is None else reference_tensor
+    # get p_min percentile and p_max percentile
+    v_min, v_max = np.percentile(reference_tensor, [p_min, p_max])
+    # set lower bound to be 0 if strictlyPositive is enabled
+    v_min = max(v_min, 0.0) if strictlyPositive else v_min
+    # clip values to percentiles from reference_tensor
+    output_tensor = np.clip(input_tensor, v_min, v_max)
+    # normalizes values to [0;1]
+    output_tensor = (output_tensor - v_min) / (v_max - v_min)
+    return output_tensor
+
+
+def _get_segmentation_metrics(subject: dict, parameters: dict) -> dict:
+    """
+    This function computes the segmentation metrics of all classes of a subject, reading each image once.
+
+    Args:
+        subject (dict): The row of the subject in the input data, with the "Target" and "Prediction" images.
+        parameters (dict): The parameters from the input config.
+
+    Returns:
+        dict: The metrics of the subject.
+    """
+    class_list = parameters["model"]["class_list"]
+    label_image = torchio.LabelMap(subject["Target"])
+    pred_image = torchio.LabelMap(subject["Prediction"])
+    label_tensor = label_image.data
+    pred_tensor = pred_image.data
+    spacing = label_image.spacing
+    if label_tensor.data.shape[-1] == 1:
+        spacing = spacing[0:2]
+    # the classes are evaluated separately, so no label is ignored
+    metrics_parameters = {
+        "model": {"num_classes": len(class_list), "ignore_label_validation": None},
+        # add dimension for batch
+        "subject_spacing": torch.Tensor(spacing).unsqueeze(0),
+        "surface_distance_workers": parameters.get("surface_distance_workers", 0),
+    }
+
+    # one hot encode with batch_size = 1
+    label_image_one_hot = one_hot(label_tensor.unsqueeze(0), class_list)
+    pred_image_one_hot = one_hot(pred_tensor.unsqueeze(0), class_list)
+
+    # a single pass over the images gives the overlap statistics of all classes
+    statistics = get_segmentation_statistics(pred_image_one_hot, label_image_one_hot)
+    per_label_metrics = {
+        metric: segmentation_statistics_metrics[metric + "_per_label"](
+            statistics, metrics_parameters
+        ).tolist()
+        for metric in ["dice", "sensitivity", "specificity_segmentation", "jaccard"]
+    }
+    nsd, hd100, hd95 = _calculator_generic_all_surface_distances(
+        pred_image_one_hot, label_image_one_hot, metrics_parameters, per_label=True
+    )
+    label_overlap_measures = get_label_overlap_measures(statistics["confusion"][0])
+
+    subject_metrics = {}
+    for class_index, _ in enumerate(class_list):
+        subject_metrics[str(class_index)] = {
+            "dice": per_label_metrics["dice"][class_index],
+            "nsd": nsd[class_index].item(),
+            "hd100": hd100[class_index].item(),
+            "hd95": hd95[class_index].item(),
+            "sensitivity": per_label_metrics["sensitivity"][class_index],
+            "specificity": per_label_metrics["specificity_segmentation"][class_index],
+        }
+        subject_metrics["jaccard_" + str(class_index)] = per_label_metrics["jaccard"][
+            class_index
+        ]
+        for measure, values in label_overlap_measures.items():
+            subject_metrics[measure + "_" + str(class_index)] = values[class_index]
+    return subject_metrics
+
+
+def _get_synthesis_metrics(subject: dict, parameters: dict) -> dict:
+    """
+    This function computes the synthesis metrics of a subject.
+
+    Args:
+        subject (dict): The row of the subject in the input data, with the "Target" and "Prediction" images, and the optional "Mask" and "VoidImage" images.
+        parameters (dict): The parameters from the input config.
+
+    Returns:
+        dict: The metrics of the subject.
+    """
+    subject_metrics = {}
+    target_image = _fix_2d_tensor(torchio.ScalarImage(subject["Target"]).data)
+    pred_image = _fix_2d_tensor(torchio.ScalarImage(subject["Prediction"]).data)
+    # if "Mask" is not in the row, we assume that the whole image is the mask
+    # always cast to byte tensor
+    mask = (
+        _fix_2d_tensor(torchio.LabelMap(subject["Mask"]).data)
+        if "Mask" in subject
+        else torch.from_numpy(np.ones(target_image.numpy().shape, dtype=np.uint8))
+    ).byte()
+
+    void_image_present = True if "VoidImage" in subject else False
+    void_image = (
+        _fix_2d_tensor(torchio.ScalarImage(subject["VoidImage"]).data)
+        if "VoidImage" in subject
+        else torch.from_numpy(np.ones(target_image.numpy().shape, dtype=np.uint8))
+    )
+
+    # Get Infill region (we really are only interested in the infill region)
+    output_infill = (pred_image * mask).float()
+    gt_image_infill = (target_image * mask).float()
+
+    # Normalize to [0;1] based on GT (otherwise MSE will depend on the image intensity range)
+    normalize = parameters.get("normalize", True)
+    if normalize:
+        # use all the tissue that is not masked for normalization
+        reference_tensor = (
+            target_image * ~mask if not void_image_present else void_image
+        )
+        gt_image_infill = _percentile_clip(
+            gt_image_infill,
+            reference_tensor=reference_tensor,
+            p_min=0.5,
+            p_max=99.5,
+            strictlyPositive=True,
+        )
+        output_infill = _percentile_clip(
+            output_infill,
+            reference_tensor=reference_tensor,
+            p_min=0.5,
+            p_max=99.5,
+            strictlyPositive=True,
+        )
+
+    subject_metrics["ssim"] = structural_similarity_index(
+        output_infill, gt_image_infill, mask
+    ).item()
+
+    # ncc metrics
+    compute_ncc = parameters.get("compute_ncc", True)
+    if compute_ncc:
+        calculated_ncc_metrics = ncc_metrics(output_infill, gt_image_infill)
+        for key, value in calculated_ncc_metrics.items():
+            # we don't need the ".item()" here, since the values are already scalars
+            subject_metrics[key] = value
+
+    # only voxels that are to be inferred (-> flat array)
+    # these are required for mse, psnr, etc.
+    gt_image_infill = gt_image_infill[mask]
+    output_infill = output_infill[mask]
+
+    subject_metrics["mse"] = mean_squared_error(output_infill, gt_image_infill).item()
+
+    subject_metrics["rmse"] = root_mean_squared_error(
+        output_infill, gt_image_infill
+    ).item()
+
+    subject_metrics["msle"] = mean_squared_log_error(
+        output_infill, gt_image_infill
+    ).item()
+
+    subject_metrics["mae"] = mean_absolute_error(output_infill, gt_image_infill).item()
+
+    # torchmetrics PSNR using "max"
+    subject_metrics["psnr"] = peak_signal_noise_ratio(
+        output_infill, gt_image_infill
+    ).item()
+
+    # same as above but with epsilon for robustness
+    subject_metrics["psnr_eps"] = peak_signal_noise_ratio(
+        output_infill, gt_image_infill, epsilon=sys.float_info.epsilon
+    ).item()
+
+    # only use fix data range to [0;1] if the data was normalized before
+    if normalize:
+        # torchmetrics PSNR but with fixed data range of 0 to 1
+        subject_metrics["psnr_01"] = peak_signal_noise_ratio(
+            output_infill, gt_image_infill, data_range=(0, 1)
+        ).item()
+
+        # same as above but with epsilon for robustness
+        subject_metrics["psnr_01_eps"] = peak_signal_noise_ratio(
+            output_infill,
+            gt_image_infill,
+            data_range=(0, 1),
+            epsilon=sys.float_info.epsilon,
+        ).item()
+    return subject_metrics
+
+
 def generate_metrics_dict(
     input_csv: str,
     config: str,
@@ -146,7 +369,6 @@ def generate_metrics_dict(
             input_df["SubjectID"].duplicated().sum() == 0
         ), "The `SubjectID` column should not have duplicates"
 
-    overall_stats_dict = {}
     parameters = ConfigManager(config)
     # ensure that the problem_type is set
     problem_type = parameters.get("problem_type", None)
@@ -168,272 +390,58 @@ def generate_metrics_dict(
         overall_stats_dict = overall_stats(
             predictions_tensor, labels_tensor, parameters
         )
-
-    elif problem_type == "segmentation":
-        # read images and then calculate metrics
-        class_list = parameters["model"]["class_list"]
-        for _, row in tqdm(input_df.iterrows(), total=input_df.shape[0]):
-            current_subject_id = row["SubjectID"]
-            overall_stats_dict[current_subject_id] = {}
-            label_image = torchio.LabelMap(row["Target"])
-            pred_image = torchio.LabelMap(row["Prediction"])
-            label_tensor = label_image.data
-            pred_tensor = pred_image.data
-            spacing = label_image.spacing
-            if label_tensor.data.shape[-1] == 1:
-                spacing = spacing[0:2]
-            # add dimension for batch
-            parameters["subject_spacing"] = torch.Tensor(spacing).unsqueeze(0)
-            label_tensor = label_tensor.unsqueeze(0)
-            pred_tensor = pred_tensor.unsqueeze(0)
-
-            # one hot encode with batch_size = 1
-            label_image_one_hot = one_hot(label_tensor, class_list)
-            pred_image_one_hot = one_hot(pred_tensor, class_list)
-
-            for class_index, _ in enumerate(class_list):
-                current_target = label_image_one_hot[:, class_index, ...].unsqueeze(0)
-                current_prediction = pred_image_one_hot[:, class_index, ...].unsqueeze(
-                    0
-                )
-                overall_stats_dict[current_subject_id][str(class_index)] = {}
-                # this is inconsequential, since one_hot will ensure that the classes are present
-                parameters["model"]["class_list"] = [1]
-                parameters["model"]["num_classes"] = 1
-                overall_stats_dict[current_subject_id][str(class_index)]["dice"] = dice(
-                    current_prediction, current_target
-                ).item()
-                nsd, hd100, hd95 = _calculator_generic_all_surface_distances(
-                    current_prediction, current_target, parameters
-                )
-                overall_stats_dict[current_subject_id][str(class_index)][
-                    "nsd"
-                ] = nsd.item()
-                overall_stats_dict[current_subject_id][str(class_index)][
-                    "hd100"
-                ] = hd100.item()
-                overall_stats_dict[current_subject_id][str(class_index)][
-                    "hd95"
-                ] = hd95.item()
-
-                (s, p) = _calculator_sensitivity_specificity(
-                    current_prediction, current_target, parameters
-                )
-                overall_stats_dict[current_subject_id][str(class_index)][
-                    "sensitivity"
-                ] = s.item()
-                overall_stats_dict[current_subject_id][str(class_index)][
-                    "specificity"
-                ] = p.item()
-                overall_stats_dict[current_subject_id][
-                    "jaccard_" + str(class_index)
-                ] = _calculator_jaccard(
-                    current_prediction, current_target, parameters
-                ).item()
-                current_target_image = sitk.GetImageFromArray(
-                    current_target[0, 0, ...].long()
-                )
-                current_prediction_image = sitk.GetImageFromArray(
-                    current_prediction[0, 0, ...].long()
+        pprint(overall_stats_dict)
+        if outputfile is not None:
+            ## todo: needs debugging since this writes the file handler in some cases, so replaced with json
+            # with open(outputfile, "w") as outfile:
+            #     yaml.dump(overall_stats_dict, outfile)
+            with open(outputfile, "w") as file:
+                file.write(json.dumps(overall_stats_dict))
+
+    elif problem_type in ["segmentation", "synthesis"]:
+        if problem_type == "synthesis":
+            # these are additional columns that could be present for synthesis tasks
+            for column_to_make_case_insensitive in ["Mask", "VoidImage"]:
+                input_df = __update_header_location_case_insensitive(
+                    input_df, column_to_make_case_insensitive, False
                 )
-                label_overlap_filter = sitk.LabelOverlapMeasuresImageFilter()
-                label_overlap_filter.Execute(
-                    current_target_image, current_prediction_image
-                )
-                # overall_stats_dict[current_subject_id][
-                #     "falseDiscoveryRate_" + str(class_index)
-                # ] = label_overlap_filter.GetFalseDiscoveryRate()
-                overall_stats_dict[current_subject_id][
-                    "falseNegativeError_" + str(class_index)
-                ] = label_overlap_filter.GetFalseNegativeError()
-                overall_stats_dict[current_subject_id][
-                    "falsePositiveError_" + str(class_index)
-                ] = label_overlap_filter.GetFalsePositiveError()
-                overall_stats_dict[current_subject_id][
-                    "meanOverlap_" + str(class_index)
-                ] = label_overlap_filter.GetMeanOverlap()
-                overall_stats_dict[current_subject_id][
-                    "unionOverlap_" + str(class_index)
-                ] = label_overlap_filter.GetUnionOverlap()
-                overall_stats_dict[current_subject_id][
-                    "volumeSimilarity_" + str(class_index)
-                ] = label_overlap_filter.GetVolumeSimilarity()
-
-    elif problem_type == "synthesis":
-
-        def __fix_2d_tensor(input_tensor):
-            """
-            This function checks for 2d images and change the shape to [B, C, H, W]
-
-            Args:
-                input_tensor (torch.Tensor): The input tensor.
-
-            Returns:
-                torch.Tensor: The output tensor in the format that torchmetrics expects.
-            """
-            if input_tensor.shape[-1] == 1:
-                return input_tensor.squeeze(-1).unsqueeze(0)
-            else:
-                return input_tensor
-
-        def __percentile_clip(
-            input_tensor: torch.Tensor,
-            reference_tensor: torch.Tensor = None,
-            p_min: Optional[float] = 0.5,
-            p_max: Optional[float] = 99.5,
-            strictlyPositive: Optional[bool] = True,
-        ):
-            """
-            Normalizes a tensor based on percentiles. Clips values below and above the percentile.
-            Percentiles for normalization can come from another tensor.
-
-            Args:
-                input_tensor (torch.Tensor): Tensor to be normalized based on the data from the reference_tensor. If reference_tensor is None, the percentiles from this tensor will be used.
-                reference_tensor (torch.Tensor, optional): The tensor used for obtaining the percentiles.
-                p_min (float, optional): Lower end percentile. Defaults to 0.5.
-                p_max (float, optional): Upper end percentile. Defaults to 99.5.
-                strictlyPositive (bool, optional): Ensures that really all values are above 0 before normalization. Defaults to True.
-
-            Returns:
-                torch.Tensor: The input_tensor normalized based on the percentiles of the reference tensor.
-            """
-            reference_tensor = (
-                input_tensor if reference_tensor is None else reference_tensor
-            )
-            # get p_min percentile and p_max percentile
-            v_min, v_max = np.percentile(reference_tensor, [p_min, p_max])
-            # set lower bound to be 0 if strictlyPositive is enabled
-            v_min = max(v_min, 0.0) if strictlyPositive else v_min
-            # clip values to percentiles from reference_tensor
-            output_tensor = np.clip(input_tensor, v_min, v_max)
-            # normalizes values to [0;1]
-            output_tensor = (output_tensor - v_min) / (v_max - v_min)
-            return output_tensor
-
-        # these are additional columns that could be present for synthesis tasks
-        for column_to_make_case_insensitive in ["Mask", "VoidImage"]:
-            input_df = __update_header_location_case_insensitive(
-                input_df, column_to_make_case_insensitive, False
+            get_subject_metrics = partial(_get_synthesis_metrics, parameters=parameters)
+        else:
+            get_subject_metrics = partial(
+                _get_segmentation_metrics, parameters=parameters
             )
 
-        for _, row in tqdm(input_df.iterrows(), total=input_df.shape[0]):
-            current_subject_id = row["SubjectID"]
-            overall_stats_dict[current_subject_id] = {}
-            target_image = __fix_2d_tensor(torchio.ScalarImage(row["Target"]).data)
-            pred_image = __fix_2d_tensor(torchio.ScalarImage(row["Prediction"]).data)
-            # if "Mask" is not in the row, we assume that the whole image is the mask
-            # always cast to byte tensor
-            mask = (
-                __fix_2d_tensor(torchio.LabelMap(row["Mask"]).data)
-                if "Mask" in row
-                else torch.from_numpy(
-                    np.ones(target_image.numpy().shape, dtype=np.uint8)
+        subjects = [row.to_dict() for _, row in input_df.iterrows()]
+        num_workers = parameters["metrics_num_workers"]
+        with ExitStack() as stack:
+            if num_workers > 0:
+                executor = stack.enter_context(
+                    concurrent.futures.ProcessPoolExecutor(num_workers)
                 )
-            ).byte()
-
-            void_image_present = True if "VoidImage" in row else False
-            void_image = (
-                __fix_2d_tensor(torchio.ScalarImage(row["VoidImage"]).data)
-                if "VoidImage" in row
-                else torch.from_numpy(
-                    np.ones(target_image.numpy().shape, dtype=np.uint8)
-                )
-            )
-
-            # Get Infill region (we really are only interested in the infill region)
-            output_infill = (pred_image * mask).float()
-            gt_image_infill = (target_image * mask).float()
-
-            # Normalize to [0;1] based on GT (otherwise MSE will depend on the image intensity range)
-            normalize = parameters.get("normalize", True)
-            if normalize:
-                # use all the tissue that is not masked for normalization
-                reference_tensor = (
-                    target_image * ~mask if not void_image_present else void_image
-                )
-                gt_image_infill = __percentile_clip(
-                    gt_image_infill,
-                    reference_tensor=reference_tensor,
-                    p_min=0.5,
-                    p_max=99.5,
-                    strictlyPositive=True,
-                )
-                output_infill = __percentile_clip(
-                    output_infill,
-                    reference_tensor=reference_tensor,
-                    p_min=0.5,
-                    p_max=99.5,
-                    strictlyPositive=True,
-                )
-
-            overall_stats_dict[current_subject_id][
-                "ssim"
-            ] = structural_similarity_index(output_infill, gt_image_infill, mask).item()
-
-            # ncc metrics
-            compute_ncc = parameters.get("compute_ncc", True)
-            if compute_ncc:
-                calculated_ncc_metrics = ncc_metrics(output_infill, gt_image_infill)
-                for key, value in calculated_ncc_metrics.items():
-                    # we don't need the ".item()" here, since the values are already scalars
-                    overall_stats_dict[current_subject_id][key] = value
-
-            # only voxels that are to be inferred (-> flat array)
-            # these are required for mse, psnr, etc.
-            gt_image_infill = gt_image_infill[mask]
-            output_infill = output_infill[mask]
-
-            overall_stats_dict[current_subject_id]["mse"] = mean_squared_error(
-                output_infill, gt_image_infill
-            ).item()
-
-            overall_stats_dict[current_subject_id]["rmse"] = root_mean_squared_error(
-                output_infill, gt_image_infill
-            ).item()
-
-            overall_stats_dict[current_subject_id]["msle"] = mean_squared_log_error(
-                output_infill, gt_image_infill
-            ).item()
-
-            overall_stats_dict[current_subject_id]["mae"] = mean_absolute_error(
-                output_infill, gt_image_infill
-            ).item()
-
-            # torchmetrics PSNR using "max"
-            overall_stats_dict[current_subject_id]["psnr"] = peak_signal_noise_ratio(
-                output_infill, gt_image_infill
-            ).item()
-
-            # same as above but with epsilon for robustness
-            overall_stats_dict[current_subject_id][
-                "psnr_eps"
-            ] = peak_signal_noise_ratio(
-                output_infill, gt_image_infill, epsilon=sys.float_info.epsilon
-            ).item()
-
-            # only use fix data range to [0;1] if the data was normalized before
-            if normalize:
-                # torchmetrics PSNR but with fixed data range of 0 to 1
-                overall_stats_dict[current_subject_id][
-                    "psnr_01"
-                ] = peak_signal_noise_ratio(
-                    output_infill, gt_image_infill, data_range=(0, 1)
-                ).item()
-
-                # same as above but with epsilon for robustness
-                overall_stats_dict[current_subject_id][
-                    "psnr_01_eps"
-                ] = peak_signal_noise_ratio(
-                    output_infill,
-                    gt_image_infill,
-                    data_range=(0, 1),
-                    epsilon=sys.float_info.epsilon,
-                ).item()
-
-    pprint(overall_stats_dict)
-    if outputfile is not None:
-        ## todo: needs debugging since this writes the file handler in some cases, so replaced with json
-        # with open(outputfile, "w") as outfile:
-        #     yaml.dump(overall_stats_dict, outfile)
-        with open(outputfile, "w") as file:
-            file.write(json.dumps(overall_stats_dict))
+                all_subject_metrics = executor.map(get_subject_metrics, subjects)
+            else:
+                all_subject_metrics = map(get_subject_metrics, subjects)
+            # the metrics of each subject are written as soon as they are available, so that they are kept if the process is interrupted
+            output_file_handle = None
+            if outputfile is not None:
+                output_file_handle = stack.enter_context(open(outputfile, "w"))
+                output_file_handle.write("{")
+                # the position of the closing brace, which is overwritten by the next subject
+                closing_position = output_file_handle.tell()
+                output_file_handle.write("}")
+                output_file_handle.flush()
+            for index, (subject, subject_metrics) in enumerate(
+                tqdm(zip(subjects, all_subject_metrics), total=len(subjects))
+            ):
+                current_subject_metrics = {subject["SubjectID"]: subject_metrics}
+                pprint(current_subject_metrics)
+                if output_file_handle is not None:
+                    # the file is valid JSON after each subject, and gives the same output as json.dumps of the dictionary of all subjects
+                    output_file_handle.seek(closing_position)
+                    output_file_handle.write(
+                        (", " if index > 0 else "")
+                        + json.dumps(current_subject_metrics)[1:-1]
+                    )
+                    closing_position = output_file_handle.tell()
+                    output_file_handle.write("}")
+                    output_file_handle.flush()
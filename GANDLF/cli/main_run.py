@@ -8,6 +8,7 @@ from GANDLF.utils import (
     populate_header_in_parameters,
     parseTrainingCSV,
     parseTestingCSV,
+    get_header_index_file,
 )
 
 
@@ -42,6 +43,8 @@ def main_run(
     device = device
     parameters = ConfigManager(model_parameters)
     parameters["device_id"] = -1
+    if parameters["header_index"]:
+        parameters["header_index_file"] = get_header_index_file(file_data_full)
 
     if train_mode:
         if resume:
@@ -56,6 +56,9 @@ def patch_extraction(
             cfg = parse_config(config)
     cfg["scale"] = cfg.get("scale", 16)
     cfg["patch_size"] = cfg.get("patch_size", (256, 256))
+    cfg["tissue_cache_dir"] = cfg.get("tissue_cache_dir", None)
+    cfg["tile_cache_mb"] = cfg.get("tile_cache_mb", 0)
+    cfg["slide_reader"] = cfg.get("slide_reader", "openslide")
     original_patch_size = cfg["patch_size"]
 
     if not os.path.exists(output_path):
@@ -67,17 +70,26 @@ def patch_extraction(
 
     for sid, slide, label in parse_gandlf_csv(input_path):
         # Create new instance of slide manager
-        manager = PatchManager(slide, os.path.join(output_path, str(sid)))
+        manager = PatchManager(
+            slide,
+            os.path.join(output_path, str(sid)),
+            cfg["tile_cache_mb"],
+            cfg["slide_reader"],
+        )
         if label is not None:
             manager.set_label_map(label)
         manager.set_subjectID(str(sid))
         manager.set_image_header("Channel_0")
         manager.set_mask_header("Label")
 
-        cfg["patch_size"] = get_patch_size_in_microns(slide, original_patch_size)
+        cfg["patch_size"] = get_patch_size_in_microns(
+            slide, original_patch_size, slide_reader=cfg["slide_reader"]
+        )
 
         # Generate an initial validity mask
-        mask, scale = generate_initial_mask(slide, cfg["scale"])
+        mask, scale = generate_initial_mask(
+            slide, cfg["scale"], cfg["tissue_cache_dir"], cfg["slide_reader"]
+        )
         print("Setting valid mask...")
         manager.set_valid_mask(mask, scale)
         # Reject patch if any pixels are transparent
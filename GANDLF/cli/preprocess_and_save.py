@@ -9,6 +9,8 @@ from GANDLF.utils import (
     populate_header_in_parameters,
     get_dataframe,
     get_correct_padding_size,
+    get_header_index_file,
+    write_image_to_zarr,
 )
 from GANDLF.config_manager import ConfigManager
 from GANDLF.data.ImagesFromDataFrame import ImagesFromDataFrame
@@ -25,6 +27,7 @@ def preprocess_and_save(
     label_pad_mode: Optional[str] = "constant",
     applyaugs: Optional[bool] = False,
     apply_zero_crop: Optional[bool] = False,
+    output_zarr: Optional[bool] = False,
 ) -> None:
     """
     This function performs preprocessing based on parameters provided and saves the output.
@@ -36,6 +39,7 @@ def preprocess_and_save(
         label_pad_mode (Optional[str], optional): The padding mode for the label. Defaults to "constant".
         applyaugs (Optional[bool], optional): Whether to apply augmentations. Defaults to False.
         apply_zero_crop (Optional[bool], optional): Whether to apply zero crop. Defaults to False.
+        output_zarr (Optional[bool], optional): Whether to write each subject as a chunked Zarr store instead of separate image files. Defaults to False.
     """
     Path(output_dir).mkdir(parents=True, exist_ok=True)
 
@@ -56,6 +60,8 @@ def preprocess_and_save(
             pickle.dump(parameters, handle, protocol=pickle.HIGHEST_PROTOCOL)
 
     parameters = populate_header_in_parameters(parameters, headers)
+    if parameters["header_index"]:
+        parameters["header_index_file"] = get_header_index_file(data_csv)
 
     data_for_processing = ImagesFromDataFrame(
         dataframe,
@@ -104,6 +110,11 @@ def preprocess_and_save(
         Path(current_output_dir).mkdir(parents=True, exist_ok=True)
 
         subject_dict_to_write, subject_process = {}, {}
+        # only update the rows of the current subject in the output csv
+        subject_rows = (
+            base_df.iloc[:, parameters["headers"]["subjectIDHeader"]].astype(str)
+            == subject["subject_id"][0]
+        )
 
         # start constructing the torchio.Subject object
         for channel in parameters["headers"]["channelHeaders"]:
@@ -112,11 +123,13 @@ def preprocess_and_save(
             # dimension, but the constructor needs 4D tensor.
             subject_process[str(channel)] = torchio.ScalarImage(
                 tensor=subject[str(channel)]["data"].squeeze(0),
+                affine=subject[str(channel)]["affine"].squeeze(0),
                 path=subject[str(channel)]["path"],
             )
         if parameters["headers"]["labelHeader"] is not None:
             subject_process["label"] = torchio.LabelMap(
                 tensor=subject["label"]["data"].squeeze(0),
+                affine=subject["label"]["affine"].squeeze(0),
                 path=subject["label"]["path"],
             )
         subject_dict_to_write = torchio.Subject(subject_process)
@@ -142,6 +155,11 @@ def preprocess_and_save(
         if common_ext in [".png", ".jpg", ".jpeg", ".bmp", ".tiff", ".tif"]:
             common_ext = ".vtk"
 
+        # all channels and the label of a subject are written as arrays of a single Zarr store
+        zarr_file = Path(
+            os.path.join(current_output_dir, subject["subject_id"][0] + ".zarr")
+        ).as_posix()
+
         image_for_info_copy = subject_dict_to_write[
             str(parameters["headers"]["channelHeaders"][0])
         ].as_sitk()
@@ -152,12 +170,14 @@ def preprocess_and_save(
                     subject["subject_id"][0] + "_" + str(index) + common_ext,
                 )
             ).as_posix()
-            base_df["channel_" + str(index)] = image_file
             image_to_write = subject_dict_to_write[str(channel)].as_sitk()
             image_to_write.SetOrigin(image_for_info_copy.GetOrigin())
             image_to_write.SetDirection(image_for_info_copy.GetDirection())
             image_to_write.SetSpacing(image_for_info_copy.GetSpacing())
-            if not os.path.isfile(image_file):
+            if output_zarr:
+                image_file = write_image_to_zarr(image_to_write, zarr_file, str(index))
+            base_df.loc[subject_rows, "channel_" + str(index)] = image_file
+            if not output_zarr and not os.path.isfile(image_file):
                 try:
                     sitk.WriteImage(image_to_write, image_file)
                 except IOError:
@@ -174,12 +194,14 @@ def preprocess_and_save(
                     current_output_dir, subject["subject_id"][0] + "_label" + common_ext
                 )
             ).as_posix()
-            base_df["label"] = image_file
             image_to_write = subject_dict_to_write["label"].as_sitk()
             image_to_write.SetOrigin(image_for_info_copy.GetOrigin())
             image_to_write.SetDirection(image_for_info_copy.GetDirection())
             image_to_write.SetSpacing(image_for_info_copy.GetSpacing())
-            if not os.path.isfile(image_file):
+            if output_zarr:
+                image_file = write_image_to_zarr(image_to_write, zarr_file, "label")
+            base_df.loc[subject_rows, "label"] = image_file
+            if not output_zarr and not os.path.isfile(image_file):
                 try:
                     sitk.WriteImage(image_to_write, image_file)
                 except IOError:
@@ -192,11 +214,13 @@ def preprocess_and_save(
         # ensure prediction headers are getting saved, as well
         if len(parameters["headers"]["predictionHeaders"]) > 1:
             for key in parameters["headers"]["predictionHeaders"]:
-                base_df["valuetopredict_" + str(key)] = str(
+                base_df.loc[subject_rows, "valuetopredict_" + str(key)] = str(
                     subject["value_" + str(key)].numpy()[0]
                 )
         elif len(parameters["headers"]["predictionHeaders"]) == 1:
-            base_df["valuetopredict"] = str(subject["value_0"].numpy()[0])
+            base_df.loc[subject_rows, "valuetopredict"] = str(
+                subject["value_0"].numpy()[0]
+            )
 
     path_for_csv = Path(os.path.join(output_dir, "data_processed.csv")).as_posix()
     print("Writing final csv for subsequent training: ", path_for_csv)
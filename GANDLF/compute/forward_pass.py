@@ -15,12 +15,14 @@ from GANDLF.utils import (
     get_date_time,
     get_filename_extension_sanitized,
     get_unique_timestamp,
+    is_zarr_array,
     resample_image,
     reverse_one_hot,
     get_ground_truths_and_predictions_tensor,
     print_and_format_metrics,
+    PredictionsWriter,
 )
-from GANDLF.metrics import overall_stats
+from GANDLF.metrics import OverallStatsCalculator
 from tqdm import tqdm
 
 
@@ -31,6 +33,7 @@ def validate_network(
     params: dict,
     epoch: Optional[int] = 0,
     mode: Optional[str] = "validation",
+    overall_stats_calculator: Optional[OverallStatsCalculator] = None,
 ) -> Tuple[float, dict]:
     """
     Function to validate a network for a single epoch.
@@ -42,6 +45,7 @@ def validate_network(
         params (dict): The parameters passed by the user yaml.
         epoch (int, optional): The current epoch number. Defaults to 0.
         mode (str, optional): The mode of operation. Defaults to "validation".
+        overall_stats_calculator (Optional[OverallStatsCalculator], optional): The calculator of the overall metrics for classification/regression, which is re-used across epochs; created if None. Defaults to None.
 
     Returns:
         Tuple[float, dict]: The average validation loss and the average validation metrics.
@@ -55,10 +59,8 @@ def validate_network(
     average_epoch_valid_metric = {}
 
     for metric in params["metrics"]:
-        if "per_label" in metric:
-            total_epoch_valid_metric[metric] = np.zeros(1)
-        else:
-            total_epoch_valid_metric[metric] = 0
+        # the shape of per-label metrics is defined during execution
+        total_epoch_valid_metric[metric] = 0
 
     logits_list = []
     subject_id_list = []
@@ -67,6 +69,9 @@ def validate_network(
         params["problem_type"] in {"classification", "regression"}
     ) and mode == "validation"
     is_inference = mode == "inference"
+    # older parameter files might not have these options
+    inference_batch_size = params["inference_mechanism"].get("batch_size", 1)
+    inference_num_workers = params["inference_mechanism"].get("num_workers", 0)
 
     # automatic mixed precision - https://pytorch.org/docs/stable/amp.html
     if params["verbose"]:
@@ -94,20 +99,29 @@ def validate_network(
         model.enable_medcam()
         params["medcam_enabled"] = True
 
-    if params["save_output"] or is_inference:
-        if params["problem_type"] != "segmentation":
-            outputToWrite = "Epoch,SubjectID,PredictedValue\n"
-            file_to_write = os.path.join(current_output_dir, "output_predictions.csv")
-            if os.path.exists(file_to_write):
-                file_to_write = os.path.join(
-                    current_output_dir,
-                    "output_predictions_" + get_unique_timestamp() + ".csv",
-                )
+    # the predictions are written as they are produced
+    predictions_writer = None
+    if (
+        params["save_output"]
+        and params["problem_type"] != "segmentation"
+        and "value_keys" in params
+    ):
+        file_to_write = os.path.join(current_output_dir, "output_predictions.csv")
+        if os.path.exists(file_to_write):
+            file_to_write = os.path.join(
+                current_output_dir,
+                "output_predictions_" + get_unique_timestamp() + ".csv",
+            )
+        # the row of each subject is written as soon as it is available, so that it is kept if the process is interrupted
+        predictions_writer = PredictionsWriter(
+            file_to_write, ["Epoch", "SubjectID", "PredictedValue"], chunk_size=1
+        )
 
-    # get ground truths for classification problem, validation set
+    # the overall metrics are accumulated across subjects
     if calculate_overall_metrics:
-        ground_truth_array = []
-        predictions_array = []
+        if overall_stats_calculator is None:
+            overall_stats_calculator = OverallStatsCalculator(params)
+        overall_stats_calculator.reset()
 
     for batch_idx, (subject) in enumerate(
         tqdm(valid_dataloader, desc="Looping over " + mode + " data")
@@ -156,15 +170,30 @@ def validate_network(
             sampler = torchio.data.LabelSampler(params["patch_size"])
             tio_subject = torchio.Subject(subject_dict)
             generator = sampler(tio_subject, num_patches=params["q_samples_per_volume"])
+            patches = list(generator)
             pred_output = 0
-            for patch in generator:
-                image = torch.cat(
-                    [patch[key][torchio.DATA] for key in params["channel_keys"]], dim=0
+            # patches are passed through the model in batches to reduce the per-call overhead
+            for batch_start in range(0, len(patches), inference_batch_size):
+                patches_batch = patches[
+                    batch_start : batch_start + inference_batch_size
+                ]
+                image = torch.stack(
+                    [
+                        torch.cat(
+                            [
+                                patch[key][torchio.DATA]
+                                for key in params["channel_keys"]
+                            ],
+                            dim=0,
+                        )
+                        for patch in patches_batch
+                    ],
+                    dim=0,
                 )
                 valuesToPredict = torch.cat(
-                    [patch["value_" + key] for key in params["value_keys"]], dim=0
+                    [patches_batch[-1]["value_" + key] for key in params["value_keys"]],
+                    dim=0,
                 )
-                image = image.unsqueeze(0)
                 image = image.float().to(params["device"])
                 ## special case for 2D
                 assert params["model"]["type"] in [
@@ -174,13 +203,13 @@ def validate_network(
                 if image.shape[-1] == 1:
                     image = torch.squeeze(image, -1)
                 if params["model"]["type"] == "torch":
-                    pred_output += model(image)
+                    pred_output += model(image).sum(dim=0, keepdim=True)
                 elif params["model"]["type"] == "openvino":
                     pred_output += torch.from_numpy(
                         model(
                             inputs={params["model"]["IO"][0][0]: image.cpu().numpy()}
                         )[params["model"]["IO"][1][0]]
-                    )
+                    ).sum(dim=0, keepdim=True)
 
             pred_output = pred_output.cpu() / params["q_samples_per_volume"]
 
@@ -188,25 +217,26 @@ def validate_network(
                 logits_list.append(pred_output)
                 subject_id_list.append(subject.get("subject_id")[0])
 
-            if params["save_output"] or is_inference:
+            if predictions_writer is not None:
                 # we divide by scaling factor here because we multiply by it during loss/metric calculation
                 # TODO: regression-only, right?
-                outputToWrite += (
-                    str(epoch)
-                    + ","
-                    + subject["subject_id"][0]
-                    + ","
-                    + str(pred_output.cpu().max().item() / params["scaling_factor"])
-                    + "\n"
+                predictions_writer.write_row(
+                    [
+                        epoch,
+                        subject["subject_id"][0],
+                        pred_output.cpu().max().item() / params["scaling_factor"],
+                    ]
                 )
             final_loss, final_metric = get_loss_and_metrics(
                 image, valuesToPredict, pred_output, params
             )
 
             if calculate_overall_metrics:
-                ground_truth_array.append(label_ground_truth.item())
                 # TODO: that's for classification only. What about regression?
-                predictions_array.append(torch.argmax(pred_output[0], 0).cpu().item())
+                overall_stats_calculator.update(
+                    torch.argmax(pred_output[0], 0).reshape(1).float(),
+                    label_ground_truth.reshape(1).float(),
+                )
             # # Non network validation related
             total_epoch_valid_loss += final_loss.detach().cpu().item()
             for metric, metric_val in final_metric.items():
@@ -220,7 +250,11 @@ def validate_network(
                 params["patch_size"],
                 patch_overlap=params["inference_mechanism"]["patch_overlap"],
             )
-            patch_loader = torch.utils.data.DataLoader(grid_sampler, batch_size=1)
+            patch_loader = torch.utils.data.DataLoader(
+                grid_sampler,
+                batch_size=inference_batch_size,
+                num_workers=inference_num_workers,
+            )
             aggregator = torchio.inference.GridAggregator(
                 grid_sampler,
                 overlap_mode=params["inference_mechanism"]["grid_aggregator_overlap"],
@@ -263,7 +297,13 @@ def validate_network(
                 # calculate metrics if ground truth is present
                 label = None
                 if params["problem_type"] != "segmentation":
-                    label = label_ground_truth
+                    # the same ground truth applies to every patch in the batch
+                    if label_ground_truth is not None:
+                        label = (
+                            label_ground_truth.view(1, -1)
+                            .repeat(image.shape[0], 1)
+                            .squeeze(-1)
+                        )
                 elif "label" in patches_batch:
                     label = patches_batch["label"][torchio.DATA]
 
@@ -299,7 +339,9 @@ def validate_network(
                 else:
                     if torch.is_tensor(output):
                         # this probably needs customization for classification (majority voting or median, perhaps?)
-                        output_prediction += output.detach().cpu()
+                        output_prediction += (
+                            output.detach().cpu().sum(dim=0, keepdim=True)
+                        )
                     else:
                         output_prediction += output
 
@@ -334,6 +376,9 @@ def validate_network(
 
                     # if jpg detected, convert to 8-bit arrays
                     ext = get_filename_extension_sanitized(subject["1"]["path"][0])
+                    # Zarr arrays have no file extension, so their outputs are written as NIfTI
+                    if is_zarr_array(subject["1"]["path"][0]):
+                        ext = ".nii.gz"
                     if ext in [".jpg", ".jpeg", ".png"]:
                         pred_mask = pred_mask.astype(np.uint8)
 
@@ -378,21 +423,16 @@ def validate_network(
                     sitk.WriteImage(result_image, path_to_save)
             else:
                 # final regression output
-                output_prediction = output_prediction / len(patch_loader)
+                output_prediction = output_prediction / len(grid_sampler)
                 if calculate_overall_metrics:
                     # TOD: what? regression and argmax?
-                    predictions_array.append(
-                        torch.argmax(output_prediction[0], 0).cpu().item()
+                    overall_stats_calculator.update(
+                        torch.argmax(output_prediction[0], 0).reshape(1).float(),
+                        label_ground_truth.reshape(1).float(),
                     )
-                    ground_truth_array.append(label_ground_truth.item())
-                if params["save_output"]:
-                    outputToWrite += (
-                        str(epoch)
-                        + ","
-                        + subject["subject_id"][0]
-                        + ","
-                        + str(output_prediction[0])
-                        + "\n"
+                if predictions_writer is not None:
+                    predictions_writer.write_row(
+                        [epoch, subject["subject_id"][0], output_prediction[0]]
                     )
 
             # get the final attention map and save it
@@ -449,7 +489,9 @@ def validate_network(
                         total_epoch_valid_loss / (batch_idx + 1),
                     )
                     for metric in params["metrics"]:
-                        if isinstance(total_epoch_valid_metric[metric], np.ndarray):
+                        if isinstance(
+                            total_epoch_valid_metric[metric], (np.ndarray, torch.Tensor)
+                        ):
                             to_print = (
                                 total_epoch_valid_metric[metric] / (batch_idx + 1)
                             ).tolist()
@@ -471,11 +513,7 @@ def validate_network(
         print("     Epoch Final   " + mode + " loss : ", average_epoch_valid_loss)
         # get overall stats for classification
         if calculate_overall_metrics:
-            average_epoch_valid_metric = overall_stats(
-                torch.Tensor(predictions_array),
-                torch.Tensor(ground_truth_array),
-                params,
-            )
+            average_epoch_valid_metric = overall_stats_calculator.compute()
         average_epoch_valid_metric = print_and_format_metrics(
             average_epoch_valid_metric,
             total_epoch_valid_metric,
@@ -517,9 +555,7 @@ def validate_network(
                 )
             logits_df.to_csv(logits_file, index=False, sep=",")
 
-        if "value_keys" in params:
-            file = open(file_to_write, "w")
-            file.write(outputToWrite)
-            file.close()
+    if predictions_writer is not None:
+        predictions_writer.close()
 
     return average_epoch_valid_loss, average_epoch_valid_metric
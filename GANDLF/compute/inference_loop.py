@@ -1,7 +1,7 @@
 from .forward_pass import validate_network
 from .generic import create_pytorch_objects
-import os, sys
-from typing import Optional
+import os, sys, concurrent.futures, tempfile
+from typing import Callable, Iterable, Iterator, Optional, Tuple
 from pathlib import Path
 import pandas as pd
 
@@ -11,11 +11,12 @@ os.environ["TORCHIO_HIDE_CITATION_PROMPT"] = "1"
 import torch
 import cv2
 import numpy as np
+import tifffile
 from torch.utils.data import DataLoader
 from skimage.io import imsave
 from tqdm import tqdm
 from torch.cuda.amp import autocast
-import openslide
+from GANDLF.data.patch_miner.opm.slide_reader import open_slide
 from GANDLF.data import get_testing_loader
 from GANDLF.utils import (
     best_model_path_end,
@@ -23,12 +24,330 @@ from GANDLF.utils import (
     load_ov_model,
     print_model_summary,
     applyCustomColorMap,
+    PredictionsWriter,
 )
 
 from GANDLF.data.inference_dataloader_histopath import InferTumorSegDataset
 from GANDLF.data.preprocessing import get_transforms_for_preprocessing
 
 
+def _prefetch_batches(dataloader: Iterable) -> Iterator:
+    """
+    This function reads the next batch of a data loader in a background thread while the current batch is being processed. This is used when the data loader has no workers, since openslide releases the GIL while reading regions.
+
+    Args:
+        dataloader (Iterable): The data loader to prefetch from.
+
+    Yields:
+        Iterator: The batches of the data loader, in order.
+    """
+    iterator = iter(dataloader)
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        future = executor.submit(next, iterator, None)
+        while True:
+            batch = future.result()
+            if batch is None:
+                return
+            future = executor.submit(next, iterator, None)
+            yield batch
+
+
+def _get_inference_map(
+    shape: Tuple[int, ...], dtype: type, memmap_dir: Optional[str] = None
+) -> np.ndarray:
+    """
+    This function initializes a zero-filled map to accumulate the patch outputs of a slide into.
+
+    Args:
+        shape (Tuple[int, ...]): The shape of the map.
+        dtype (type): The data type of the map.
+        memmap_dir (Optional[str], optional): The directory in which the map is memory-mapped to a file; kept in memory if None. Defaults to None.
+
+    Returns:
+        np.ndarray: The map.
+    """
+    if memmap_dir is None:
+        return np.zeros(shape, dtype=dtype)
+    # the file is sparse until it is written to, so only the touched regions use disk space
+    return np.lib.format.open_memmap(
+        os.path.join(memmap_dir, np.dtype(dtype).name + "_map.npy"),
+        mode="w+",
+        dtype=dtype,
+        shape=shape,
+    )
+
+
+def _get_map_region(
+    x_coord: int, y_coord: int, patch_size: Tuple[int, int], downsample: int
+) -> Tuple[slice, slice]:
+    """
+    This function returns the region of a map downsampled by an integer factor that is covered by a patch.
+
+    Args:
+        x_coord (int): The x coordinate of the patch in the slide level.
+        y_coord (int): The y coordinate of the patch in the slide level.
+        patch_size (Tuple[int, int]): The width and height of the patch in the slide level.
+        downsample (int): The downsample factor of the map with respect to the slide level.
+
+    Returns:
+        Tuple[slice, slice]: The rows and columns of the map covered by the patch.
+    """
+    # the region is rounded outwards so that every covered pixel is updated
+    return (
+        slice(y_coord // downsample, -(-(y_coord + patch_size[1]) // downsample)),
+        slice(x_coord // downsample, -(-(x_coord + patch_size[0]) // downsample)),
+    )
+
+
+def _accumulate_patch_output(map_region: np.ndarray, patch_output: np.ndarray) -> None:
+    """
+    This function adds the output of a patch for all classes to the region of the probability map covered by the patch.
+
+    Args:
+        map_region (np.ndarray): The (class, height, width) region of the probability map, which is updated in place.
+        patch_output (np.ndarray): The output of the patch, either a value per class or a (class, height, width) map.
+    """
+    if patch_output.ndim == 1:
+        # the value of each class is broadcast over the region
+        patch_output = patch_output[:, None, None]
+    elif patch_output.shape != map_region.shape:
+        # segmentation outputs are resized to the region of the downsampled map
+        height, width = map_region.shape[1:]
+        patch_output = cv2.resize(
+            np.moveaxis(patch_output.astype(np.float32), 0, -1),
+            (width, height),
+            interpolation=cv2.INTER_AREA,
+        ).reshape(height, width, -1)
+        patch_output = np.moveaxis(patch_output, -1, 0)
+    map_region += patch_output
+
+
+def _normalize_inference_maps(
+    probs_map: Optional[np.ndarray],
+    count_map: np.ndarray,
+    band_height: Optional[int] = 1024,
+) -> float:
+    """
+    This function normalizes the accumulated probability map by the counts of the patches, and converts the count map to the image that is saved, both in place and band by band, so that no temporary of the size of the maps is needed.
+
+    Args:
+        probs_map (Optional[np.ndarray]): The (class, height, width) probability map, which is divided by the counts; ignored if None.
+        count_map (np.ndarray): The (height, width) count map, which is scaled by 255 and saturated to the range of its data type.
+        band_height (Optional[int], optional): The number of rows that are processed at a time. Defaults to 1024.
+
+    Returns:
+        float: The maximum of the normalized probability map.
+    """
+    max_probability = 0.0
+    max_count_value = np.iinfo(count_map.dtype).max
+    for row in range(0, count_map.shape[0], band_height):
+        band = slice(row, row + band_height)
+        counts = count_map[band]
+        if probs_map is not None:
+            probs_band = probs_map[:, band]
+            np.divide(probs_band, counts, out=probs_band, where=counts > 0)
+            if probs_band.size > 0:
+                max_probability = max(max_probability, float(probs_band.max()))
+        # a wider type ensures that the scaled counts do not wrap around
+        counts[:] = np.minimum(counts.astype(np.uint32) * 255, max_count_value)
+    return max_probability
+
+
+# the colormaps of the heatmaps, which map a grayscale image to a BGR image
+_heatmap_colormaps = {
+    "jet": lambda heatmap_gray: cv2.applyColorMap(heatmap_gray, cv2.COLORMAP_JET),
+    "turbo": lambda heatmap_gray: cv2.applyColorMap(heatmap_gray, cv2.COLORMAP_TURBO),
+    "agni": applyCustomColorMap,
+}
+
+
+def _read_overview_image(
+    os_image: object,
+    level: int,
+    map_shape: Tuple[int, int],
+    output_downsample: int,
+    memmap_dir: Optional[str] = None,
+    band_height: Optional[int] = 1024,
+) -> np.ndarray:
+    """
+    This function reads the image of a slide level once at the resolution of the output maps, which all blended heatmaps are generated from.
+
+    Args:
+        os_image (object): The slide.
+        level (int): The level of the slide that inference is performed on.
+        map_shape (Tuple[int, int]): The height and width of the output maps.
+        output_downsample (int): The downsample factor of the maps with respect to the slide level.
+        memmap_dir (Optional[str], optional): The directory in which the image is memory-mapped to a file; kept in memory if None. Defaults to None.
+        band_height (Optional[int], optional): The number of rows of the level that are read at a time. Defaults to 1024.
+
+    Returns:
+        np.ndarray: The (height, width, 3) BGR image, in the channel order of the heatmaps.
+    """
+    map_height, map_width = map_shape
+    if output_downsample > 1:
+        # the thumbnail keeps the aspect ratio, so it is resized to the exact size of the maps
+        return cv2.resize(
+            cv2.cvtColor(
+                np.asarray(
+                    os_image.get_thumbnail((map_width, map_height)).convert("RGB")
+                ),
+                cv2.COLOR_RGB2BGR,
+            ),
+            (map_width, map_height),
+        )
+
+    overview_image = _get_inference_map(
+        (map_height, map_width, 3), np.uint8, memmap_dir
+    )
+    level_downsample = os_image.level_downsamples[level]
+    if level_downsample != int(level_downsample):
+        # rows of levels with a non-integer downsample do not map exactly to locations in the slide
+        band_height = map_height
+    for row in range(0, map_height, band_height):
+        height = min(band_height, map_height - row)
+        # this is needed because openslide returns an RGBA image
+        overview_image[row : row + height] = cv2.cvtColor(
+            np.asarray(
+                os_image.read_region(
+                    (0, int(row * level_downsample)), level, (map_width, height)
+                ).convert("RGB")
+            ),
+            cv2.COLOR_RGB2BGR,
+        )
+    return overview_image
+
+
+def _get_tile_regions(
+    shape: Tuple[int, int], tile_size: int, downsample: Optional[int] = 1
+) -> Iterator[Tuple[slice, slice]]:
+    """
+    This function returns the regions of an image that are covered by the tiles of a downsampled level of the image, in row-major order.
+
+    Args:
+        shape (Tuple[int, int]): The height and width of the image.
+        tile_size (int): The size of the tiles in the level.
+        downsample (Optional[int], optional): The downsample factor of the level, which is the step of the regions. Defaults to 1.
+
+    Returns:
+        Iterator[Tuple[slice, slice]]: The rows and columns of the image covered by each tile.
+    """
+    height, width = shape
+    region_size = tile_size * downsample
+    for row in range(0, height, region_size):
+        for column in range(0, width, region_size):
+            yield (
+                slice(row, min(row + region_size, height), downsample),
+                slice(column, min(column + region_size, width), downsample),
+            )
+
+
+def _write_tiled_image(
+    output_file: str,
+    shape: Tuple[int, int],
+    render_region: Callable[[Tuple[slice, slice]], np.ndarray],
+    image_format: Optional[str] = "png",
+    tile_size: Optional[int] = 512,
+) -> None:
+    """
+    This function writes a BGR image that is rendered tile by tile, either as a PNG image or as a tiled pyramidal TIFF image, which is written without the full image being in memory.
+
+    Args:
+        output_file (str): The output file.
+        shape (Tuple[int, int]): The height and width of the image.
+        render_region (Callable[[Tuple[slice, slice]], np.ndarray]): The function that returns the BGR pixels of a region of the image.
+        image_format (Optional[str], optional): The format of the image, either "png" or "tiff". Defaults to "png".
+        tile_size (Optional[int], optional): The size of the tiles, which must be a multiple of 16 for TIFF images. Defaults to 512.
+    """
+    height, width = shape
+    if image_format == "png":
+        image = np.empty((height, width, 3), dtype=np.uint8)
+        for region in _get_tile_regions(shape, tile_size):
+            image[region] = render_region(region)
+        cv2.imwrite(output_file, image)
+        return
+
+    # the levels of the pyramid are halved until they fit in a single tile, and are subsampled from the full resolution
+    downsamples = [1]
+    while max(height, width) > tile_size * downsamples[-1]:
+        downsamples.append(downsamples[-1] * 2)
+    with tifffile.TiffWriter(output_file, bigtiff=True) as tiff_writer:
+        for downsample in downsamples:
+            tiff_writer.write(
+                (
+                    cv2.cvtColor(render_region(region), cv2.COLOR_BGR2RGB)
+                    for region in _get_tile_regions(shape, tile_size, downsample)
+                ),
+                shape=(-(-height // downsample), -(-width // downsample), 3),
+                dtype=np.uint8,
+                tile=(tile_size, tile_size),
+                photometric="rgb",
+                compression="zlib",
+                # the lower resolution levels are marked as reduced images of the first one
+                subfiletype=0 if downsample == 1 else 1,
+            )
+
+
+def _write_heatmaps(
+    probs_map: np.ndarray,
+    overview_image: np.ndarray,
+    subject_dest_dir: str,
+    blending_alpha: float,
+    heatmap_format: Optional[str] = "png",
+) -> None:
+    """
+    This function writes the segmentation map of each class, and the heatmap of each class and colormap with its blended version over the slide. All heatmaps are rendered tile by tile from the probability map and the same overview image.
+
+    Args:
+        probs_map (np.ndarray): The (class, height, width) probability map.
+        overview_image (np.ndarray): The BGR image of the slide at the resolution of the probability map.
+        subject_dest_dir (str): The output directory of the subject.
+        blending_alpha (float): The weight of the overview image in the blended heatmaps.
+        heatmap_format (Optional[str], optional): The format of the heatmaps, either "png" or "tiff". Defaults to "png".
+    """
+    map_shape = probs_map.shape[1:]
+    for n in range(probs_map.shape[0]):
+        # save the segmentation maps
+        segmap = ((probs_map[n, ...] > 0.5).astype(np.uint8)) * 255
+        cv2.imwrite(
+            os.path.join(subject_dest_dir, "seg_map_" + str(n) + ".png"), segmap
+        )
+
+        for colormap_name, colormap in _heatmap_colormaps.items():
+            key = str(n) + "_" + colormap_name
+
+            def render_heatmap(region, n=n, colormap=colormap):
+                heatmap_gray = np.array(probs_map[(n,) + region] * 255, dtype=np.uint8)
+                return colormap(heatmap_gray)
+
+            def render_blended_heatmap(region, render_heatmap=render_heatmap):
+                return cv2.addWeighted(
+                    # copied, since opencv does not accept strided regions
+                    np.ascontiguousarray(overview_image[region]),
+                    blending_alpha,
+                    render_heatmap(region),
+                    1 - blending_alpha,
+                    0,
+                )
+
+            _write_tiled_image(
+                os.path.join(
+                    subject_dest_dir, "probability_map" + key + "." + heatmap_format
+                ),
+                map_shape,
+                render_heatmap,
+                heatmap_format,
+            )
+            _write_tiled_image(
+                os.path.join(
+                    subject_dest_dir,
+                    "probability_map_blended_" + key + "." + heatmap_format,
+                ),
+                map_shape,
+                render_blended_heatmap,
+                heatmap_format,
+            )
+
+
 def inference_loop(
     inferenceDataFromPickle: pd.DataFrame,
     device: str,
@@ -154,21 +473,27 @@ def inference_loop(
             "mask_level", parameters["slide_level"]
         )
         parameters["blending_alpha"] = float(parameters.get("blending_alpha", 0.5))
+        # older parameter files might not have these options
+        output_downsample = int(parameters.get("histopath_output_downsample", 1))
+        memmap_dir = parameters.get("histopath_memmap_dir", None)
 
-        output_to_write = "SubjectID,x_coords,y_coords"
+        output_columns = ["SubjectID", "x_coords", "y_coords"]
         if parameters["problem_type"] == "regression":
-            output_to_write += ",output"
+            output_columns += ["output"]
         elif parameters["problem_type"] == "classification":
             for n in range(parameters["model"]["num_classes"]):
-                output_to_write += ",probability_" + str(n)
-        output_to_write += "\n"
+                output_columns += ["probability_" + str(n)]
+        # older parameter files might not have these options
+        predictions_format = parameters.get("histopath_predictions_format", "csv")
+        slide_reader = parameters.get("histopath_slide_reader", "openslide")
+        heatmap_format = parameters.get("histopath_heatmap_format", "png")
 
         # actual computation
         pbar = tqdm(inferenceDataFromPickle.iterrows())
         for _, row in pbar:
             subject_name = row[parameters["headers"]["subjectIDHeader"]]
-            os_image = openslide.open_slide(
-                row[parameters["headers"]["channelHeaders"]].values[0]
+            os_image = open_slide(
+                row[parameters["headers"]["channelHeaders"]].values[0], slide_reader
             )
             max_defined_slide_level = os_image.level_count - 1
             parameters["slide_level"] = min(
@@ -180,14 +505,44 @@ def inference_loop(
             ]
             subject_dest_dir = os.path.join(outputDir, str(subject_name))
             Path(subject_dest_dir).mkdir(parents=True, exist_ok=True)
+            # the predictions of the patches are written as they are produced
+            predictions_writer = None
+            if parameters["problem_type"] != "segmentation":
+                # the rows of each batch are written once it is processed, except for Parquet files, which are only readable once they are closed and are written in larger row groups
+                predictions_chunk_size = 10000
+                if predictions_format != "parquet":
+                    predictions_chunk_size = (
+                        parameters.get("histopath_batch_size")
+                        or parameters["batch_size"]
+                    )
+                predictions_writer = PredictionsWriter(
+                    os.path.join(subject_dest_dir, "predictions." + predictions_format),
+                    output_columns,
+                    predictions_format,
+                    predictions_chunk_size,
+                )
+
+            # the outputs are accumulated at a lower resolution than the slide level, if requested
+            map_height = -(-level_height // output_downsample)
+            map_width = -(-level_width // output_downsample)
+            subject_memmap_dir = None
+            if memmap_dir is not None:
+                Path(memmap_dir).mkdir(parents=True, exist_ok=True)
+                subject_memmap_dir = tempfile.TemporaryDirectory(dir=memmap_dir)
 
             try:
                 count_map, probs_map = None, None
-                count_map = np.zeros((level_height, level_width), dtype=np.uint8)
+                # uint16 ensures that the counts do not overflow for heavily overlapping strides
+                count_map = _get_inference_map(
+                    (map_height, map_width),
+                    np.uint16,
+                    subject_memmap_dir and subject_memmap_dir.name,
+                )
                 # this can probably be made into a single multi-class probability map that functions for all workloads
-                probs_map = np.zeros(
-                    (parameters["model"]["num_classes"], level_height, level_width),
-                    dtype=np.float16,
+                probs_map = _get_inference_map(
+                    (parameters["model"]["num_classes"], map_height, map_width),
+                    np.float16,
+                    subject_memmap_dir and subject_memmap_dir.name,
                 )
             except Exception as e:
                 print(
@@ -219,13 +574,30 @@ def inference_loop(
                 selected_level=parameters["slide_level"],
                 mask_level=parameters["mask_level"],
                 transform=transform_requested,
+                # older parameter files might not have these options
+                tissue_cache_dir=parameters.get("histopath_tissue_cache_dir", None),
+                tile_cache_mb=parameters.get("histopath_tile_cache_mb", 0),
+                slide_reader=slide_reader,
             )
 
+            # pinned batches are copied to the gpu asynchronously
+            pin_memory = parameters["pin_memory_dataloader"] and "cuda" in str(
+                parameters["device"]
+            )
+            # older parameter files might not have these options
+            dataloader_kwargs = {"num_workers": parameters["q_num_workers"]}
+            if parameters["q_num_workers"] > 0:
+                # the workers read the next batches while the current one is passed through the model
+                dataloader_kwargs["prefetch_factor"] = parameters.get(
+                    "histopath_prefetch_factor", 2
+                )
             dataloader = DataLoader(
                 patient_dataset_obj,
-                batch_size=1,
+                batch_size=parameters.get("histopath_batch_size")
+                or parameters["batch_size"],
                 shuffle=False,
-                num_workers=parameters["q_num_workers"],
+                pin_memory=pin_memory,
+                **dataloader_kwargs,
             )
             # update patch_size in case microns were requested
             patch_size = patient_dataset_obj.get_patch_size()
@@ -243,16 +615,20 @@ def inference_loop(
                 "Looping over patches for subject: " + str(subject_name)
             )
 
+            if parameters["q_num_workers"] == 0:
+                dataloader = _prefetch_batches(dataloader)
+
             for image_patches, (x_coords, y_coords) in dataloader:
                 x_coords, y_coords = x_coords.numpy(), y_coords.numpy()
                 if parameters["model"]["type"] == "torch":
+                    image_patches = image_patches.to(
+                        parameters["device"], non_blocking=pin_memory
+                    ).float()
                     if parameters["model"]["amp"]:
                         with autocast():
-                            output = model(
-                                image_patches.float().to(parameters["device"])
-                            )
+                            output = model(image_patches)
                     else:
-                        output = model(image_patches.float().to(parameters["device"]))
+                        output = model(image_patches)
                     output = output.detach().cpu().numpy()
                 else:
                     output = model(
@@ -263,45 +639,40 @@ def inference_loop(
                         }
                     )[parameters["model"]["IO"][1][0]]
 
+                class_outputs = output[:, : parameters["model"]["num_classes"]]
                 for i in range(int(output.shape[0])):
+                    map_region = _get_map_region(
+                        x_coords[i], y_coords[i], patch_size, output_downsample
+                    )
                     if count_map is not None:
-                        count_map[
-                            y_coords[i] : y_coords[i] + patch_size[1],
-                            x_coords[i] : x_coords[i] + patch_size[0],
-                        ] += 1
-                    output_to_write += (
-                        str(subject_name)
-                        + ","
-                        + str(x_coords[i])
-                        + ","
-                        + str(y_coords[i])
+                        count_map[map_region] += 1
+                    # This is a temporary fix for the segmentation problem for single class
+                    if probs_map is not None:
+                        _accumulate_patch_output(
+                            probs_map[(slice(None),) + map_region], class_outputs[i]
+                        )
+
+                if predictions_writer is not None:
+                    predictions_writer.write_rows(
+                        [subject_name, x_coord, y_coord, *current_outputs]
+                        for x_coord, y_coord, current_outputs in zip(
+                            x_coords, y_coords, class_outputs
+                        )
                     )
-                    for n in range(parameters["model"]["num_classes"]):
-                        # This is a temporary fix for the segmentation problem for single class
-                        if probs_map is not None:
-                            probs_map[
-                                n,
-                                y_coords[i] : y_coords[i] + patch_size[1],
-                                x_coords[i] : x_coords[i] + patch_size[0],
-                            ] += output[i][n]
-                        if parameters["problem_type"] != "segmentation":
-                            output_to_write += "," + str(output[i][n])
-                    output_to_write += "\n"
 
             # ensure probability map is scaled
             # reusing variables to save memory
-            if probs_map is not None:
-                probs_map = np.divide(probs_map, count_map)
+            if count_map is not None:
+                # the maps are updated in place so that memory-mapped maps are not loaded
+                max_probability = _normalize_inference_maps(probs_map, count_map)
 
                 # Check if out_probs_map is greater than 1, print a warning
-                if np.max(probs_map) > 1:
+                if max_probability > 1:
                     # Print a warning
                     print(
                         "Warning: Probability map is greater than 1, report the images to GaNDLF developers"
                     )
 
-            if count_map is not None:
-                count_map = np.array(count_map * 255, dtype=np.uint16)
                 imsave(
                     os.path.join(
                         subject_dest_dir,
@@ -311,58 +682,30 @@ def inference_loop(
                     count_map,
                 )
 
-            if parameters["problem_type"] != "segmentation":
-                output_file = os.path.join(subject_dest_dir, "predictions.csv")
-                with open(output_file, "w") as f:
-                    f.write(output_to_write)
+            if predictions_writer is not None:
+                predictions_writer.close()
 
-            heatmaps = {}
             if probs_map is not None:
                 try:
-                    for n in range(parameters["model"]["num_classes"]):
-                        heatmap_gray = np.array(probs_map[n, ...] * 255, dtype=np.uint8)
-                        heatmaps[str(n) + "_jet"] = cv2.applyColorMap(
-                            heatmap_gray, cv2.COLORMAP_JET
-                        )
-                        heatmaps[str(n) + "_turbo"] = cv2.applyColorMap(
-                            heatmap_gray, cv2.COLORMAP_TURBO
-                        )
-                        heatmaps[str(n) + "_agni"] = applyCustomColorMap(heatmap_gray)
-
-                        # save the segmentation maps
-                        file_to_write = os.path.join(
-                            subject_dest_dir, "seg_map_" + str(n) + ".png"
-                        )
-
-                        segmap = ((probs_map[n, ...] > 0.5).astype(np.uint8)) * 255
-
-                        cv2.imwrite(file_to_write, segmap)
-
-                    for key in heatmaps:
-                        file_to_write = os.path.join(
-                            subject_dest_dir, "probability_map" + key + ".png"
-                        )
-                        cv2.imwrite(file_to_write, heatmaps[key])
-
-                        # this is needed because openslide returns an RGBA image
-                        os_image_array = np.asarray(
-                            os_image.read_region(
-                                (0, 0),
-                                parameters["slide_level"],
-                                (level_width, level_height),
-                            ).convert("RGB")
-                        )
-                        blended_image = cv2.addWeighted(
-                            os_image_array,
-                            parameters["blending_alpha"],
-                            heatmaps[key],
-                            1 - parameters["blending_alpha"],
-                            0,
-                        )
-
-                        file_to_write = os.path.join(
-                            subject_dest_dir, "probability_map_blended_" + key + ".png"
-                        )
-                        cv2.imwrite(file_to_write, blended_image)
+                    # the slide is only read once for all heatmaps
+                    overview_image = _read_overview_image(
+                        os_image,
+                        parameters["slide_level"],
+                        (map_height, map_width),
+                        output_downsample,
+                        subject_memmap_dir and subject_memmap_dir.name,
+                    )
+                    _write_heatmaps(
+                        probs_map,
+                        overview_image,
+                        subject_dest_dir,
+                        parameters["blending_alpha"],
+                        heatmap_format,
+                    )
                 except Exception as ex:
                     print("Could not write heatmaps; error:", ex)
+
+            if subject_memmap_dir is not None:
+                # release the memory-mapped maps before their files are removed
+                count_map, probs_map, overview_image = None, None, None
+                subject_memmap_dir.cleanup()
@@ -2,7 +2,12 @@ import sys
 import warnings
 from typing import Dict, Tuple, Union
 from GANDLF.losses import global_losses_dict
-from GANDLF.metrics import global_metrics_dict
+from GANDLF.metrics import (
+    global_metrics_dict,
+    get_segmentation_statistics,
+    segmentation_statistics_metrics,
+)
+import numpy as np
 import torch
 import torch.nn.functional as nnf
 
@@ -14,7 +19,7 @@ def get_metric_output(
     prediction: torch.Tensor,
     target: torch.Tensor,
     params: dict,
-) -> Union[float, list]:
+) -> Union[float, np.ndarray]:
     """
     This function computes the metric output for a given metric function, prediction and target.
 
@@ -25,14 +30,14 @@ def get_metric_output(
         params (dict): The parameters passed by the user yaml.
 
     Returns:
-        float: The computed metric from the label and the prediction.
+        Union[float, np.ndarray]: The computed metric from the label and the prediction.
     """
     metric_output = metric_function(prediction, target, params).detach().cpu()
 
     if metric_output.dim() == 0:
         return metric_output.item()
     else:
-        temp = metric_output.tolist()
+        temp = metric_output.numpy()
         # this check is needed for precision
         if len(temp) > 1:
             return temp
@@ -46,6 +51,33 @@ def get_metric_output(
             return metric_output.item()
 
 
+def get_segmentation_metric_output(
+    metric: str,
+    prediction: torch.Tensor,
+    target: torch.Tensor,
+    params: dict,
+    statistics_cache: dict,
+    cache_key: Union[int, str],
+) -> torch.Tensor:
+    """
+    This function computes a segmentation metric from the segmentation statistics of a prediction and target, so that the statistics are only computed once for all metrics.
+
+    Args:
+        metric (str): The metric to compute, which needs to be in segmentation_statistics_metrics.
+        prediction (torch.Tensor): The input prediction label for the corresponding image label.
+        target (torch.Tensor): The input ground truth for the corresponding image label.
+        params (dict): The parameters passed by the user yaml.
+        statistics_cache (dict): The statistics that have already been computed for this step.
+        cache_key (Union[int, str]): The key of the prediction and target in the cache.
+
+    Returns:
+        torch.Tensor: The computed metric, which is kept on the device so that host synchronization is deferred to the end of the epoch.
+    """
+    if cache_key not in statistics_cache:
+        statistics_cache[cache_key] = get_segmentation_statistics(prediction, target)
+    return segmentation_statistics_metrics[metric](statistics_cache[cache_key], params)
+
+
 def get_loss_and_metrics(
     image: torch.Tensor, target: torch.Tensor, prediction: torch.Tensor, params: dict
 ) -> Tuple[torch.Tensor, Dict[str, float]]:
@@ -130,6 +162,7 @@ def get_loss_and_metrics(
     else:
         loss = loss_function(prediction, target, params)
     metric_output = {}
+    segmentation_statistics = {}
 
     # Metrics should be a list
     for metric in params["metrics"]:
@@ -139,18 +172,39 @@ def get_loss_and_metrics(
             warnings.warn("WARNING: Could not find the requested metric '" + metric)
             continue
 
-        metric_function = global_metrics_dict[metric_lower]
+        if (params["problem_type"] == "segmentation") and (
+            metric_lower in segmentation_statistics_metrics
+        ):
+            # the statistics are shared by all segmentation metrics of the same prediction
+            def metric_output_function(predicted, ground_truth, params, cache_key):
+                return get_segmentation_metric_output(
+                    metric_lower,
+                    predicted,
+                    ground_truth,
+                    params,
+                    segmentation_statistics,
+                    cache_key,
+                )
+
+        else:
+            metric_function = global_metrics_dict[metric_lower]
+
+            def metric_output_function(predicted, ground_truth, params, cache_key):
+                return get_metric_output(
+                    metric_function, predicted, ground_truth, params
+                )
+
         if sdnet_check:
-            metric_output[metric] = get_metric_output(
-                metric_function, prediction[0], target.squeeze(-1), params
+            metric_output[metric] = metric_output_function(
+                prediction[0], target.squeeze(-1), params, "main"
             )
         elif deep_supervision_model:
             for i, _ in enumerate(prediction):
-                metric_output[metric] += get_metric_output(
-                    metric_function, prediction[i], ground_truth_resampled[i], params
+                metric_output[metric] += metric_output_function(
+                    prediction[i], ground_truth_resampled[i], params, i
                 )
         else:
-            metric_output[metric] = get_metric_output(
-                metric_function, prediction, target, params
+            metric_output[metric] = metric_output_function(
+                prediction, target, params, "main"
             )
     return loss, metric_output
@@ -1,5 +1,5 @@
 import os, time, psutil
-from typing import Tuple, Union
+from typing import Optional, Tuple, Union
 import pandas as pd
 import torch
 from torch.utils.data import DataLoader
@@ -25,7 +25,7 @@ from GANDLF.utils import (
     get_model_dict,
     print_and_format_metrics,
 )
-from GANDLF.metrics import overall_stats
+from GANDLF.metrics import OverallStatsCalculator
 from GANDLF.logger import Logger
 from .step import step
 from .forward_pass import validate_network
@@ -44,6 +44,7 @@ def train_network(
     train_dataloader: DataLoader,
     optimizer: torch.optim.Optimizer,
     params: dict,
+    overall_stats_calculator: Optional[OverallStatsCalculator] = None,
 ) -> Tuple[float, dict]:
     """
     This function performs the training of the network.
@@ -53,6 +54,7 @@ def train_network(
         train_dataloader (DataLoader): The dataloader for the training epoch.
         optimizer (torch.optim.Optimizer): Optimizer for optimizing network.
         params (dict): The parameters dictionary.
+        overall_stats_calculator (Optional[OverallStatsCalculator], optional): The calculator of the overall metrics for classification/regression, which is re-used across epochs; created if None. Defaults to None.
 
     Returns:
         Tuple[float, dict]: The average epoch training loss and metrics.
@@ -70,19 +72,15 @@ def train_network(
         "regression",
     }
 
-    # get ground truths
+    # the overall metrics are accumulated across batches
     if calculate_overall_metrics:
-        ground_truth_array = []
-        predictions_array = []
+        if overall_stats_calculator is None:
+            overall_stats_calculator = OverallStatsCalculator(params)
+        overall_stats_calculator.reset()
 
     for metric in params["metrics"]:
-        # TODO: can it be per-label for non-classif?
-        if "per_label" in metric:
-            total_epoch_train_metric[metric] = np.zeros(
-                1
-            )  # real shape would be defined during execution
-        else:
-            total_epoch_train_metric[metric] = 0
+        # the shape of per-label metrics is defined during execution
+        total_epoch_train_metric[metric] = 0
 
     # automatic mixed precision - https://pytorch.org/docs/stable/amp.html
     if params["model"]["amp"]:
@@ -138,11 +136,12 @@ def train_network(
         if calculate_overall_metrics:
             # TODO: smelly code. if segmentation, in some models output may be a list of tensors rather then a one
             #  tensor. This is not handled here. However, `calculate_overall_metrics` is set to False for segmentation
-            ground_truth_array.extend(label.detach().cpu())
             # TODO: output is BATCH_SIZE x N_CLASSES. What if not?
-            batch_predictions = torch.argmax(output, 1).cpu()
+            batch_predictions = torch.argmax(output, 1).detach()
             assert len(batch_predictions) == len(label)
-            predictions_array.extend(batch_predictions.detach().cpu())
+            overall_stats_calculator.update(
+                batch_predictions.float(), label.detach().flatten().float()
+            )
 
         nan_loss = torch.isnan(loss)
         # loss backward
@@ -194,7 +193,9 @@ def train_network(
                     total_epoch_train_loss / (batch_idx + 1),
                 )
                 for metric in params["metrics"]:
-                    if isinstance(total_epoch_train_metric[metric], np.ndarray):
+                    if isinstance(
+                        total_epoch_train_metric[metric], (np.ndarray, torch.Tensor)
+                    ):
                         to_print = (
                             total_epoch_train_metric[metric] / (batch_idx + 1)
                         ).tolist()
@@ -207,9 +208,7 @@ def train_network(
 
     # get overall stats for classification
     if calculate_overall_metrics:
-        average_epoch_train_metric = overall_stats(
-            torch.Tensor(predictions_array), torch.Tensor(ground_truth_array), params
-        )
+        average_epoch_train_metric = overall_stats_calculator.compute()
     # TODO: the following not just prints and formats, but updates the dict also. Clean this code
     #  1. average_epoch_train_metric and total_epoch_train_metric are combined
     #  2. list values in total_epoch_train_metric are converted to strings by some logic (but not in avg_ep_tr_metr)
@@ -224,7 +223,9 @@ def train_network(
     return average_epoch_train_loss, average_epoch_train_metric
 
 
-def train_network_wrapper(model, train_dataloader, optimizer, params):
+def train_network_wrapper(
+    model, train_dataloader, optimizer, params, overall_stats_calculator=None
+):
     """
     Wrapper Function to handle train_dataloader for benign and DP cases and pass on to train a network for a single epoch
     """
@@ -232,11 +233,15 @@ def train_network_wrapper(model, train_dataloader, optimizer, params):
     if params.get("differential_privacy"):
         with train_dataloader as memory_safe_data_loader:
             epoch_train_loss, epoch_train_metric = train_network(
-                model, memory_safe_data_loader, optimizer, params
+                model,
+                memory_safe_data_loader,
+                optimizer,
+                params,
+                overall_stats_calculator,
             )
     else:
         epoch_train_loss, epoch_train_metric = train_network(
-            model, train_dataloader, optimizer, params
+            model, train_dataloader, optimizer, params, overall_stats_calculator
         )
     return epoch_train_loss, epoch_train_metric
 
@@ -366,24 +371,17 @@ def training_loop(
         "regression",
     }
 
+    # the calculators of the overall metrics for classification/regression problems are re-used across epochs
+    overall_stats_calculators = {}
     if calculate_overall_metrics:
-        # get the overall metrics that are calculated automatically for classification/regression problems
-        if params["problem_type"] == "regression":
-            overall_metrics = overall_stats(
-                torch.Tensor([1]), torch.Tensor([1]), params
-            )
-        elif params["problem_type"] == "classification":
-            # this is just used to generate the headers for the overall stats
-            temp_tensor = torch.randint(0, params["model"]["num_classes"], (5,))
-            overall_metrics = overall_stats(
-                temp_tensor.to(dtype=torch.int32),
-                temp_tensor.to(dtype=torch.int32),
-                params,
-            )
-        else:
-            raise NotImplementedError("Problem type not implemented for overall stats")
+        overall_stats_modes = ["train", "validation"]
+        if testingDataDefined:
+            overall_stats_modes.append("testing")
+        for mode in overall_stats_modes:
+            overall_stats_calculators[mode] = OverallStatsCalculator(params)
 
-        for metric in overall_metrics:
+        # the overall metrics are logged as well
+        for metric in overall_stats_calculators["train"].metric_names:
             if metric not in metrics_log:
                 metrics_log.append(metric)
 
@@ -505,10 +503,20 @@ def training_loop(
         params["current_epoch"] = epoch
 
         epoch_train_loss, epoch_train_metric = train_network(
-            model, train_dataloader, optimizer, params
+            model,
+            train_dataloader,
+            optimizer,
+            params,
+            overall_stats_calculators.get("train"),
         )
         epoch_valid_loss, epoch_valid_metric = validate_network(
-            model, val_dataloader, scheduler, params, epoch, mode="validation"
+            model,
+            val_dataloader,
+            scheduler,
+            params,
+            epoch,
+            mode="validation",
+            overall_stats_calculator=overall_stats_calculators.get("validation"),
         )
 
         patience += 1
@@ -527,7 +535,13 @@ def training_loop(
 
         if testingDataDefined:
             epoch_test_loss, epoch_test_metric = validate_network(
-                model, test_dataloader, scheduler, params, epoch, mode="testing"
+                model,
+                test_dataloader,
+                scheduler,
+                params,
+                epoch,
+                mode="testing",
+                overall_stats_calculator=overall_stats_calculators.get("testing"),
             )
             test_logger.write(epoch, epoch_test_loss, epoch_test_metric)
 
@@ -20,12 +20,29 @@ parameter_defaults = {
     "medcam_enabled": False,  # interpretability via medcam
     "save_training": False,  # save outputs during training
     "save_output": False,  # save outputs during validation/testing
-    "in_memory": False,  # pin data to cpu memory
+    "in_memory": False,  # pin data to cpu memory; 'shared' places it in shared memory for all data loading workers
     "pin_memory_dataloader": False,  # pin data to gpu memory
     "scaling_factor": 1,  # scaling factor for regression problems
     "q_max_length": 100,  # the max length of queue
     "q_samples_per_volume": 10,  # number of samples per volume
     "q_num_workers": 4,  # number of worker threads to use
+    "subject_construction_workers": 0,  # number of workers to construct subjects (header reads, resizing, sanity checks) in parallel; 0 means main process is used
+    "subject_construction_backend": "thread",  # either 'thread' or 'process' for subject construction workers
+    "eval_num_workers": 0,  # number of worker processes to load full subjects for validation/testing; 0 means main process is used
+    "eval_prefetch_factor": 2,  # number of subjects loaded in advance by each validation/testing worker
+    "eval_persistent_workers": True,  # keep the validation/testing workers alive across epochs
+    "validation_cache_memory_gb": 0,  # memory budget (in GB) to keep preprocessed validation subjects resident across epochs; disabled if 0
+    "surface_distance_workers": 0,  # number of threads to compute the surface distance metrics (hd95, hd100, nsd) of the classes and samples of a batch in parallel; 0 means main process is used
+    "metrics_num_workers": 0,  # number of worker processes to compute the metrics of the subjects of generate-metrics (segmentation and synthesis) in parallel; 0 means main process is used
+    "histopath_batch_size": None,  # number of patches of a slide that are passed through the model together during histology inference; defaults to batch_size if None
+    "histopath_prefetch_factor": 2,  # number of batches of patches read in advance by each worker (q_num_workers) during histology inference
+    "histopath_output_downsample": 1,  # integer factor by which the probability and count maps of histology inference are downsampled with respect to the slide level
+    "histopath_memmap_dir": None,  # directory in which the probability and count maps of histology inference are memory-mapped to files; kept in memory if None
+    "histopath_predictions_format": "csv",  # format of the patch-level predictions of histology inference, either 'csv', 'parquet' or 'arrow' (the latter two require pyarrow)
+    "histopath_tissue_cache_dir": None,  # directory to cache the tissue masks and patch coordinates of slides for histology inference, which can be shared with the patch miner; disabled if None
+    "histopath_tile_cache_mb": 0,  # memory budget (in MB) per data loading worker of the decoded slide tiles kept for overlapping patches during histology inference; disabled if 0
+    "histopath_slide_reader": "openslide",  # reader backend of the slides for histology inference, either 'openslide', 'tiffslide' (requires tiffslide) or 'tifffile' (pyramidal and plain TIFF slides)
+    "histopath_heatmap_format": "png",  # format of the heatmaps of histology inference, either 'png' or 'tiff' (tiled pyramidal TIFF, which is written tile by tile)
     "num_epochs": 100,  # total number of epochs to train
     "patience": 100,  # number of epochs to wait for performance improvement
     "batch_size": 1,  # default batch size of training
@@ -33,6 +50,9 @@ parameter_defaults = {
     "clip_grad": None,  # clip_gradient value
     "track_memory_usage": False,  # default memory tracking
     "memory_save_mode": False,  # default memory saving, if enabled, resize/resample will save files to disk
+    "resized_images_dir": None,  # directory to cache the resized images of memory_save_mode; defaults to "resized_images" in the output directory if None
+    "header_index": False,  # keep a persistent index of image headers and label histograms next to the data CSV to skip repeated header reads, label counts and consistency checks
+    "preprocessing_cache_dir": None,  # directory to cache deterministically preprocessed subjects across runs and folds; disabled if None
     "print_rgb_label_warning": True,  # print rgb label warning
     "data_postprocessing": {},  # default data postprocessing
     "grid_aggregator_overlap": "crop",  # default grid aggregator overlap strategy
@@ -716,7 +736,12 @@ def _parseConfig(
         params = parse_opacus_params(params, initialize_key)
 
     # initialize defaults for inference mechanism
-    inference_mechanism = {"grid_aggregator_overlap": "crop", "patch_overlap": 0}
+    inference_mechanism = {
+        "grid_aggregator_overlap": "crop",
+        "patch_overlap": 0,
+        "batch_size": 1,
+        "num_workers": 0,
+    }
     initialize_inference_mechanism = False
     if not ("inference_mechanism" in params):
         initialize_inference_mechanism = True
@@ -1,6 +1,6 @@
-from typing import Optional, Union
-import os
-from pathlib import Path
+from typing import Optional, Tuple, Union
+import os, concurrent.futures
+from functools import partial
 import numpy as np
 
 import pandas
@@ -13,25 +13,263 @@ from tqdm import tqdm
 from GANDLF.utils import (
     perform_sanity_check_on_subject,
     resize_image,
-    get_filename_extension_sanitized,
+    get_resized_image_file,
     get_correct_padding_size,
+    ImageHeaderIndex,
+    get_header_index,
+    is_zarr_array,
+    get_zarr_header,
 )
 from .preprocessing import get_transforms_for_preprocessing
 from .augmentation import get_augmentation_transforms
+from .subject_cache import PreprocessedSubjectCache, SharedMemorySubjectsDataset
+from . import zarr_images
 
+# these samplers behave like the torchio ones, but only read the patch region of Zarr images
 global_sampler_dict = {
-    "uniform": torchio.data.UniformSampler,
-    "uniformsampler": torchio.data.UniformSampler,
-    "uniformsample": torchio.data.UniformSampler,
-    "label": torchio.data.LabelSampler,
-    "labelsampler": torchio.data.LabelSampler,
-    "labelsample": torchio.data.LabelSampler,
-    "weighted": torchio.data.WeightedSampler,
-    "weightedsampler": torchio.data.WeightedSampler,
-    "weightedsample": torchio.data.WeightedSampler,
+    "uniform": zarr_images.UniformSampler,
+    "uniformsampler": zarr_images.UniformSampler,
+    "uniformsample": zarr_images.UniformSampler,
+    "label": zarr_images.LabelSampler,
+    "labelsampler": zarr_images.LabelSampler,
+    "labelsample": zarr_images.LabelSampler,
+    "weighted": zarr_images.WeightedSampler,
+    "weightedsampler": zarr_images.WeightedSampler,
+    "weightedsample": zarr_images.WeightedSampler,
 }
 
 
+def _get_resized_images_dir(parameters: dict) -> str:
+    """
+    Helper function to get the directory where resized images are cached in memory_save_mode.
+
+    Args:
+        parameters (dict): The parameters dictionary.
+
+    Returns:
+        str: The directory of the resize cache.
+    """
+    # older parameter files might not have this option
+    if parameters.get("resized_images_dir") is not None:
+        return parameters["resized_images_dir"]
+    return os.path.join(parameters["output_dir"], "resized_images")
+
+
+def _is_image_path(path: str) -> bool:
+    """
+    Helper function to check if a path points to an image file or a Zarr array.
+
+    Args:
+        path (str): The path to check.
+
+    Returns:
+        bool: True if the path can be read as an image.
+    """
+    return os.path.isfile(path) or is_zarr_array(path)
+
+
+def _construct_subject(
+    row: dict,
+    parameters: dict,
+    loader_type: str,
+    resize_images_flag: bool,
+    subject_cache: Optional[PreprocessedSubjectCache] = None,
+    preprocessing_transform: Optional[torchio.transforms.Transform] = None,
+    header_index: Optional[ImageHeaderIndex] = None,
+) -> Tuple[Optional[torchio.Subject], Optional[str]]:
+    """
+    Constructs a single subject from a row of the dataframe; this is called in parallel by ImagesFromDataFrame.
+
+    Args:
+        row (dict): The row of the dataframe, indexed by the column number.
+        parameters (dict): The parameters dictionary.
+        loader_type (str): The type of loader.
+        resize_images_flag (bool): Whether the images need to be resized or not.
+        subject_cache (Optional[PreprocessedSubjectCache], optional): The cache of preprocessed subjects. Defaults to None.
+        preprocessing_transform (Optional[torchio.transforms.Transform], optional): The deterministic preprocessing, which is applied to every subject that is not read from the cache. Defaults to None.
+        header_index (Optional[ImageHeaderIndex], optional): The persistent header index used to skip repeated header reads. Defaults to None.
+
+    Returns:
+        Tuple[Optional[torchio.Subject], Optional[str]]: The subject (None if it should be skipped) and the subject ID if it failed the sanity check.
+    """
+    headers = parameters["headers"]
+    preprocessing = parameters["data_preprocessing"]
+    sampler = parameters["patch_sampler"]
+    channelHeaders = headers["channelHeaders"]
+    labelHeader = headers["labelHeader"]
+    predictionHeaders = headers["predictionHeaders"]
+    subjectIDHeader = headers["subjectIDHeader"]
+    subject_with_error = None
+
+    # We need this dict for storing the meta data for each subject
+    # such as different image modalities, labels, any other data
+    subject_dict = {}
+    subject_dict["subject_id"] = str(row[subjectIDHeader])
+    skip_subject = False
+
+    # reuse the preprocessed images from the cache, if available
+    cache_key, cached_images = None, None
+    if subject_cache is not None:
+        files_per_key = {str(channel): str(row[channel]) for channel in channelHeaders}
+        if labelHeader is not None:
+            files_per_key["label"] = str(row[labelHeader])
+        if all(os.path.isfile(file) for file in files_per_key.values()):
+            cache_key = subject_cache.get_key(files_per_key)
+            cached_images = subject_cache.load(cache_key)
+    if cached_images is not None:
+        subject_dict.update(cached_images)
+
+    # iterating through the channels/modalities/timepoints of the subject
+    for channel in channelHeaders:
+        if cached_images is not None:
+            continue
+        # sanity check for malformed csv
+        if not _is_image_path(str(row[channel])):
+            skip_subject = True
+
+        subject_dict[str(channel)] = zarr_images.get_image_class(
+            str(row[channel]), torchio.ScalarImage
+        )(row[channel])
+
+        # store image spacing information if not present
+        if "spacing" not in subject_dict:
+            if is_zarr_array(str(row[channel])):
+                subject_dict["spacing"] = torch.Tensor(
+                    get_zarr_header(str(row[channel]))["spacing"]
+                )
+            elif header_index is not None:
+                subject_dict["spacing"] = torch.Tensor(
+                    header_index.get_header(str(row[channel]))["spacing"]
+                )
+            else:
+                file_reader = sitk.ImageFileReader()
+                file_reader.SetFileName(str(row[channel]))
+                file_reader.ReadImageInformation()
+                subject_dict["spacing"] = torch.Tensor(file_reader.GetSpacing())
+
+        # if resize_image is requested, the perform per-image resize with appropriate interpolator
+        if resize_images_flag:
+            if parameters["memory_save_mode"]:
+                # the subject is read from the resized file on demand
+                subject_dict[str(channel)] = torchio.ScalarImage(
+                    get_resized_image_file(
+                        subject_dict[str(channel)],
+                        preprocessing["resize_image"],
+                        _get_resized_images_dir(parameters),
+                    )
+                )
+                subject_dict["spacing"] = torch.Tensor(
+                    subject_dict[str(channel)].spacing
+                )
+            else:
+                img_resized = resize_image(
+                    subject_dict[str(channel)].as_sitk(), preprocessing["resize_image"]
+                )
+                # always ensure resized image spacing is used
+                subject_dict["spacing"] = torch.Tensor(img_resized.GetSpacing())
+                subject_dict[str(channel)] = torchio.ScalarImage.from_sitk(img_resized)
+
+    # # for regression -- this logic needs to be thought through
+    # if predictionHeaders:
+    #     # get the mask
+    #     if (subject_dict['label'] is None) and (class_list is not None):
+    #         logging.error('The \'class_list\' parameter has been defined but a label file is not present for patient: ', patient)
+
+    if labelHeader is not None:
+        if not _is_image_path(str(row[labelHeader])):
+            skip_subject = True
+
+        if cached_images is None:
+            subject_dict["label"] = zarr_images.get_image_class(
+                str(row[labelHeader]), torchio.LabelMap
+            )(row[labelHeader])
+        subject_dict["path_to_metadata"] = str(row[labelHeader])
+
+        # if resize is requested, the perform per-image resize with appropriate interpolator
+        if resize_images_flag and (cached_images is None):
+            if parameters["memory_save_mode"]:
+                subject_dict["label"] = torchio.LabelMap(
+                    get_resized_image_file(
+                        subject_dict["label"],
+                        preprocessing["resize_image"],
+                        _get_resized_images_dir(parameters),
+                        sitk.sitkNearestNeighbor,
+                    )
+                )
+            else:
+                img_resized = resize_image(
+                    subject_dict["label"].as_sitk(),
+                    preprocessing["resize_image"],
+                    sitk.sitkNearestNeighbor,
+                )
+                subject_dict["label"] = torchio.LabelMap.from_sitk(img_resized)
+
+    else:
+        subject_dict["label"] = "NA"
+        subject_dict["path_to_metadata"] = str(row[channel])
+
+    # iterating through the values to predict of the subject
+    valueCounter = 0
+    for values in predictionHeaders:
+        # assigning the dict key to the channel
+        subject_dict["value_" + str(valueCounter)] = np.array(row[values])
+        valueCounter += 1
+
+    # cached subjects have already been checked, padded and preprocessed
+    if cached_images is not None:
+        return torchio.Subject(subject_dict), subject_with_error
+
+    # skip subject the condition was tripped
+    if skip_subject:
+        return None, subject_with_error
+
+    # Initializing the subject object using the dict
+    subject = torchio.Subject(subject_dict)
+    # https://github.com/fepegar/torchio/discussions/587#discussioncomment-928834
+    # this is causing memory usage to explode, see https://github.com/mlcommons/GaNDLF/issues/128
+    if parameters["verbose"]:
+        print(
+            "Checking consistency of images in subject '" + subject["subject_id"] + "'"
+        )
+    try:
+        perform_sanity_check_on_subject(subject, parameters, header_index)
+    except Exception as exception:
+        subject_with_error = subject["subject_id"]
+        print(
+            "Subject '"
+            + subject["subject_id"]
+            + "' could not be loaded due to the following exception: {}".format(
+                type(exception).__name__
+            )
+            + "; message: {}".format(exception)
+        )
+
+    # # padding image, but only for label sampler, because we don't want to pad for uniform
+    if sampler["enable_padding"]:
+        psize_pad = get_correct_padding_size(
+            parameters["patch_size"], parameters["model"]["dimension"]
+        )
+        padder = Pad(psize_pad, padding_mode=sampler["padding_mode"])
+        subject = padder(subject)
+
+    # apply the deterministic preprocessing once, since the dataset does not apply it
+    if preprocessing_transform is not None:
+        subject = preprocessing_transform(subject)
+    # store the result; subjects that failed the sanity check are never cached
+    if (
+        (subject_cache is not None)
+        and (cache_key is not None)
+        and (subject_with_error is None)
+    ):
+        subject_cache.save(cache_key, subject)
+
+    # load subject into memory: https://github.com/fepegar/torchio/discussions/568#discussioncomment-859027
+    if parameters["in_memory"]:
+        subject.load()
+
+    return subject, subject_with_error
+
+
 # This function takes in a dataframe, with some other parameters and returns the dataloader
 def ImagesFromDataFrame(
     dataframe: pandas.DataFrame,
@@ -56,15 +294,15 @@ def ImagesFromDataFrame(
     loader_type = loader_type if loader_type is not None else ""
     # store in previous variable names
     patch_size = parameters["patch_size"]
-    headers = parameters["headers"]
     q_max_length = parameters["q_max_length"]
     q_samples_per_volume = parameters["q_samples_per_volume"]
     q_num_workers = parameters["q_num_workers"]
     q_verbose = parameters["q_verbose"]
     augmentations = parameters["data_augmentation"]
     preprocessing = parameters["data_preprocessing"]
-    in_memory = parameters["in_memory"]
     sampler = parameters["patch_sampler"]
+    construction_workers = parameters.get("subject_construction_workers", 0)
+    construction_backend = parameters.get("subject_construction_backend", "thread")
 
     # Finding the dimension of the dataframe for computational purposes later
     num_row, num_col = dataframe.shape
@@ -75,11 +313,6 @@ def ImagesFromDataFrame(
     subjects_list = []
     subjects_with_error = []
 
-    channelHeaders = headers["channelHeaders"]
-    labelHeader = headers["labelHeader"]
-    predictionHeaders = headers["predictionHeaders"]
-    subjectIDHeader = headers["subjectIDHeader"]
-
     resize_images_flag = False
     # if resize has been defined but resample is not (or is none)
     if not (preprocessing is None):
@@ -91,177 +324,88 @@ def ImagesFromDataFrame(
                     preprocessing["resize_image"] = preprocessing[key]
                     break
 
-    # helper function to save the resized images
-    def _save_resized_images(
-        resized_image, output_dir, subject_id, channel_str, loader_type, extension
-    ):
-        """
-        Helper function to save the resized images
-
-        Args:
-            resized_image (sitk.Image): The resized image.
-            output_dir (str): The output directory.
-            subject_id (str): The subject ID.
-            channel_str (str): The channel string.
-            loader_type (str): The loader type.
-            extension (str): The extension of the image.
-        """
-        # save img_resized to disk
-        save_dir_for_resized_images = os.path.join(
-            output_dir, loader_type + "_resized_images"
+    transformations_list = []
+    # augmentations are applied to the training set only
+    if train and not (augmentations is None):
+        transformations_list.extend(get_augmentation_transforms(augmentations))
+
+    # deterministic preprocessing can be cached on disk, in which case only the augmentations are applied on the fly
+    subject_cache, preprocessing_transform = None, None
+    if parameters.get("preprocessing_cache_dir") is not None:
+        # Zarr images are never cached, and are only read where they are needed, so they are preprocessed on the fly
+        input_headers = list(parameters["headers"]["channelHeaders"])
+        if parameters["headers"]["labelHeader"] is not None:
+            input_headers.append(parameters["headers"]["labelHeader"])
+        has_zarr_inputs = any(
+            is_zarr_array(str(path))
+            for header in input_headers
+            for path in dataframe[header]
         )
-        Path(save_dir_for_resized_images).mkdir(parents=True, exist_ok=True)
-        save_path = os.path.join(
-            save_dir_for_resized_images,
-            subject_id + "_" + channel_str + "_resized" + extension,
+        # augmentations are applied before the preprocessing (such as normalization), so only the loaded, resized and padded subjects can be cached with augmentations
+        apply_preprocessing = not (transformations_list or has_zarr_inputs)
+        subject_cache = PreprocessedSubjectCache(
+            parameters["preprocessing_cache_dir"],
+            parameters,
+            train,
+            apply_zero_crop,
+            apply_preprocessing,
         )
-        if not os.path.isfile(save_path):
-            sitk.WriteImage(resized_image, save_path)
-
-    # iterating through the dataframe
-    for patient in tqdm(
-        range(num_row), desc="Constructing queue for " + loader_type + " data"
-    ):
-        # We need this dict for storing the meta data for each subject
-        # such as different image modalities, labels, any other data
-        subject_dict = {}
-        subject_dict["subject_id"] = str(dataframe[subjectIDHeader][patient])
-        skip_subject = False
-        # iterating through the channels/modalities/timepoints of the subject
-        for channel in channelHeaders:
-            # sanity check for malformed csv
-            if not os.path.isfile(str(dataframe[channel][patient])):
-                skip_subject = True
-
-            subject_dict[str(channel)] = torchio.ScalarImage(
-                dataframe[channel][patient]
+        if apply_preprocessing:
+            preprocessing_transform = get_transforms_for_preprocessing(
+                parameters, [], train, apply_zero_crop
             )
 
-            # store image spacing information if not present
-            if "spacing" not in subject_dict:
-                file_reader = sitk.ImageFileReader()
-                file_reader.SetFileName(str(dataframe[channel][patient]))
-                file_reader.ReadImageInformation()
-                subject_dict["spacing"] = torch.Tensor(file_reader.GetSpacing())
-
-            # if resize_image is requested, the perform per-image resize with appropriate interpolator
-            if resize_images_flag:
-                img_resized = resize_image(
-                    subject_dict[str(channel)].as_sitk(), preprocessing["resize_image"]
-                )
-                if parameters["memory_save_mode"]:
-                    _save_resized_images(
-                        img_resized,
-                        parameters["output_dir"],
-                        subject_dict["subject_id"],
-                        str(channel),
-                        loader_type,
-                        get_filename_extension_sanitized(
-                            str(dataframe[channel][patient])
-                        ),
-                    )
-                else:
-                    # always ensure resized image spacing is used
-                    subject_dict["spacing"] = torch.Tensor(img_resized.GetSpacing())
-                    subject_dict[str(channel)] = torchio.ScalarImage.from_sitk(
-                        img_resized
-                    )
-
-        # # for regression -- this logic needs to be thought through
-        # if predictionHeaders:
-        #     # get the mask
-        #     if (subject_dict['label'] is None) and (class_list is not None):
-        #         logging.error('The \'class_list\' parameter has been defined but a label file is not present for patient: ', patient)
-
-        if labelHeader is not None:
-            if not os.path.isfile(str(dataframe[labelHeader][patient])):
-                skip_subject = True
-
-            subject_dict["label"] = torchio.LabelMap(dataframe[labelHeader][patient])
-            subject_dict["path_to_metadata"] = str(dataframe[labelHeader][patient])
+    construct_subject = partial(
+        _construct_subject,
+        parameters=parameters,
+        loader_type=loader_type,
+        resize_images_flag=resize_images_flag,
+        subject_cache=subject_cache,
+        preprocessing_transform=preprocessing_transform,
+        header_index=get_header_index(parameters),
+    )
+    rows = [dataframe.iloc[patient].to_dict() for patient in range(num_row)]
+    progress_description = "Constructing queue for " + loader_type + " data"
 
-            # if resize is requested, the perform per-image resize with appropriate interpolator
-            if resize_images_flag:
-                img_resized = resize_image(
-                    subject_dict["label"].as_sitk(),
-                    preprocessing["resize_image"],
-                    sitk.sitkNearestNeighbor,
+    # iterating through the dataframe; the order of the subjects is always preserved
+    if construction_workers > 0:
+        assert construction_backend in [
+            "thread",
+            "process",
+        ], "'subject_construction_backend' should be either 'thread' or 'process'"
+        executor_class = (
+            concurrent.futures.ProcessPoolExecutor
+            if construction_backend == "process"
+            else concurrent.futures.ThreadPoolExecutor
+        )
+        with executor_class(construction_workers) as executor:
+            results = list(
+                tqdm(
+                    executor.map(
+                        construct_subject,
+                        rows,
+                        chunksize=max(1, num_row // (4 * construction_workers)),
+                    ),
+                    total=num_row,
+                    desc=progress_description,
                 )
-                if parameters["memory_save_mode"]:
-                    _save_resized_images(
-                        img_resized,
-                        parameters["output_dir"],
-                        subject_dict["subject_id"],
-                        "label",
-                        loader_type,
-                        get_filename_extension_sanitized(
-                            str(dataframe[channel][patient])
-                        ),
-                    )
-                else:
-                    subject_dict["label"] = torchio.LabelMap.from_sitk(img_resized)
-
-        else:
-            subject_dict["label"] = "NA"
-            subject_dict["path_to_metadata"] = str(dataframe[channel][patient])
-
-        # iterating through the values to predict of the subject
-        valueCounter = 0
-        for values in predictionHeaders:
-            # assigning the dict key to the channel
-            subject_dict["value_" + str(valueCounter)] = np.array(
-                dataframe[values][patient]
             )
-            valueCounter += 1
-
-        # skip subject the condition was tripped
-        if not skip_subject:
-            # Initializing the subject object using the dict
-            subject = torchio.Subject(subject_dict)
-            # https://github.com/fepegar/torchio/discussions/587#discussioncomment-928834
-            # this is causing memory usage to explode, see https://github.com/mlcommons/GaNDLF/issues/128
-            if parameters["verbose"]:
-                print(
-                    "Checking consistency of images in subject '"
-                    + subject["subject_id"]
-                    + "'"
-                )
-            try:
-                perform_sanity_check_on_subject(subject, parameters)
-            except Exception as exception:
-                subjects_with_error.append(subject["subject_id"])
-                print(
-                    "Subject '"
-                    + subject["subject_id"]
-                    + "' could not be loaded due to the following exception: {}".format(
-                        type(exception).__name__
-                    )
-                    + "; message: {}".format(exception)
-                )
-
-            # # padding image, but only for label sampler, because we don't want to pad for uniform
-            if sampler["enable_padding"]:
-                psize_pad = get_correct_padding_size(
-                    patch_size, parameters["model"]["dimension"]
-                )
-                padder = Pad(psize_pad, padding_mode=sampler["padding_mode"])
-                subject = padder(subject)
+    else:
+        results = [
+            construct_subject(row) for row in tqdm(rows, desc=progress_description)
+        ]
 
-            # load subject into memory: https://github.com/fepegar/torchio/discussions/568#discussioncomment-859027
-            if in_memory:
-                subject.load()
-
-            # Appending this subject to the list of subjects
+    for subject, subject_with_error in results:
+        if subject_with_error is not None:
+            subjects_with_error.append(subject_with_error)
+        # Appending this subject to the list of subjects
+        if subject is not None:
             subjects_list.append(subject)
 
     assert (
         subjects_with_error is not None
     ), f"The following subjects could not be loaded, please recheck or remove and retry: {subjects_with_error}"
 
-    transformations_list = []
-    if train and not (augmentations is None):
-        transformations_list.extend(get_augmentation_transforms(augmentations))
-    # augmentations are applied to the training set only
     # if train and not (augmentations is None):
     #     for aug in augmentations:
     #         aug_lower = aug.lower()
@@ -270,11 +414,32 @@ def ImagesFromDataFrame(
     #                 global_augs_dict[aug_lower](augmentations[aug])
     #             )
 
-    transform = get_transforms_for_preprocessing(
-        parameters, transformations_list, train, apply_zero_crop
-    )
+    if preprocessing_transform is not None:
+        # all subjects in the list have already been preprocessed (whether they are cached or not), and there are no augmentations
+        transform = None
+    else:
+        transform = get_transforms_for_preprocessing(
+            parameters, transformations_list, train, apply_zero_crop
+        )
 
-    subjects_dataset = torchio.SubjectsDataset(subjects_list, transform=transform)
+    # Zarr images are only read where the sampler needs them during training
+    load_getitem = not (
+        train
+        and any(
+            isinstance(image, (zarr_images.ZarrScalarImage, zarr_images.ZarrLabelMap))
+            for subject in subjects_list
+            for image in subject.get_images(intensity_only=False)
+        )
+    )
+    if str(parameters["in_memory"]).lower() == "shared":
+        # the loaded subjects are shared by all workers instead of being copied for each access
+        subjects_dataset = SharedMemorySubjectsDataset(
+            subjects_list, transform=transform
+        )
+    else:
+        subjects_dataset = torchio.SubjectsDataset(
+            subjects_list, transform=transform, load_getitem=load_getitem
+        )
     if not train:
         return subjects_dataset
 
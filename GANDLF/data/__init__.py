@@ -1,10 +1,33 @@
 from torch.utils.data import DataLoader
 
 from .ImagesFromDataFrame import ImagesFromDataFrame
+from .subject_cache import InMemorySubjectsDataset
 from GANDLF.utils.write_parse import get_dataframe
 from GANDLF.utils import populate_channel_keys_in_params
 
 
+def get_evaluation_loader_kwargs(params: dict) -> dict:
+    """
+    Get the keyword arguments for the worker configuration of the validation and testing data loaders.
+
+    Args:
+        params (dict): Dictionary of parameters.
+
+    Returns:
+        dict: The keyword arguments for torch.utils.data.DataLoader.
+    """
+    # older parameter files might not have these options
+    num_workers = params.get("eval_num_workers", 0)
+    if num_workers == 0:
+        # prefetching and persistence are only valid for worker processes
+        return {"num_workers": 0}
+    return {
+        "num_workers": num_workers,
+        "prefetch_factor": params.get("eval_prefetch_factor", 2),
+        "persistent_workers": params.get("eval_persistent_workers", True),
+    }
+
+
 def get_train_loader(params):
     """
     Get the training data loader.
@@ -49,10 +72,21 @@ def get_validation_loader(params):
     # Getting the channels for training and removing all the non numeric entries from the channels
     params = populate_channel_keys_in_params(queue_from_dataframe, params)
 
+    # keep the preprocessed validation subjects in memory across epochs, if requested
+    cache_memory_gb = params.get("validation_cache_memory_gb", 0)
+    if cache_memory_gb > 0:
+        # each worker caches the subjects it loads, so the budget is split between them
+        queue_from_dataframe = InMemorySubjectsDataset(
+            queue_from_dataframe,
+            int(cache_memory_gb * 1024**3)
+            // max(1, params.get("eval_num_workers", 0)),
+        )
+
     return DataLoader(
         queue_from_dataframe,
         batch_size=1,
         pin_memory=False,  # params["pin_memory_dataloader"], # this is going OOM if True - needs investigation
+        **get_evaluation_loader_kwargs(params),
     )
 
 
@@ -81,4 +115,5 @@ def get_testing_loader(params):
             queue_from_dataframe,
             batch_size=1,
             pin_memory=False,  # params["pin_memory_dataloader"], # this is going OOM if True - needs investigation
+            **get_evaluation_loader_kwargs(params),
         )
@@ -1,18 +1,26 @@
 import os
-from typing import Optional
+from typing import Optional, Tuple
 import numpy as np
-import openslide
 from GANDLF.data.patch_miner.opm.utils import get_patch_size_in_microns, tissue_mask
+from GANDLF.data.patch_miner.opm.slide_reader import TiledSlideReader, open_slide
+from GANDLF.data.patch_miner.opm.tissue_cache import (
+    TissueMaskCache,
+    get_tissue_mask_cache,
+)
 from skimage.transform import resize
 from torch.utils.data.dataset import Dataset
 
 
-def get_tissue_mask(image: np.ndarray) -> np.ndarray:
+def get_tissue_mask(
+    image: np.ndarray, upsample: Optional[bool] = True, fallback: Optional[bool] = True
+) -> np.ndarray:
     """
     This function is used to generate tissue masks; works for patches as well
 
     Args:
         img_rgb (np.ndarray): Input image.
+        upsample (Optional[bool], optional): Whether the mask is upsampled to the size of the image; otherwise, the mask is returned at the (512, 512) resolution it is computed at. Defaults to True.
+        fallback (Optional[bool], optional): Whether a mask of the entire image is returned if the mask cannot be computed; otherwise, the error is raised. Defaults to True.
 
     Returns:
         np.ndarray: The tissue mask.
@@ -20,15 +28,75 @@ def get_tissue_mask(image: np.ndarray) -> np.ndarray:
     try:
         resized_image = resize(image, (512, 512), anti_aliasing=True)
         mask = tissue_mask(resized_image)
-        # upsample the mask to original size with nearest neighbor interpolation
-        mask = resize(mask, (image.shape[0], image.shape[1]), order=0, mode="constant")
+        if upsample:
+            # upsample the mask to original size with nearest neighbor interpolation
+            mask = resize(
+                mask, (image.shape[0], image.shape[1]), order=0, mode="constant"
+            )
     except Exception as e:
+        if not fallback:
+            raise
         print("Entering fallback in histology inference loader because of: ", e)
         mask = np.ones(image.shape, dtype=np.ubyte)
 
     return mask
 
 
+def get_patch_coordinates_in_mask(
+    mask: Optional[np.ndarray],
+    level_shape: Tuple[int, int],
+    patch_size: Tuple[int, int],
+    stride_size: Tuple[int, int],
+) -> np.ndarray:
+    """
+    This function returns the coordinates of the patches on a regular grid of a slide level that contain any tissue, using a summed-area table of a (low resolution) tissue mask of the level so that all patches are checked at once.
+
+    Args:
+        mask (Optional[np.ndarray]): The tissue mask, which covers the level at any resolution; all patches are returned if None.
+        level_shape (Tuple[int, int]): The number of rows and columns of the level.
+        patch_size (Tuple[int, int]): The size of the patches along the rows and columns.
+        stride_size (Tuple[int, int]): The stride between the patches along the rows and columns.
+
+    Returns:
+        np.ndarray: The (x, y) coordinates of the patches, ordered by rows.
+    """
+    # the last stride is left out so that all patches are completely inside the level
+    row_coords, col_coords = [
+        np.arange(
+            0,
+            level_shape[axis] - (patch_size[axis] + stride_size[axis]),
+            stride_size[axis],
+        )
+        for axis in range(2)
+    ]
+    keep = np.ones((len(row_coords), len(col_coords)), dtype=bool)
+    if mask is not None:
+        if mask.ndim == 3:
+            mask = mask.any(axis=-1)
+        # summed-area table with a leading row and column of zeros
+        summed_area = np.zeros((mask.shape[0] + 1, mask.shape[1] + 1), dtype=np.int64)
+        summed_area[1:, 1:] = (mask > 0).cumsum(axis=0).cumsum(axis=1)
+        region_bounds = []
+        for axis, coords in enumerate([row_coords, col_coords]):
+            # the region of the mask covered by each patch, rounded outwards
+            scale = mask.shape[axis] / level_shape[axis]
+            start = np.floor(coords * scale).astype(np.int64)
+            end = np.ceil((coords + patch_size[axis]) * scale).astype(np.int64)
+            start = np.clip(start, 0, mask.shape[axis] - 1)
+            end = np.clip(np.maximum(end, start + 1), 0, mask.shape[axis])
+            region_bounds.append((start, end))
+        (row_start, row_end), (col_start, col_end) = region_bounds
+        tissue_area = (
+            summed_area[np.ix_(row_end, col_end)]
+            - summed_area[np.ix_(row_start, col_end)]
+            - summed_area[np.ix_(row_end, col_start)]
+            + summed_area[np.ix_(row_start, col_start)]
+        )
+        keep = tissue_area > 0
+    rows, cols = np.nonzero(keep)
+    return np.stack([col_coords[cols], row_coords[rows]], axis=-1)
+
+
 class InferTumorSegDataset(Dataset):
     def __init__(
         self,
@@ -38,82 +106,114 @@ class InferTumorSegDataset(Dataset):
         selected_level,
         mask_level,
         transform: Optional[object] = None,
+        tissue_cache_dir: Optional[str] = None,
+        tile_cache_mb: Optional[float] = 0,
+        slide_reader: Optional[str] = "openslide",
     ):
         self.transform = transform
+        self._tissue_cache_dir = tissue_cache_dir
         self._wsi_path = wsi_path
         self._patch_size = patch_size
-        self._patch_size = get_patch_size_in_microns(wsi_path, self._patch_size)
+        self._patch_size = get_patch_size_in_microns(
+            wsi_path, self._patch_size, slide_reader=slide_reader
+        )
         self._stride_size = stride_size
         if self._stride_size is None:
             self._stride_size = (
                 (np.array(self._patch_size) / 2).astype(np.uint16).tolist()
             )
-        self._stride_size = get_patch_size_in_microns(wsi_path, self._stride_size)
+        self._stride_size = get_patch_size_in_microns(
+            wsi_path, self._stride_size, slide_reader=slide_reader
+        )
         self._selected_level = selected_level
         self._mask_level = mask_level
-        self._os_image = openslide.open_slide(os.path.join(self._wsi_path))
+        # the parameters the tissue mask is computed with, which identify it in the tissue cache
+        self._mask_parameters = {"method": "get_tissue_mask", "level": mask_level}
+        # overlapping patches are sliced from the decoded tiles, if requested
+        self._os_image = TiledSlideReader(
+            open_slide(os.path.join(self._wsi_path), slide_reader), tile_cache_mb
+        )
         self._points = []
         self._basic_preprocessing()
 
-    def _basic_preprocessing(self):
-        mask = None
-        height, width = self._os_image.level_dimensions[self._selected_level]
-        try:
+    def _get_tissue_mask(
+        self, tissue_cache: Optional[TissueMaskCache] = None
+    ) -> Optional[np.ndarray]:
+        """
+        This function returns the tissue mask of the slide, at the low resolution it is computed at.
+
+        Args:
+            tissue_cache (Optional[TissueMaskCache], optional): The cache the mask is read from or written to. Defaults to None.
+
+        Returns:
+            Optional[np.ndarray]: The tissue mask, or None if it could not be computed, in which case nothing is cached.
+        """
+
+        def generate_mask():
             mask_xdim, mask_ydim = self._os_image.level_dimensions[self._mask_level]
-            mask = get_tissue_mask(
+            return get_tissue_mask(
                 # this is needed because openslide returns an RGBA image
                 np.asarray(
                     self._os_image.read_region(
                         (0, 0), self._mask_level, (mask_xdim, mask_ydim)
                     ).convert("RGB")
-                )
+                ),
+                upsample=False,
+                # errors are handled below, so that the cache is not written
+                fallback=False,
+            )
+
+        try:
+            if tissue_cache is None:
+                return generate_mask()
+            return tissue_cache.get_mask(
+                self._wsi_path, self._mask_parameters, generate_mask
             )
-            if self._selected_level != self._mask_level:
-                mask = resize(mask, (height, width))
-            mask = (mask > 0).astype(np.ubyte)
         except Exception as e:
             print("Mask could not be initialized, using entire image:", e)
-        # This is buggy because currently if mask_level is not equal to selected_level,
-        # then this logic straight up does not work
-        # You would have to scale the patch size appropriately for this to work correctly
-        # Remove all the points which are closer to the boundary of the wsi
-        # by accessing the WSI level properties with
-        # self._os_image.level_dimensions[self._selected_level]
-        # Logic as if point + self.patch_size > wsi_dimensions
-        # The move the point by the wsi_dimensions - (patch_size + self.points)
-        # This is because the patch is not going to be extracted if it is
-        # outside the wsi
-        for i in range(
-            0,
-            width - (self._patch_size[0] + self._stride_size[0]),
-            self._stride_size[0],
-        ):
-            for j in range(
-                0,
-                height - (self._patch_size[1] + self._stride_size[1]),
-                self._stride_size[1],
-            ):
-                # If point goes beyond the wsi in y_dim, then move so that we can extract the patch
-                coord_width, coord_height = i, j
-                if i + self._patch_size[0] > width:
-                    coord_width = width - self._patch_size[0]
-                # If point goes beyond the wsi in x_dim, then move so that we can extract the patch
-                if j + self._patch_size[1] > height:
-                    coord_height = height - self._patch_size[1]
-                # If there is anything in the mask patch, only then consider it
-                if mask is not None:
-                    if np.any(
-                        mask[
-                            coord_width : coord_width + self._patch_size[0],
-                            coord_height : coord_height + self._patch_size[1],
-                        ]
-                    ):
-                        self._points.append([coord_width, coord_height])
-                else:
-                    self._points.append([coord_width, coord_height])
-
-        self._points = np.array(self._points)
-        self._points[:, [0, 1]] = self._points[:, [1, 0]]
+            return None
+
+    def _get_patch_coordinates(self, mask: Optional[np.ndarray]) -> np.ndarray:
+        """
+        This function returns the coordinates of the patches of the selected level that contain tissue.
+
+        Args:
+            mask (Optional[np.ndarray]): The tissue mask of the slide; all patches are returned if None.
+
+        Returns:
+            np.ndarray: The (x, y) coordinates of the patches.
+        """
+        width, height = self._os_image.level_dimensions[self._selected_level]
+        # the mask covers the whole slide, so it is mapped to the selected level regardless of the mask level
+        return get_patch_coordinates_in_mask(
+            mask, (height, width), self._patch_size, self._stride_size
+        )
+
+    def _basic_preprocessing(self):
+        tissue_cache = get_tissue_mask_cache(self._tissue_cache_dir)
+        if tissue_cache is None:
+            self._points = self._get_patch_coordinates(self._get_tissue_mask())
+            return
+
+        def generate_coordinates():
+            mask = self._get_tissue_mask(tissue_cache)
+            # the patches of the entire image are not cached, so that the mask is computed again by the next run
+            if mask is None:
+                return None
+            return self._get_patch_coordinates(mask)
+
+        # the coordinates are cached as well, so that the slide does not need to be read again
+        coordinate_parameters = {
+            "mask": self._mask_parameters,
+            "level": self._selected_level,
+            "patch_size": list(self._patch_size),
+            "stride_size": list(self._stride_size),
+        }
+        self._points = tissue_cache.get_coordinates(
+            self._wsi_path, coordinate_parameters, generate_coordinates
+        )
+        if self._points is None:
+            self._points = self._get_patch_coordinates(None)
 
     def get_patch_size(self):
         return self._patch_size
@@ -132,14 +232,11 @@ class InferTumorSegDataset(Dataset):
             (string, int, int): The patch, x and y locations.
         """
         x_loc, y_loc = self._points[idx]
-        patch = self._os_image.read_region(
+        patch = self._os_image.read_rgb_region(
             (x_loc, y_loc),
             self._selected_level,
             (self._patch_size[0], self._patch_size[1]),
-            # as_array=True, openslide-python returns an RGBA PIL image
-        ).convert("RGB")
-
-        patch = np.asarray(patch)  # convert the image to ndarray
+        )
         # this is to ensure that channels come at the beginning
         patch = patch.transpose([2, 0, 1])
         # this is to ensure that we always have a z-stack before applying any torchio transforms
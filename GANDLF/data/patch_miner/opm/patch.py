@@ -1,18 +1,17 @@
 from pathlib import Path
 from .utils import pass_method, map_values
-import numpy as np
+from .slide_reader import TiledSlideReader
 from skimage.io import imsave
 import os
 
 # from pathlib import Path
-from zarr.core import Array
 
 
 class Patch:
     def __init__(
         self,
         slide_path: str,
-        slide_object: Array,
+        slide_object: TiledSlideReader,
         manager,
         coordinates,
         level: int,
@@ -22,7 +21,7 @@ class Patch:
         """
         Init for Patch.
         @param slide_path: Path to slide. Used primarily for generating patch filenames.
-        @param slide_object: OpenSlide object. Read patch images from this object.
+        @param slide_object: TiledSlideReader object. Read patch images from this object.
         @param manager: PatchManager object. Inheriting this allows this patch to be checked for validity.
         @param coordinates: Ndarray of [x, y] coordinates on slide for the top-left corner of the patch.
         @param level: Level of slide you want to call the patch from.
@@ -41,14 +40,10 @@ class Patch:
     def read_patch(self):
         """
         Read patch from self.slide_object given this patch's coordinates, level, and size.
-        @return: PIL object of RGBA patch image.
+        @return: Ndarray of RGB patch image.
         """
-        return np.asarray(
-            self.slide_object.read_region(
-                (self.coordinates[1], self.coordinates[0]), self.level, self.size
-            ).convert(
-                "RGB"
-            )  # openslide-python returns an RGBA PIL image
+        return self.slide_object.read_rgb_region(
+            (self.coordinates[1], self.coordinates[0]), self.level, self.size
         )
 
     def copy(self):
@@ -2,21 +2,25 @@ import concurrent.futures
 import os
 from functools import partial
 from .patch import Patch
+from .slide_reader import TiledSlideReader, open_slide
 from .utils import get_patch_class_proportions, convert_to_tiff
 import numpy as np
 from tqdm import tqdm
 from pathlib import Path
 import pandas as pd
-import openslide
 
 
 class PatchManager:
-    def __init__(self, filename, output_dir):
+    def __init__(self, filename, output_dir, tile_cache_mb=0, slide_reader="openslide"):
         """
         Initialization for PatchManager
         @param filename: name of main WSI.
+        @param tile_cache_mb: memory budget (in MB) of the decoded tiles kept for overlapping patches of each slide; disabled if 0.
+        @param slide_reader: reader backend of the slides, either "openslide", "tiffslide" or "tifffile".
         """
         self.output_dir = output_dir
+        self.tile_cache_mb = tile_cache_mb
+        self.slide_reader = slide_reader
         self.set_slide_path(filename)
         self.patches = list()
         self.slide_folder = Path(filename).stem
@@ -41,7 +45,9 @@ class PatchManager:
     def set_slide_path(self, filename):
         self.img_path = filename
         self.img_path = convert_to_tiff(self.img_path, self.output_dir, "img")
-        self.slide_object = openslide.open_slide(self.img_path)
+        self.slide_object = TiledSlideReader(
+            open_slide(self.img_path, self.slide_reader), self.tile_cache_mb
+        )
         self.slide_dims = self.slide_object.dimensions
 
     def set_label_map(self, path):
@@ -50,7 +56,9 @@ class PatchManager:
         @param path: path to label map.
         """
         self.label_map = convert_to_tiff(path, self.output_dir, "mask")
-        self.label_map_object = openslide.open_slide(self.label_map)
+        self.label_map_object = TiledSlideReader(
+            open_slide(self.label_map, self.slide_reader), self.tile_cache_mb
+        )
 
         assert all(
             x == y for x, y in zip(self.label_map_object.dimensions, self.slide_dims)
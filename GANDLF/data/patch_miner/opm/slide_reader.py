@@ -0,0 +1,382 @@
+from typing import Any, Optional, Tuple, Union
+from collections import OrderedDict
+import os
+import threading
+
+import numpy as np
+import openslide
+import tifffile
+from PIL import Image
+
+# the prefixes of the standard properties (such as "mpp-x") of each reader backend
+slide_property_prefixes = ("openslide", "tiffslide", "tifffile")
+
+
+def get_slide_property(slide: Any, name: str, default: Optional[Any] = None) -> Any:
+    """
+    This function returns a standard property of a slide, which is named differently by each reader backend.
+
+    Args:
+        slide (Any): The slide, opened by any reader backend.
+        name (str): The name of the property without the prefix of the backend, such as "mpp-x" or "level[0].tile-width".
+        default (Optional[Any], optional): The value returned if the slide does not define the property. Defaults to None.
+
+    Returns:
+        Any: The value of the property.
+    """
+    for prefix in slide_property_prefixes:
+        key = prefix + "." + name
+        if key in slide.properties:
+            return slide.properties[key]
+    return default
+
+
+class TiffFileSlide:
+    """
+    Reader of pyramidal or plain TIFF slides built on tifffile, with the interface of openslide.OpenSlide that is used by the histology workflows.
+
+    The tiles (or strips) are read at their offsets without moving the position of the file, so that regions can be read concurrently by several threads and by forked processes, such as the workers of a DataLoader, which share the file.
+    """
+
+    def __init__(self, slide_path: str):
+        """
+        Args:
+            slide_path (str): The path to the TIFF slide.
+        """
+        self._tiff = tifffile.TiffFile(slide_path)
+        # each level of the pyramid is a single page; plain TIFF files have a single level
+        self._pages = [level.keyframe for level in self._tiff.series[0].levels]
+        for page in self._pages:
+            if page.samplesperpixel > 1 and page.planarconfig != 1:
+                raise ValueError(
+                    "Slides with separate color planes are not supported by the tifffile reader: "
+                    + slide_path
+                )
+        self._lock = threading.Lock()
+
+        self.level_count = len(self._pages)
+        self.level_dimensions = tuple(
+            (page.imagewidth, page.imagelength) for page in self._pages
+        )
+        self.dimensions = self.level_dimensions[0]
+        # same definition as openslide
+        self.level_downsamples = tuple(
+            (self.dimensions[0] / width + self.dimensions[1] / height) / 2
+            for width, height in self.level_dimensions
+        )
+
+        self.properties = {"tifffile.level-count": str(self.level_count)}
+        for level, page in enumerate(self._pages):
+            level_key = "tifffile.level[" + str(level) + "]."
+            self.properties[level_key + "width"] = str(page.imagewidth)
+            self.properties[level_key + "height"] = str(page.imagelength)
+            self.properties[level_key + "downsample"] = str(
+                self.level_downsamples[level]
+            )
+            if page.is_tiled:
+                self.properties[level_key + "tile-width"] = str(page.tilewidth)
+                self.properties[level_key + "tile-height"] = str(page.tilelength)
+        # the resolution in microns per pixel, if the unit is defined
+        microns_per_unit = {2: 25400, 3: 10000}.get(int(self._pages[0].resolutionunit))
+        if microns_per_unit is not None:
+            for axis, tag in (("x", "XResolution"), ("y", "YResolution")):
+                resolution = self._pages[0].tags.get(tag)
+                if resolution is not None and resolution.value[0] > 0:
+                    numerator, denominator = resolution.value
+                    self.properties["tifffile.mpp-" + axis] = str(
+                        microns_per_unit * denominator / numerator
+                    )
+
+    def _get_segment_shape(self, level: int) -> Tuple[int, int]:
+        page = self._pages[level]
+        if page.is_tiled:
+            return page.tilelength, page.tilewidth
+        return min(page.rowsperstrip or page.imagelength, page.imagelength), (
+            page.imagewidth
+        )
+
+    def _decode_segment(self, level: int, index: int) -> Optional[np.ndarray]:
+        """
+        This function decodes a tile (or strip) of a level.
+
+        Args:
+            level (int): The level of the slide.
+            index (int): The index of the segment in the page.
+
+        Returns:
+            Optional[np.ndarray]: The (height, width, samples) segment, or None if it is not stored in the file.
+        """
+        page = self._pages[level]
+        if page.databytecounts[index] == 0:
+            return None
+        filehandle = self._tiff.filehandle
+        if hasattr(os, "pread"):
+            data = os.pread(
+                filehandle.fileno(), page.databytecounts[index], page.dataoffsets[index]
+            )
+        else:
+            # processes are spawned where pread is not available, so only the threads share the position of the file
+            with self._lock:
+                filehandle.seek(page.dataoffsets[index])
+                data = filehandle.read(page.databytecounts[index])
+        segment, _, _ = page.decode(data, index, jpegtables=page.jpegtables)
+        return segment.reshape(segment.shape[-3:])
+
+    def read_region(
+        self, location: Tuple[int, int], level: int, size: Tuple[int, int]
+    ) -> Image.Image:
+        """
+        This function reads a region of the slide, with the same arguments as openslide.OpenSlide.read_region.
+
+        Args:
+            location (Tuple[int, int]): The (x, y) location of the top left pixel in the level 0 reference frame.
+            level (int): The level of the slide.
+            size (Tuple[int, int]): The (width, height) of the region in the level.
+
+        Returns:
+            Image.Image: The RGBA region, which is transparent outside of the slide.
+        """
+        downsample = self.level_downsamples[level]
+        start_x = int(location[0] / downsample)
+        start_y = int(location[1] / downsample)
+        region = np.zeros((int(size[1]), int(size[0]), 4), dtype=np.uint8)
+        # the part of the region inside the level
+        level_width, level_height = self.level_dimensions[level]
+        x0, y0 = max(start_x, 0), max(start_y, 0)
+        x1 = min(start_x + int(size[0]), level_width)
+        y1 = min(start_y + int(size[1]), level_height)
+        if x0 >= x1 or y0 >= y1:
+            return Image.fromarray(region, "RGBA")
+
+        segment_height, segment_width = self._get_segment_shape(level)
+        segments_per_row = -(-level_width // segment_width)
+        for segment_y in range(y0 // segment_height, (y1 - 1) // segment_height + 1):
+            for segment_x in range(x0 // segment_width, (x1 - 1) // segment_width + 1):
+                segment = self._decode_segment(
+                    level, segment_y * segments_per_row + segment_x
+                )
+                if segment is None:
+                    continue
+                segment_start_y = segment_y * segment_height
+                segment_start_x = segment_x * segment_width
+                overlap_y = slice(
+                    max(y0, segment_start_y),
+                    min(y1, segment_start_y + segment.shape[0]),
+                )
+                overlap_x = slice(
+                    max(x0, segment_start_x),
+                    min(x1, segment_start_x + segment.shape[1]),
+                )
+                segment = segment[
+                    overlap_y.start
+                    - segment_start_y : overlap_y.stop
+                    - segment_start_y,
+                    overlap_x.start
+                    - segment_start_x : overlap_x.stop
+                    - segment_start_x,
+                ]
+                # grayscale slides are replicated to all color channels
+                if segment.shape[-1] < 3:
+                    segment = np.repeat(segment[..., :1], 3, axis=-1)
+                region[
+                    overlap_y.start - start_y : overlap_y.stop - start_y,
+                    overlap_x.start - start_x : overlap_x.stop - start_x,
+                ] = np.concatenate(
+                    [
+                        segment[..., :3],
+                        np.full(segment.shape[:2] + (1,), 255, dtype=np.uint8),
+                    ],
+                    axis=-1,
+                )
+        return Image.fromarray(region, "RGBA")
+
+    def get_best_level_for_downsample(self, downsample: float) -> int:
+        """
+        This function returns the highest level with a downsample that is not larger than the requested one, like openslide.OpenSlide.get_best_level_for_downsample.
+        """
+        for level in range(1, self.level_count):
+            if downsample < self.level_downsamples[level]:
+                return level - 1
+        return self.level_count - 1
+
+    def get_thumbnail(self, size: Tuple[int, int]) -> Image.Image:
+        """
+        This function returns an RGB thumbnail of the slide that fits in the given size, like openslide.OpenSlide.get_thumbnail.
+        """
+        downsample = max(
+            dimension / thumbnail_dimension
+            for dimension, thumbnail_dimension in zip(self.dimensions, size)
+        )
+        level = self.get_best_level_for_downsample(downsample)
+        tile = self.read_region((0, 0), level, self.level_dimensions[level])
+        # transparent pixels are blended with a white background
+        thumbnail = Image.new("RGB", tile.size, "#ffffff")
+        thumbnail.paste(tile, None, tile)
+        thumbnail.thumbnail(size, Image.LANCZOS)
+        return thumbnail
+
+    def close(self) -> None:
+        self._tiff.close()
+
+
+def _open_tiffslide(slide_path: str) -> Any:
+    try:
+        import tiffslide
+    except ImportError:
+        raise ImportError("tiffslide is required to read slides with tiffslide")
+    return tiffslide.open_slide(slide_path)
+
+
+global_slide_readers_dict = {
+    "openslide": openslide.open_slide,
+    "tiffslide": _open_tiffslide,
+    "tifffile": TiffFileSlide,
+}
+
+
+def open_slide(slide_path: str, slide_reader: Optional[str] = "openslide") -> Any:
+    """
+    This function opens a slide with a reader backend. All backends have the interface of openslide.OpenSlide that is used by the histology workflows (dimensions, level_count, level_dimensions, level_downsamples, properties, read_region, get_best_level_for_downsample, get_thumbnail and close).
+
+    Args:
+        slide_path (str): The path to the slide.
+        slide_reader (Optional[str], optional): The reader backend, either "openslide", "tiffslide" (which requires tiffslide) or "tifffile" (for pyramidal and plain TIFF slides). Defaults to "openslide".
+
+    Returns:
+        Any: The opened slide.
+    """
+    slide_reader = (slide_reader or "openslide").lower()
+    assert (
+        slide_reader in global_slide_readers_dict
+    ), f"Slide reader {slide_reader} not found"
+    return global_slide_readers_dict[slide_reader](slide_path)
+
+
+class TiledSlideReader:
+    """
+    Reader of RGB regions of a slide, which decodes tile-aligned regions once and keeps them in a bounded LRU cache, so that overlapping patches are sliced from the decoded tiles instead of being decoded again.
+
+    Regions of levels with a non-integer downsample, or at locations that are not on the pixel grid of the level, are read directly. All other attributes are those of the slide, and the cache is shared by the threads of a process.
+    """
+
+    def __init__(
+        self,
+        slide: Union[openslide.OpenSlide, TiffFileSlide],
+        cache_mb: Optional[float] = 0,
+        tile_size: Optional[int] = None,
+    ):
+        """
+        Args:
+            slide (Union[openslide.OpenSlide, TiffFileSlide]): The slide to read from, opened by any reader backend.
+            cache_mb (Optional[float], optional): The memory budget (in MB) of the decoded tiles; regions are read directly if 0. Defaults to 0.
+            tile_size (Optional[int], optional): The size of the cached tiles; defaults to the tile size of the slide, or 512 if the slide does not define it.
+        """
+        self.slide = slide
+        if tile_size is None:
+            tile_size = int(get_slide_property(slide, "level[0].tile-width", 512))
+        self.tile_size = tile_size
+        self._max_tiles = int(cache_mb * 1024**2) // (tile_size * tile_size * 3)
+        if cache_mb > 0:
+            self._max_tiles = max(self._max_tiles, 1)
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        # only called for attributes that are not defined by the reader
+        if name == "slide":
+            raise AttributeError(name)
+        return getattr(self.slide, name)
+
+    def _read_region_directly(
+        self, location: Tuple[int, int], level: int, size: Tuple[int, int]
+    ) -> np.ndarray:
+        # openslide-python returns an RGBA PIL image
+        return np.asarray(self.slide.read_region(location, level, size).convert("RGB"))
+
+    def _get_tile(self, level: int, tile_x: int, tile_y: int) -> np.ndarray:
+        """
+        This function returns a decoded tile of a level, from the cache if it is present.
+
+        Args:
+            level (int): The level of the slide.
+            tile_x (int): The column of the tile in the tile grid of the level.
+            tile_y (int): The row of the tile in the tile grid of the level.
+
+        Returns:
+            np.ndarray: The (tile_size, tile_size, 3) RGB tile.
+        """
+        key = (level, tile_x, tile_y)
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+                return tile
+
+        # decode outside the lock so that threads reading different tiles do not wait for each other
+        downsample = int(self.slide.level_downsamples[level])
+        tile = self._read_region_directly(
+            (
+                tile_x * self.tile_size * downsample,
+                tile_y * self.tile_size * downsample,
+            ),
+            level,
+            (self.tile_size, self.tile_size),
+        )
+        with self._lock:
+            self._tiles[key] = tile
+            while len(self._tiles) > self._max_tiles:
+                self._tiles.popitem(last=False)
+        return tile
+
+    def read_rgb_region(
+        self, location: Tuple[int, int], level: int, size: Tuple[int, int]
+    ) -> np.ndarray:
+        """
+        This function reads an RGB region of the slide, with the same arguments and pixels as openslide.OpenSlide.read_region.
+
+        Args:
+            location (Tuple[int, int]): The (x, y) location of the top left pixel in the level 0 reference frame.
+            level (int): The level of the slide.
+            size (Tuple[int, int]): The (width, height) of the region in the level.
+
+        Returns:
+            np.ndarray: The (height, width, 3) RGB region.
+        """
+        downsample = self.slide.level_downsamples[level]
+        location = (int(location[0]), int(location[1]))
+        if (
+            self._max_tiles == 0
+            or downsample != int(downsample)
+            or location[0] % int(downsample) != 0
+            or location[1] % int(downsample) != 0
+        ):
+            return self._read_region_directly(location, level, size)
+
+        # the region in the pixel grid of the level
+        start_x = location[0] // int(downsample)
+        start_y = location[1] // int(downsample)
+        end_x, end_y = start_x + int(size[0]), start_y + int(size[1])
+        region = np.empty((int(size[1]), int(size[0]), 3), dtype=np.uint8)
+        for tile_y in range(
+            start_y // self.tile_size, (end_y - 1) // self.tile_size + 1
+        ):
+            tile_start_y = tile_y * self.tile_size
+            overlap_y = slice(
+                max(start_y, tile_start_y), min(end_y, tile_start_y + self.tile_size)
+            )
+            for tile_x in range(
+                start_x // self.tile_size, (end_x - 1) // self.tile_size + 1
+            ):
+                tile_start_x = tile_x * self.tile_size
+                overlap_x = slice(
+                    max(start_x, tile_start_x),
+                    min(end_x, tile_start_x + self.tile_size),
+                )
+                region[
+                    overlap_y.start - start_y : overlap_y.stop - start_y,
+                    overlap_x.start - start_x : overlap_x.stop - start_x,
+                ] = self._get_tile(level, tile_x, tile_y)[
+                    overlap_y.start - tile_start_y : overlap_y.stop - tile_start_y,
+                    overlap_x.start - tile_start_x : overlap_x.stop - tile_start_x,
+                ]
+        return region
@@ -0,0 +1,162 @@
+from typing import Callable, Optional
+import os, json, hashlib, tempfile
+
+import numpy as np
+
+
+def get_slide_hash(slide_path: str, chunk_size: Optional[int] = 2**20) -> str:
+    """
+    This function computes a hash that identifies the contents of a slide, from its size and its first and last bytes, so that multi-gigabyte slides do not need to be read completely.
+
+    Args:
+        slide_path (str): The path to the slide.
+        chunk_size (Optional[int], optional): The number of bytes read at the start and at the end of the file. Defaults to 1 MiB.
+
+    Returns:
+        str: The hex digest identifying the slide.
+    """
+    file_size = os.path.getsize(slide_path)
+    hasher = hashlib.sha256(str(file_size).encode("utf-8"))
+    with open(slide_path, "rb") as f:
+        hasher.update(f.read(chunk_size))
+        # the header and the tile offsets of slide formats are at the start or at the end of the file
+        f.seek(max(file_size - chunk_size, 0))
+        hasher.update(f.read(chunk_size))
+    return hasher.hexdigest()
+
+
+def get_tissue_mask_cache(cache_dir: Optional[str]) -> Optional["TissueMaskCache"]:
+    """
+    This function returns the tissue mask cache in a directory.
+
+    Args:
+        cache_dir (Optional[str]): The directory of the cache.
+
+    Returns:
+        Optional[TissueMaskCache]: The cache, or None if the directory is not defined.
+    """
+    if cache_dir is None:
+        return None
+    return TissueMaskCache(cache_dir)
+
+
+class TissueMaskCache:
+    """
+    On-disk cache of the tissue masks of slides and of the patch coordinates derived from them, which is shared by the patch miner and histology inference.
+
+    Entries are stored in a directory per slide (named after the hash of the slide contents), and are named after the hash of the parameters they were computed with. Masks are stored bit-packed and coordinates as compressed arrays.
+    """
+
+    def __init__(self, cache_dir: str):
+        """
+        Args:
+            cache_dir (str): The directory where the cache entries are stored.
+        """
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # the slides are only hashed once per instance
+        self._slide_hashes = {}
+
+    def _get_entry_file(
+        self, slide_path: str, entry_type: str, parameters: dict
+    ) -> str:
+        """
+        This function returns the file of a cache entry.
+
+        Args:
+            slide_path (str): The path to the slide.
+            entry_type (str): The type of the entry, either "mask" or "coordinates".
+            parameters (dict): The parameters the entry is computed with.
+
+        Returns:
+            str: The path to the entry file.
+        """
+        if slide_path not in self._slide_hashes:
+            self._slide_hashes[slide_path] = get_slide_hash(slide_path)
+        canonical_parameters = json.dumps(parameters, sort_keys=True, default=str)
+        parameters_hash = hashlib.sha256(canonical_parameters.encode("utf-8"))
+        return os.path.join(
+            self.cache_dir,
+            self._slide_hashes[slide_path],
+            entry_type + "_" + parameters_hash.hexdigest() + ".npz",
+        )
+
+    def _save(self, entry_file: str, **arrays: np.ndarray) -> None:
+        """
+        This function writes the arrays of a cache entry.
+
+        Args:
+            entry_file (str): The path to the entry file.
+            **arrays (np.ndarray): The arrays of the entry.
+        """
+        entry_dir = os.path.dirname(entry_file)
+        os.makedirs(entry_dir, exist_ok=True)
+        # write to a temporary file first so that concurrent runs never see partial entries
+        file_descriptor, temp_file = tempfile.mkstemp(
+            dir=entry_dir, prefix=".tmp_", suffix=".npz"
+        )
+        with os.fdopen(file_descriptor, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(temp_file, entry_file)
+
+    def get_mask(
+        self,
+        slide_path: str,
+        mask_parameters: dict,
+        generate_mask: Callable[[], np.ndarray],
+    ) -> np.ndarray:
+        """
+        This function returns the tissue mask of a slide, which is generated and stored if it is not in the cache.
+
+        Args:
+            slide_path (str): The path to the slide.
+            mask_parameters (dict): The parameters the mask is generated with, such as the method and the level or scale.
+            generate_mask (Callable[[], np.ndarray]): The function generating the mask.
+
+        Returns:
+            np.ndarray: The boolean tissue mask, which can be modified without affecting the cache.
+        """
+        entry_file = self._get_entry_file(slide_path, "mask", mask_parameters)
+        if os.path.isfile(entry_file):
+            with np.load(entry_file) as entry:
+                shape = tuple(entry["shape"])
+                return (
+                    np.unpackbits(entry["mask"], count=int(np.prod(shape)))
+                    .reshape(shape)
+                    .astype(bool)
+                )
+
+        mask = np.asarray(generate_mask()) > 0
+        self._save(
+            entry_file, mask=np.packbits(mask, axis=None), shape=np.array(mask.shape)
+        )
+        return mask
+
+    def get_coordinates(
+        self,
+        slide_path: str,
+        coordinate_parameters: dict,
+        generate_coordinates: Callable[[], Optional[np.ndarray]],
+    ) -> Optional[np.ndarray]:
+        """
+        This function returns the patch coordinates of a slide, which are generated and stored if they are not in the cache.
+
+        Args:
+            slide_path (str): The path to the slide.
+            coordinate_parameters (dict): The parameters the coordinates are generated with, such as the mask parameters, the level, and the patch and stride sizes.
+            generate_coordinates (Callable[[], Optional[np.ndarray]]): The function generating the coordinates; the coordinates are not stored if it returns None.
+
+        Returns:
+            Optional[np.ndarray]: The coordinates.
+        """
+        entry_file = self._get_entry_file(
+            slide_path, "coordinates", coordinate_parameters
+        )
+        if os.path.isfile(entry_file):
+            with np.load(entry_file) as entry:
+                return entry["coordinates"]
+
+        coordinates = generate_coordinates()
+        if coordinates is not None:
+            self._save(entry_file, coordinates=coordinates)
+        return coordinates
@@ -17,7 +17,9 @@ import cv2
 
 # import matplotlib.pyplot as plt
 import yaml
-import openslide
+
+from .slide_reader import open_slide, slide_property_prefixes
+from .tissue_cache import get_tissue_mask_cache
 
 # RGB Masking (pen) constants
 RGB_RED_CHANNEL = 0
@@ -416,32 +418,48 @@ def is_mask_too_big(mask: np.ndarray) -> bool:
         return False
 
 
-def generate_initial_mask(slide_path: str, scale: int) -> Tuple[np.ndarray, tuple]:
+def generate_initial_mask(
+    slide_path: str,
+    scale: int,
+    tissue_cache_dir: Optional[str] = None,
+    slide_reader: Optional[str] = "openslide",
+) -> Tuple[np.ndarray, tuple]:
     """
     Function that generates the initial mask for the slide.
 
     Args:
         slide_path (str): The path to the slide.
         scale (int): The scale to use for the mask.
+        tissue_cache_dir (Optional[str], optional): The directory of the tissue mask cache shared with histology inference; the mask is always computed if None. Defaults to None.
+        slide_reader (Optional[str], optional): The reader backend of the slide. Defaults to "openslide".
 
     Returns:
         Tuple[np.ndarray, tuple]: The valid mask and the real scale.
     """
     # Open slide and get properties
-    slide = openslide.open_slide(slide_path)
+    slide = open_slide(slide_path, slide_reader)
     slide_dims = slide.dimensions
 
-    # Call thumbnail for efficiency, calculate scale relative to whole slide
-    slide_thumbnail = np.asarray(
-        slide.get_thumbnail((slide_dims[0] // scale, slide_dims[1] // scale))
-    )
+    def generate_mask():
+        # Call thumbnail for efficiency, calculate scale relative to whole slide
+        slide_thumbnail = np.asarray(
+            slide.get_thumbnail((slide_dims[0] // scale, slide_dims[1] // scale))
+        )
+        return tissue_mask(slide_thumbnail)
+
+    tissue_cache = get_tissue_mask_cache(tissue_cache_dir)
+    if tissue_cache is None:
+        valid_mask = generate_mask()
+    else:
+        valid_mask = tissue_cache.get_mask(
+            slide_path, {"method": "tissue_mask", "scale": scale}, generate_mask
+        )
+    # the mask has the size of the thumbnail
     real_scale = (
-        slide_dims[0] / slide_thumbnail.shape[1],
-        slide_dims[1] / slide_thumbnail.shape[0],
+        slide_dims[0] / valid_mask.shape[1],
+        slide_dims[1] / valid_mask.shape[0],
     )
 
-    valid_mask = tissue_mask(slide_thumbnail)
-
     if is_mask_too_big(valid_mask):
         print(
             "Calculated tissue mask is too big; considering increasing the scale for faster processing."
@@ -451,7 +469,10 @@ def generate_initial_mask(slide_path: str, scale: int) -> Tuple[np.ndarray, tupl
 
 
 def get_patch_size_in_microns(
-    input_slide_path: str, patch_size_from_config: str, verbose: Optional[bool] = False
+    input_slide_path: str,
+    patch_size_from_config: str,
+    verbose: Optional[bool] = False,
+    slide_reader: Optional[str] = "openslide",
 ) -> List[int]:
     """
     Function that returns the patch size in pixels.
@@ -460,6 +481,7 @@ def get_patch_size_in_microns(
         input_slide_path (str): The path to the slide.
         patch_size_from_config (str): The patch size from the config file.
         verbose (Optional[bool], optional): Whether to print verbose output. Defaults to False.
+        slide_reader (Optional[str], optional): The reader backend of the slide. Defaults to "openslide".
 
     Returns:
         List[int]: The patch size after getting converted to pixels.
@@ -505,24 +527,20 @@ def get_patch_size_in_microns(
                         "Using mpp to calculate patch size for dimension {}".format(i)
                     )
                 # only enter if "m" is present in patch size
-                input_slide = openslide.open_slide(input_slide_path)
+                input_slide = open_slide(input_slide_path, slide_reader)
                 metadata = input_slide.properties
                 if i == 0:
                     for _property in [
-                        openslide.PROPERTY_NAME_MPP_X,
-                        "tiff.XResolution",
-                        "XResolution",
-                    ]:
+                        prefix + ".mpp-x" for prefix in slide_property_prefixes
+                    ] + ["tiff.XResolution", "XResolution"]:
                         if _property in metadata:
                             magnification = float(metadata[_property])
                             magnification_prev = magnification
                             break
                 elif i == 1:
                     for _property in [
-                        openslide.PROPERTY_NAME_MPP_Y,
-                        "tiff.YResolution",
-                        "YResolution",
-                    ]:
+                        prefix + ".mpp-y" for prefix in slide_property_prefixes
+                    ] + ["tiff.YResolution", "YResolution"]:
                         if _property in metadata:
                             magnification = float(metadata[_property])
                             break
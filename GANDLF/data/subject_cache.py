@@ -0,0 +1,237 @@
+from typing import Optional, Union
+import os, copy, json, hashlib, shutil, tempfile
+from collections import OrderedDict
+from importlib.metadata import version
+
+import numpy as np
+import torch
+import torchio
+
+from GANDLF.data.patch_miner.opm.tissue_cache import get_slide_hash
+
+
+def get_preprocessing_config_hash(
+    parameters: dict,
+    train: bool,
+    apply_zero_crop: bool,
+    apply_preprocessing: Optional[bool] = True,
+) -> str:
+    """
+    This function computes a canonical hash of all configuration options that affect the deterministic preprocessing of a subject.
+
+    Args:
+        parameters (dict): The parameters dictionary.
+        train (bool): If the dataloader is for training or not.
+        apply_zero_crop (bool): Whether to apply zero crop or not.
+        apply_preprocessing (Optional[bool], optional): Whether the `data_preprocessing` transforms are applied before caching, or only the loading, resizing and padding. Defaults to True.
+
+    Returns:
+        str: The hex digest of the canonical configuration.
+    """
+    config_to_hash = {
+        "gandlf_version": version("GANDLF"),
+        "data_preprocessing": parameters["data_preprocessing"],
+        "memory_save_mode": parameters["memory_save_mode"],
+        "patch_size": parameters["patch_size"],
+        "dimension": parameters["model"]["dimension"],
+        "enable_padding": parameters["patch_sampler"]["enable_padding"],
+        "padding_mode": parameters["patch_sampler"]["padding_mode"],
+        # zero-plane cropping is only applied for training or when explicitly requested
+        "crop_zero_planes": bool(train or apply_zero_crop),
+        "apply_preprocessing": bool(apply_preprocessing),
+    }
+    canonical_config = json.dumps(config_to_hash, sort_keys=True, default=str)
+    return hashlib.sha256(canonical_config.encode("utf-8")).hexdigest()
+
+
+class PreprocessedSubjectCache:
+    """
+    On-disk, content-addressed cache of deterministically preprocessed subjects.
+
+    Each entry is a directory named after the hash of the input files and the preprocessing configuration, containing one uncompressed `.npy` array per image (which is memory-mapped on load) and a `metadata.json` with the affine matrices and image types.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        parameters: dict,
+        train: bool,
+        apply_zero_crop: bool,
+        apply_preprocessing: Optional[bool] = True,
+    ):
+        """
+        Args:
+            cache_dir (str): The directory where the cache entries are stored.
+            parameters (dict): The parameters dictionary.
+            train (bool): If the dataloader is for training or not.
+            apply_zero_crop (bool): Whether to apply zero crop or not.
+            apply_preprocessing (Optional[bool], optional): Whether the `data_preprocessing` transforms are applied before caching, or only the loading, resizing and padding. Defaults to True.
+        """
+        self.cache_dir = cache_dir
+        self.config_hash = get_preprocessing_config_hash(
+            parameters, train, apply_zero_crop, apply_preprocessing
+        )
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get_key(self, files_per_key: dict) -> str:
+        """
+        This function computes the cache key for a subject.
+
+        Args:
+            files_per_key (dict): The subject keys (channel headers and "label") mapped to their input file paths.
+
+        Returns:
+            str: The cache key.
+        """
+        hasher = hashlib.sha256(self.config_hash.encode("utf-8"))
+        for key in sorted(files_per_key):
+            hasher.update(str(key).encode("utf-8"))
+            # the size and the first and last bytes identify the file, so that it does not need to be read completely; this is the same hash as for the tissue mask cache
+            hasher.update(get_slide_hash(files_per_key[key]).encode("utf-8"))
+        return hasher.hexdigest()
+
+    def load(self, key: str) -> Union[dict, None]:
+        """
+        This function loads the cached images of a subject.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            Union[dict, None]: The subject keys mapped to memory-mapped torchio images along with "spacing", or None if the entry is absent.
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        metadata_file = os.path.join(entry_dir, "metadata.json")
+        if not os.path.isfile(metadata_file):
+            return None
+
+        with open(metadata_file, "r") as f:
+            metadata = json.load(f)
+
+        subject_dict = {"spacing": torch.Tensor(metadata["spacing"])}
+        for image_key, image_info in metadata["images"].items():
+            # copy-on-write mapping ensures that pages are only read when they are accessed
+            array = np.load(os.path.join(entry_dir, image_info["file"]), mmap_mode="c")
+            image_class = (
+                torchio.LabelMap
+                if image_info["type"] == torchio.LABEL
+                else torchio.ScalarImage
+            )
+            subject_dict[image_key] = image_class(
+                tensor=torch.from_numpy(array), affine=np.array(image_info["affine"])
+            )
+        return subject_dict
+
+    def save(self, key: str, subject: torchio.Subject) -> None:
+        """
+        This function writes the preprocessed images of a subject to the cache.
+
+        Args:
+            key (str): The cache key.
+            subject (torchio.Subject): The preprocessed subject.
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        if os.path.isdir(entry_dir):
+            return
+
+        # write to a temporary directory first so that concurrent runs never see partial entries
+        temp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp_")
+        metadata = {"spacing": subject["spacing"].tolist(), "images": {}}
+        for image_key, image in subject.get_images_dict(intensity_only=False).items():
+            image_file = str(image_key) + ".npy"
+            np.save(os.path.join(temp_dir, image_file), image.numpy())
+            metadata["images"][image_key] = {
+                "file": image_file,
+                "type": image.type,
+                "affine": image.affine.tolist(),
+            }
+        with open(os.path.join(temp_dir, "metadata.json"), "w") as f:
+            json.dump(metadata, f)
+
+        try:
+            os.rename(temp_dir, entry_dir)
+        except OSError:
+            # another process has written the same entry in the meantime
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+class InMemorySubjectsDataset(torch.utils.data.Dataset):
+    """
+    Dataset that keeps the fully preprocessed subjects of a deterministic dataset (such as validation) resident in memory, so that they are only read and preprocessed once across epochs.
+
+    Subjects are evicted in least-recently-used order once the memory budget is exceeded. When used with multiple loader workers, each worker keeps the subjects that it has loaded, so persistent workers should be used and the budget should be split between them.
+    """
+
+    def __init__(
+        self, subjects_dataset: torch.utils.data.Dataset, memory_budget: int
+    ) -> None:
+        """
+        Args:
+            subjects_dataset (torch.utils.data.Dataset): The dataset to cache, it must not apply random transforms.
+            memory_budget (int): The maximum number of bytes of image data to keep in memory.
+        """
+        self.subjects_dataset = subjects_dataset
+        self.memory_budget = memory_budget
+        self.memory_used = 0
+        self._cache = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.subjects_dataset)
+
+    @staticmethod
+    def _get_subject_size(subject: torchio.Subject) -> int:
+        """
+        Helper function to get the number of bytes of image data in a subject.
+
+        Args:
+            subject (torchio.Subject): The loaded subject.
+
+        Returns:
+            int: The number of bytes.
+        """
+        return sum(
+            image.data.element_size() * image.data.nelement()
+            for image in subject.get_images(intensity_only=False)
+        )
+
+    def __getitem__(self, index: int) -> torchio.Subject:
+        if index in self._cache:
+            self._cache.move_to_end(index)
+            return self._cache[index][0]
+
+        subject = self.subjects_dataset[index]
+        subject_size = self._get_subject_size(subject)
+        if subject_size <= self.memory_budget:
+            while self.memory_used + subject_size > self.memory_budget:
+                _, (_, evicted_size) = self._cache.popitem(last=False)
+                self.memory_used -= evicted_size
+            self._cache[index] = (subject, subject_size)
+            self.memory_used += subject_size
+        return subject
+
+
+class SharedMemorySubjectsDataset(torchio.SubjectsDataset):
+    """
+    Dataset of loaded subjects whose image tensors are placed in shared memory once, so that all data loading workers (such as those of the patch queue) read the same copy of the images.
+
+    Unlike torchio.SubjectsDataset, the subjects are not deep-copied when they are accessed; the images of the returned subjects refer to the shared tensors, which the transforms replace instead of modifying in place.
+    """
+
+    def __init__(self, subjects: list, **kwargs) -> None:
+        """
+        Args:
+            subjects (list): The loaded subjects, whose tensors are moved to shared memory.
+            **kwargs: The keyword arguments of torchio.SubjectsDataset, such as the transform.
+        """
+        super().__init__(subjects, load_getitem=False, **kwargs)
+        for subject in subjects:
+            for image in subject.get_images(intensity_only=False):
+                # the storage is moved in place, so the original tensor is released
+                image.set_data(image.data.share_memory_())
+
+    def __getitem__(self, index: int) -> torchio.Subject:
+        # the shallow copy refers to the same tensors, while the metadata of the subject is still copied
+        subject = copy.copy(self._subjects[int(index)])
+        if self._transform is not None:
+            subject = self._transform(subject)
+        return subject
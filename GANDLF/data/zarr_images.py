@@ -0,0 +1,139 @@
+from typing import Optional, Sequence
+import numpy as np
+import torch
+import torchio
+
+from GANDLF.utils import (
+    is_zarr_array,
+    get_zarr_header,
+    read_zarr_image,
+    read_zarr_region,
+)
+
+
+class _ZarrImageMixin:
+    """
+    Mixin for torchio images stored as Zarr arrays, which provides the shape and geometry from the array metadata so that the image is only read when its data is accessed.
+    """
+
+    @property
+    def shape(self) -> tuple:
+        if self._loaded:
+            return super().shape
+        return tuple(get_zarr_header(self.path)["shape"])
+
+    @property
+    def affine(self) -> np.ndarray:
+        if self._loaded:
+            return super().affine
+        return np.array(get_zarr_header(self.path)["affine"])
+
+    @affine.setter
+    def affine(self, matrix: np.ndarray) -> None:
+        torchio.Image.affine.fset(self, matrix)
+
+    @property
+    def is_lazy(self) -> bool:
+        """
+        Whether the data of the image has not been read yet.
+        """
+        return not self._loaded
+
+    def read_region(
+        self, index_ini: Sequence[int], index_fin: Sequence[int]
+    ) -> torchio.Image:
+        """
+        This function reads a region of the image, so that only the chunks touched by the region are read.
+
+        Args:
+            index_ini (Sequence[int]): The first voxel index of the region along each spatial axis.
+            index_fin (Sequence[int]): The voxel index after the end of the region along each spatial axis.
+
+        Returns:
+            torchio.Image: The region as a loaded image of the same type.
+        """
+        array, affine = read_zarr_region(self.path, index_ini, index_fin)
+        return self.__class__(tensor=array, affine=affine, reader=self.reader)
+
+
+class ZarrScalarImage(_ZarrImageMixin, torchio.ScalarImage):
+    """
+    Intensity image stored as a Zarr array.
+    """
+
+    def __init__(self, path: Optional[str] = None, **kwargs):
+        kwargs.setdefault("reader", read_zarr_image)
+        super().__init__(path, **kwargs)
+
+
+class ZarrLabelMap(_ZarrImageMixin, torchio.LabelMap):
+    """
+    Label map stored as a Zarr array.
+    """
+
+    def __init__(self, path: Optional[str] = None, **kwargs):
+        kwargs.setdefault("reader", read_zarr_image)
+        super().__init__(path, **kwargs)
+
+
+class _ZarrRegionSamplerMixin:
+    """
+    Mixin for torchio patch samplers, which reads only the patch region of Zarr images that have not been loaded.
+    """
+
+    def crop(
+        self,
+        subject: torchio.Subject,
+        index_ini: Sequence[int],
+        patch_size: Sequence[int],
+    ) -> torchio.Subject:
+        lazy_images = {
+            name: image
+            for name, image in subject.get_images_dict(intensity_only=False).items()
+            if isinstance(image, _ZarrImageMixin) and image.is_lazy
+        }
+        if not lazy_images:
+            return super().crop(subject, index_ini, patch_size)
+
+        index_ini = np.asarray(index_ini, dtype=int)
+        index_fin = index_ini + np.asarray(patch_size, dtype=int)
+        # the remaining images (such as loaded labels for the label sampler) are cropped as usual
+        crop_transform = self._get_crop_transform(subject, index_ini, patch_size)
+        crop_transform.exclude = list(lazy_images.keys())
+        cropped_subject = crop_transform(subject)
+        for name, image in lazy_images.items():
+            cropped_subject[name] = image.read_region(index_ini, index_fin)
+        location = index_ini.tolist() + index_fin.tolist()
+        cropped_subject[torchio.LOCATION] = torch.as_tensor(location)
+        cropped_subject.update_attributes()
+        return cropped_subject
+
+
+class UniformSampler(_ZarrRegionSamplerMixin, torchio.data.UniformSampler):
+    pass
+
+
+class LabelSampler(_ZarrRegionSamplerMixin, torchio.data.LabelSampler):
+    pass
+
+
+class WeightedSampler(_ZarrRegionSamplerMixin, torchio.data.WeightedSampler):
+    pass
+
+
+def get_image_class(
+    path: str, image_class: Optional[type] = torchio.ScalarImage
+) -> type:
+    """
+    This function returns the torchio image class to use for a path.
+
+    Args:
+        path (str): The path to the image.
+        image_class (Optional[type], optional): The class for regular image files, either torchio.ScalarImage or torchio.LabelMap. Defaults to torchio.ScalarImage.
+
+    Returns:
+        type: The class to construct the image with.
+    """
+    if not is_zarr_array(path):
+        return image_class
+    return ZarrLabelMap if image_class is torchio.LabelMap else ZarrScalarImage
@@ -10,7 +10,7 @@ import click
 from deprecated import deprecated
 
 from GANDLF.entrypoints import append_copyright_to_help
-from GANDLF.utils import writeTrainingCSV
+from GANDLF.utils import writeTrainingCSV, index_headers_in_csv
 
 from GANDLF.cli import copyrightMessage
 from GANDLF.utils import logger_setup
@@ -22,6 +22,7 @@ def _construct_csv(
     label_id: Optional[str],
     output_file: str,
     relativize_paths_to_output: bool,
+    index_headers: bool = False,
 ):
     input_dir = os.path.normpath(input_dir)
     output_file = os.path.normpath(output_file)
@@ -47,11 +48,16 @@ def _construct_csv(
     logging.debug(f"{label_id=}")
     logging.debug(f"{output_file=}")
     logging.debug(f"{relativize_paths_to_output=}")
+    logging.debug(f"{index_headers=}")
 
     writeTrainingCSV(
         input_dir, channels_id, label_id, output_file, relativize_paths_to_output
     )
 
+    if index_headers:
+        index_file = index_headers_in_csv(output_file)
+        logging.info(f"Image headers have been indexed in {index_file}")
+
 
 @click.command()
 @click.option(
@@ -90,6 +96,12 @@ def _construct_csv(
     help="If True, paths in the output data CSV will always be relative to the location"
     " of the output data CSV itself.",
 )
+@click.option(
+    "--index-headers",
+    "-x",
+    is_flag=True,
+    help="If True, the headers of all images are indexed next to the output data CSV, which is re-used when 'header_index' is enabled in the config.",
+)
 @click.option(
     "--log-file",
     type=click.Path(),
@@ -103,6 +115,7 @@ def new_way(
     label_id: Optional[str],
     output_file: str,
     relativize_paths: bool,
+    index_headers: bool,
     log_file: str,
 ):
     """Generate training/inference CSV from data directory."""
@@ -114,6 +127,7 @@ def new_way(
         label_id=label_id,
         output_file=output_file,
         relativize_paths_to_output=relativize_paths,
+        index_headers=index_headers,
     )
 
 
@@ -19,6 +19,7 @@ def _preprocess(
     label_pad: str,
     apply_augs: bool,
     crop_zero: bool,
+    output_zarr: bool = False,
 ):
     print(f"{config=}")
     print(f"{input_data=}")
@@ -26,6 +27,7 @@ def _preprocess(
     print(f"{label_pad=}")
     print(f"{apply_augs=}")
     print(f"{crop_zero=}")
+    print(f"{output_zarr=}")
     preprocess_and_save(
         data_csv=input_data,
         config_file=config,
@@ -33,6 +35,7 @@ def _preprocess(
         label_pad_mode=label_pad,
         applyaugs=apply_augs,
         apply_zero_crop=crop_zero,
+        output_zarr=output_zarr,
     )
 
     # TODO: in `old_way` default logging level is warning, thus those 'finished' are not printed anymore
@@ -82,6 +85,12 @@ def _preprocess(
     is_flag=True,
     help="If passed, applies zero cropping during output creation.",
 )
+@click.option(
+    "--output-zarr",
+    is_flag=True,
+    help="If passed, writes the channels and label of each subject as chunked arrays of a single Zarr store instead of separate image files, "
+    "so that training only reads the chunks touched by each patch.",
+)
 @click.option(
     "--log-file",
     type=click.Path(),
@@ -96,6 +105,7 @@ def new_way(
     label_pad: str,
     apply_augs: bool,
     crop_zero: bool,
+    output_zarr: bool,
     log_file: str,
 ):
     """Generate training/inference data which are preprocessed to reduce resource footprint during computation."""
@@ -108,6 +118,7 @@ def new_way(
         label_pad=label_pad,
         apply_augs=apply_augs,
         crop_zero=crop_zero,
+        output_zarr=output_zarr,
     )
 
 
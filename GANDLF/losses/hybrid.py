@@ -1,8 +1,34 @@
+from typing import Tuple
 import torch
-from .segmentation import MCD_loss, FocalLoss
+from GANDLF.utils import one_hot
+from .segmentation import MCD_loss, FocalLoss, get_class_statistics
 from .regression import CCE_Generic, CE, CE_Logits
 
 
+def _get_shared_inputs(
+    prediction: torch.Tensor, target: torch.Tensor, params: dict
+) -> Tuple[torch.Tensor, Tuple[torch.Tensor, ...]]:
+    """
+    This function prepares the inputs that are shared by the terms of the hybrid losses, so that they are only computed once.
+
+    Args:
+        prediction (torch.Tensor): The predicted mask.
+        target (torch.Tensor): The ground truth mask, either one-hot encoded or with the class values.
+        params (dict): The parameters.
+
+    Returns:
+        Tuple[torch.Tensor, Tuple[torch.Tensor, ...]]: The one-hot encoded target, and the class statistics of the Dice loss.
+    """
+    class_list = params["model"]["class_list"]
+    if target.shape != prediction.shape:
+        target = one_hot(target, class_list)
+    target = target.type(prediction.dtype)
+    class_statistics = get_class_statistics(
+        prediction[:, : len(class_list), ...], target[:, : len(class_list), ...]
+    )
+    return target, class_statistics
+
+
 def DCCE(prediction: torch.Tensor, target: torch.Tensor, params: dict) -> torch.Tensor:
     """
     Calculates the Dice-Cross-Entropy loss.
@@ -15,7 +41,8 @@ def DCCE(prediction: torch.Tensor, target: torch.Tensor, params: dict) -> torch.
     Returns:
         torch.Tensor: The calculated loss.
     """
-    dcce_loss = MCD_loss(prediction, target, params) + CCE_Generic(
+    target, class_statistics = _get_shared_inputs(prediction, target, params)
+    dcce_loss = MCD_loss(prediction, target, params, class_statistics) + CCE_Generic(
         prediction, target, params, CE
     )
     return dcce_loss
@@ -35,7 +62,8 @@ def DCCE_Logits(
     Returns:
         torch.Tensor: The calculated loss.
     """
-    dcce_loss = MCD_loss(prediction, target, params) + CCE_Generic(
+    target, class_statistics = _get_shared_inputs(prediction, target, params)
+    dcce_loss = MCD_loss(prediction, target, params, class_statistics) + CCE_Generic(
         prediction, target, params, CE_Logits
     )
     return dcce_loss
@@ -55,4 +83,7 @@ def DC_Focal(
     Returns:
         torch.Tensor: The calculated loss.
     """
-    return MCD_loss(prediction, target, params) + FocalLoss(prediction, target, params)
+    target, class_statistics = _get_shared_inputs(prediction, target, params)
+    return MCD_loss(prediction, target, params, class_statistics) + FocalLoss(
+        prediction, target, params
+    )
@@ -57,17 +57,42 @@ class AbstractSegmentationLoss(AbstractLossFunction):
         Compute loss for a pair of prediction and target tensors. To be implemented by child classes.
         """
 
-    def forward(self, prediction: torch.Tensor, target: torch.Tensor) -> torch.Tensor:
-        accumulated_loss = torch.tensor(0.0, device=prediction.device)
+    def _compute_class_wise_loss(
+        self, prediction: torch.Tensor, target: torch.Tensor
+    ) -> torch.Tensor:
+        """
+        Compute loss for all classes. Defaults to computing one class at a time; child classes
+        can override this method to compute all classes in a single reduction.
+        """
+        return torch.stack(
+            [
+                self._compute_single_class_loss(prediction, target, class_idx)
+                for class_idx in range(self.num_classes)
+            ]
+        )
 
-        for class_idx in range(self.num_classes):
-            current_loss = self._compute_single_class_loss(
-                prediction, target, class_idx
-            )
-            accumulated_loss += (
-                self._optional_loss_operations(current_loss)
-                * self.penalty_weights[class_idx]
-            )
+    def _get_penalty_weights_tensor(self, loss: torch.Tensor) -> torch.Tensor:
+        """
+        Get the penalty weights of all classes as a tensor on the same device as the loss.
+        """
+        if self.penalty_weights is None:
+            return torch.ones(self.num_classes, dtype=loss.dtype, device=loss.device)
+        return torch.as_tensor(
+            [
+                float(self.penalty_weights[class_idx])
+                for class_idx in range(self.num_classes)
+            ],
+            dtype=loss.dtype,
+            device=loss.device,
+        )
+
+    def forward(self, prediction: torch.Tensor, target: torch.Tensor) -> torch.Tensor:
+        class_wise_loss = self._optional_loss_operations(
+            self._compute_class_wise_loss(prediction, target)
+        )
+        accumulated_loss = (
+            class_wise_loss * self._get_penalty_weights_tensor(class_wise_loss)
+        ).sum()
 
         accumulated_loss /= self.num_classes
 
@@ -147,7 +172,7 @@ class AbstractHybridLoss(AbstractLossFunction):
 
     def forward(self, prediction: torch.Tensor, target: torch.Tensor) -> torch.Tensor:
         accumulated_loss = torch.tensor(0.0, device=prediction.device)
-        for loss_calculator in self._initialize_all_loss_calculators():
+        for loss_calculator in self.loss_calculators:
             accumulated_loss += loss_calculator(prediction, target)
 
         return accumulated_loss
@@ -77,6 +77,13 @@ def CE(prediction: torch.Tensor, target: torch.Tensor) -> torch.Tensor:
     return loss_val
 
 
+# the binary cross entropy losses that can be computed for all classes at once
+class_wise_cross_entropy = {
+    CE: F.binary_cross_entropy,
+    CE_Logits: F.binary_cross_entropy_with_logits,
+}
+
+
 def CCE_Generic(
     prediction: torch.Tensor,
     target: torch.Tensor,
@@ -96,14 +103,36 @@ def CCE_Generic(
         torch.tensor: The final loss value after taking multiple classes into consideration
     """
 
-    acc_ce_loss = 0
-    target = one_hot(target, params["model"]["class_list"]).type(prediction.dtype)
+    num_classes = len(params["model"]["class_list"])
+    # the target is usually already one-hot encoded, such as for the hybrid losses
+    if target.shape != prediction.shape:
+        target = one_hot(target, params["model"]["class_list"])
+    target = target.type(prediction.dtype)
+
+    if CCE_Type in class_wise_cross_entropy:
+        # the target is not checked to be binary, since deep supervision resamples it into "soft" labels
+        # the mean cross entropy of each class is computed in a single reduction over the batch and the spatial dimensions
+        ce_loss = class_wise_cross_entropy[CCE_Type](
+            prediction[:, :num_classes, ...].float(),
+            target[:, :num_classes, ...].float(),
+            reduction="none",
+        )
+        ce_loss = ce_loss.mean(dim=[0] + list(range(2, ce_loss.dim())))
+    else:
+        ce_loss = torch.stack(
+            [
+                CCE_Type(prediction[:, i, ...], target[:, i, ...])
+                for i in range(num_classes)
+            ]
+        )
 
-    for i in range(0, len(params["model"]["class_list"])):
-        curr_ce_loss = CCE_Type(prediction[:, i, ...], target[:, i, ...])
-        if params["penalty_weights"] is not None:
-            curr_ce_loss = curr_ce_loss * params["penalty_weights"][i]
-        acc_ce_loss += curr_ce_loss
+    if params["penalty_weights"] is not None:
+        ce_loss = ce_loss * torch.as_tensor(
+            [params["penalty_weights"][i] for i in range(num_classes)],
+            dtype=ce_loss.dtype,
+            device=ce_loss.device,
+        )
+    acc_ce_loss = ce_loss.sum()
 
     # Take the mean of the loss if weights are not provided.
     if params["penalty_weights"] is None:
@@ -1,5 +1,5 @@
 import sys
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import torch
 
 
@@ -57,6 +57,94 @@ def mcc(predictions: torch.Tensor, targets: torch.Tensor) -> torch.Tensor:
     return torch.div(numerator.sum(), denominator.sum())
 
 
+def get_class_statistics(
+    predicted: torch.Tensor, target: torch.Tensor
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    This function computes the soft true positives, false positives, false negatives and true negatives of all classes in a single reduction.
+
+    Args:
+        predicted (torch.Tensor): Predicted generally by the network, with classes in dim 1.
+        target (torch.Tensor): Required target label to match the predicted with, with classes in dim 1.
+
+    Returns:
+        Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]: The true positives, false positives, false negatives and true negatives of each class.
+    """
+    # reduce over the batch and the spatial dimensions, keeping the classes
+    reduction_dims = [0] + list(range(2, predicted.dim()))
+    true_positives = (predicted * target).sum(dim=reduction_dims)
+    predicted_sum = predicted.sum(dim=reduction_dims)
+    target_sum = target.sum(dim=reduction_dims)
+    false_positives = predicted_sum - true_positives
+    false_negatives = target_sum - true_positives
+    true_negatives = (
+        predicted.numel() / predicted.shape[1]
+        - predicted_sum
+        - target_sum
+        + true_positives
+    )
+    return true_positives, false_positives, false_negatives, true_negatives
+
+
+def dice_from_statistics(
+    true_positives: torch.Tensor,
+    false_positives: torch.Tensor,
+    false_negatives: torch.Tensor,
+    true_negatives: torch.Tensor,
+) -> torch.Tensor:
+    """
+    This function computes the dice score of each class from the class statistics.
+
+    Args:
+        true_positives (torch.Tensor): The true positives of each class.
+        false_positives (torch.Tensor): The false positives of each class.
+        false_negatives (torch.Tensor): The false negatives of each class.
+        true_negatives (torch.Tensor): The true negatives of each class.
+
+    Returns:
+        torch.Tensor: The dice score of each class.
+    """
+    return (2.0 * true_positives + sys.float_info.min) / (
+        2.0 * true_positives + false_positives + false_negatives + sys.float_info.min
+    )
+
+
+def mcc_from_statistics(
+    true_positives: torch.Tensor,
+    false_positives: torch.Tensor,
+    false_negatives: torch.Tensor,
+    true_negatives: torch.Tensor,
+) -> torch.Tensor:
+    """
+    This function computes the Matthews Correlation Coefficient (MCC) of each class from the class statistics.
+
+    Args:
+        true_positives (torch.Tensor): The true positives of each class.
+        false_positives (torch.Tensor): The false positives of each class.
+        false_negatives (torch.Tensor): The false negatives of each class.
+        true_negatives (torch.Tensor): The true negatives of each class.
+
+    Returns:
+        torch.Tensor: The MCC of each class.
+    """
+    numerator = true_positives * true_negatives - false_positives * false_negatives
+    # Adding epsilon to the denominator to avoid divide-by-zero errors.
+    denominator = (
+        torch.sqrt(
+            (true_positives + false_positives)
+            * (true_positives + false_negatives)
+            * (true_negatives + false_positives)
+            * (true_negatives + false_negatives)
+        )
+        + torch.finfo(torch.float32).eps
+    )
+    return numerator / denominator
+
+
+# the criteria that can be computed for all classes from the class statistics
+class_wise_criteria = {dice: dice_from_statistics, mcc: mcc_from_statistics}
+
+
 def generic_loss_calculator(
     predicted: torch.Tensor,
     target: torch.Tensor,
@@ -65,6 +153,7 @@ def generic_loss_calculator(
     weights: Optional[List[float]] = None,
     ignore_class: Optional[int] = None,
     loss_type: Optional[int] = 0,
+    class_statistics: Optional[Tuple[torch.Tensor, ...]] = None,
 ) -> torch.Tensor:
     """
     This function computes the mean class dice score between two tensors
@@ -80,33 +169,50 @@ def generic_loss_calculator(
             0: no loss, normal dice calculation
             1: dice loss, (1-dice)
             2: log dice, -log(dice)
+        class_statistics (Optional[Tuple[torch.Tensor, ...]], optional): The output of get_class_statistics, if it has already been computed for these tensors, defaults to None
 
     Returns:
         torch.Tensor: Mean Class Dice score
     """
-    accumulated_loss = 0
-    # default to a ridiculous value so that it is ignored by default
-    ignore_class = -1e10 if ignore_class is None else ignore_class
-
-    for class_index in range(num_class):
-        if class_index != ignore_class:
-            current_loss = loss_criteria(
-                predicted[:, class_index, ...], target[:, class_index, ...]
+    if loss_criteria in class_wise_criteria:
+        if class_statistics is None:
+            class_statistics = get_class_statistics(
+                predicted[:, :num_class, ...], target[:, :num_class, ...]
             )
+        current_loss = class_wise_criteria[loss_criteria](
+            *[statistic[:num_class] for statistic in class_statistics]
+        )
+    else:
+        # custom criteria are computed for one class at a time
+        current_loss = torch.stack(
+            [
+                loss_criteria(
+                    predicted[:, class_index, ...], target[:, class_index, ...]
+                )
+                for class_index in range(num_class)
+            ]
+        )
 
-            # subtract from 1 because this is supposed to be a loss
-            default_loss = 1 - current_loss
-            if loss_type == 2 or loss_type == "log":
-                # negative because we want positive losses, and add epsilon to avoid infinities
-                current_loss = -torch.log(current_loss + torch.finfo(torch.float32).eps)
-            else:
-                current_loss = default_loss
-
-            # multiply by appropriate weight if provided
-            if weights is not None:
-                current_loss = current_loss * weights[class_index]
+    if loss_type == 2 or loss_type == "log":
+        # negative because we want positive losses, and add epsilon to avoid infinities
+        current_loss = -torch.log(current_loss + torch.finfo(torch.float32).eps)
+    else:
+        # subtract from 1 because this is supposed to be a loss
+        current_loss = 1 - current_loss
 
-            accumulated_loss += current_loss
+    # the weights and the ignored class are applied as a mask over the classes
+    class_mask = torch.ones(
+        num_class, dtype=current_loss.dtype, device=current_loss.device
+    )
+    if weights is not None:
+        class_mask = class_mask * torch.as_tensor(
+            [weights[class_index] for class_index in range(num_class)],
+            dtype=current_loss.dtype,
+            device=current_loss.device,
+        )
+    if ignore_class is not None and 0 <= ignore_class < num_class:
+        class_mask[ignore_class] = 0
+    accumulated_loss = (current_loss * class_mask).sum()
 
     if weights is None:
         accumulated_loss /= num_class
@@ -115,7 +221,10 @@ def generic_loss_calculator(
 
 
 def MCD_loss(
-    predicted: torch.Tensor, target: torch.Tensor, params: dict
+    predicted: torch.Tensor,
+    target: torch.Tensor,
+    params: dict,
+    class_statistics: Optional[Tuple[torch.Tensor, ...]] = None,
 ) -> torch.Tensor:
     """
     This function computes the Dice loss between two tensors. These weights should be the penalty weights, not dice weights.
@@ -124,6 +233,7 @@ def MCD_loss(
         predicted (torch.Tensor): The predicted value by the network.
         target (torch.Tensor): Required target label to match the predicted with
         params (dict): Dictionary of parameters
+        class_statistics (Optional[Tuple[torch.Tensor, ...]], optional): The output of get_class_statistics for the classes of params, if it has already been computed, such as by the hybrid losses. Defaults to None.
 
     Returns:
         torch.Tensor: The computed MCC loss.
@@ -136,6 +246,7 @@ def MCD_loss(
         params["penalty_weights"],
         None,
         1,
+        class_statistics,
     )
 
 
@@ -267,17 +378,28 @@ def MCT_loss(
         torch.Tensor: Computed Multi-Class Tversky Loss
     """
 
-    acc_tv_loss = 0
-    num_classes = predicted.shape[1]
+    true_positives, false_positives, false_negatives, _ = get_class_statistics(
+        predicted, target
+    )
+    alpha, beta = 0.5, 0.5
+    score = (true_positives + sys.float_info.min) / (
+        true_positives
+        + alpha * false_positives
+        + beta * false_negatives
+        + sys.float_info.min
+    )
+    class_loss = 1 - score
 
-    for i in range(num_classes):
-        curr_loss = tversky_loss(predicted[:, i, ...], target[:, i, ...])
-        if params is not None and params.get("penalty_weights") is not None:
-            curr_loss = curr_loss * params["penalty_weights"][i]
-        acc_tv_loss += curr_loss
+    if params is not None and params.get("penalty_weights") is not None:
+        class_loss = class_loss * torch.as_tensor(
+            [params["penalty_weights"][i] for i in range(predicted.shape[1])],
+            dtype=class_loss.dtype,
+            device=class_loss.device,
+        )
+    acc_tv_loss = class_loss.sum()
 
     if params is not None and params.get("penalty_weights") is None:
-        acc_tv_loss /= num_classes
+        acc_tv_loss /= predicted.shape[1]
 
     return acc_tv_loss
 
@@ -318,39 +440,22 @@ def FocalLoss(
         gamma = params["loss_function"].get("gamma", 2.0)
         size_average = params["loss_function"].get("size_average", True)
 
-    def _focal_loss(
-        preds, target, gamma, size_average: Optional[bool] = True
-    ) -> torch.Tensor:
-        """
-        Internal helper function to calculate focal loss for a single class.
-
-        Args:
-            preds (torch.Tensor): predicted generally by the network
-            target (torch.Tensor): Required target label to match the predicted with
-            gamma (float): The gamma value for focal loss
-            size_average (bool, optional): Whether to average the loss across the batch. Defaults to True.
-
-        Returns:
-            torch.Tensor: Computed focal loss for a single class.
-        """
-        ce_loss = torch.nn.CrossEntropyLoss(reduce=False)
-        logpt = ce_loss(preds, target)
-        pt = torch.exp(-logpt)
-        loss = ((1 - pt) ** gamma) * logpt
-        return_loss = loss.sum()
-        if size_average:
-            return_loss = loss.mean()
-        return return_loss
-
-    acc_focal_loss = 0
     num_classes = predicted.shape[1]
-
-    for i in range(num_classes):
-        curr_loss = _focal_loss(
-            predicted[:, i, ...], target[:, i, ...], gamma, size_average
+    # the cross entropy of each class is computed over dim 1 of its slice, so the classes are moved into the batch
+    class_predicted = predicted.transpose(0, 1).reshape((-1,) + predicted.shape[2:])
+    class_target = target.transpose(0, 1).reshape((-1,) + target.shape[2:])
+    logpt = torch.nn.functional.cross_entropy(
+        class_predicted, class_target, reduction="none"
+    ).view(num_classes, -1)
+    pt = torch.exp(-logpt)
+    loss = ((1 - pt) ** gamma) * logpt
+    class_loss = loss.mean(dim=1) if size_average else loss.sum(dim=1)
+
+    if params is not None and params.get("penalty_weights") is not None:
+        class_loss = class_loss * torch.as_tensor(
+            [params["penalty_weights"][i] for i in range(num_classes)],
+            dtype=class_loss.dtype,
+            device=class_loss.device,
         )
-        if params is not None and params.get("penalty_weights") is not None:
-            curr_loss = curr_loss * params["penalty_weights"][i]
-        acc_focal_loss += curr_loss
 
-    return acc_focal_loss
+    return class_loss.sum()
@@ -1,6 +1,11 @@
 import sys
 import torch
 from .loss_interface import AbstractSegmentationLoss, AbstractLossFunction
+from .segmentation import (
+    get_class_statistics,
+    dice_from_statistics,
+    mcc_from_statistics,
+)
 
 
 class MulticlassDiceLoss(AbstractSegmentationLoss):
@@ -31,6 +36,12 @@ class MulticlassDiceLoss(AbstractSegmentationLoss):
 
         return dice_score
 
+    def _compute_class_wise_loss(
+        self, prediction: torch.Tensor, target: torch.Tensor
+    ) -> torch.Tensor:
+        """Compute loss for all classes in a single reduction."""
+        return 1 - dice_from_statistics(*get_class_statistics(prediction, target))
+
 
 class MulticlassDiceLogLoss(MulticlassDiceLoss):
     def _optional_loss_operations(self, loss):
@@ -76,6 +87,12 @@ class MulticlassMCCLoss(AbstractSegmentationLoss):
 
         return torch.div(numerator.sum(), denominator.sum())
 
+    def _compute_class_wise_loss(
+        self, prediction: torch.Tensor, target: torch.Tensor
+    ) -> torch.Tensor:
+        """Compute loss for all classes in a single reduction."""
+        return 1 - mcc_from_statistics(*get_class_statistics(prediction, target))
+
 
 class MulticlassMCLLogLoss(MulticlassMCCLoss):
     def _optional_loss_operations(self, loss):
@@ -126,6 +143,20 @@ class MulticlassTverskyLoss(AbstractSegmentationLoss):
 
         return loss
 
+    def _compute_class_wise_loss(
+        self, prediction: torch.Tensor, target: torch.Tensor
+    ) -> torch.Tensor:
+        """Compute loss for all classes in a single reduction."""
+        true_positives, false_positives, false_negatives, _ = get_class_statistics(
+            prediction, target
+        )
+        denominator = (
+            true_positives + self.alpha * false_positives + self.beta * false_negatives
+        )
+        return 1 - (true_positives + sys.float_info.min) / (
+            denominator + sys.float_info.min
+        )
+
 
 class MulticlassFocalLoss(AbstractSegmentationLoss):
     """
@@ -176,6 +207,22 @@ class MulticlassFocalLoss(AbstractSegmentationLoss):
         )
         return loss_value  # no need to subtract from 1 in this case, hence the override
 
+    def _compute_class_wise_loss(
+        self, prediction: torch.Tensor, target: torch.Tensor
+    ) -> torch.Tensor:
+        """Compute loss for all classes in a single reduction."""
+        # the cross entropy of each class is computed over dim 1 of its slice, so the classes are moved into the batch
+        class_prediction = prediction.transpose(0, 1).reshape(
+            (-1,) + prediction.shape[2:]
+        )
+        class_target = target.transpose(0, 1).reshape((-1,) + target.shape[2:])
+        ce_loss = self.ce_loss_helper(class_prediction, class_target).view(
+            prediction.shape[1], -1
+        )
+        p_t = torch.exp(-ce_loss)
+        loss = -self.alpha * (1 - p_t) ** self.gamma * ce_loss
+        return loss.sum(dim=1) if self.output_aggregation == "sum" else loss.mean(dim=1)
+
 
 class KullbackLeiblerDivergence(AbstractLossFunction):
     def forward(self, mu: torch.Tensor, logvar: torch.Tensor) -> torch.Tensor:
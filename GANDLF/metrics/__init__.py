@@ -1,7 +1,8 @@
 """
 All the metrics are to be called from here
 """
-from typing import Union
+from typing import Dict, List, Union
+import torch
 
 from GANDLF.losses.regression import MSE_loss, CEL
 from .segmentation import (
@@ -19,6 +20,10 @@ from .segmentation import (
     specificity_segmentation_per_label,
     jaccard,
     jaccard_per_label,
+    precision_segmentation,
+    precision_segmentation_per_label,
+    get_segmentation_statistics,
+    segmentation_statistics_metrics,
 )
 from .regression import classification_accuracy, balanced_acc_score, per_label_accuracy
 from .generic import (
@@ -38,6 +43,7 @@ from .synthesis import (
     mean_absolute_error,
     ncc_metrics,
 )
+from GANDLF.utils import get_accumulated_output_from_calculator
 import GANDLF.metrics.classification as classification
 import GANDLF.metrics.regression as regression
 
@@ -78,6 +84,8 @@ global_metrics_dict = {
     "specificity_segmentation_per_label": specificity_segmentation_per_label,
     "jaccard": jaccard,
     "jaccard_per_label": jaccard_per_label,
+    "precision_segmentation": precision_segmentation,
+    "precision_segmentation_per_label": precision_segmentation_per_label,
 }
 
 
@@ -120,3 +128,73 @@ def overall_stats(predictions, ground_truth, params) -> dict[str, Union[float, l
         return classification.overall_stats(predictions, ground_truth, params)
     elif params["problem_type"] == "regression":
         return regression.overall_stats(predictions, ground_truth, params)
+
+
+class OverallStatsCalculator:
+    """
+    This class accumulates the metrics on the overall predictions and ground truths of classification and regression problems across batches, so that the calculators are instantiated once per run and the metrics are computed once per epoch.
+    """
+
+    def __init__(self, params: dict):
+        """
+        Args:
+            params (dict): The parameter dictionary containing training and data information.
+        """
+        if params["problem_type"] == "classification":
+            self.stats_module = classification
+        elif params["problem_type"] == "regression":
+            self.stats_module = regression
+        else:
+            raise NotImplementedError("Problem type not implemented for overall stats")
+        self.params = params
+        self.device = params.get("device", "cpu")
+        self.calculators = {
+            metric_name: calculator.to(self.device)
+            for metric_name, calculator in self.stats_module.get_overall_stats_calculators(
+                params
+            ).items()
+        }
+
+    @property
+    def metric_names(self) -> List[str]:
+        """
+        The names of the metrics, in the order in which they are computed.
+        """
+        return list(self.calculators.keys())
+
+    def update(self, prediction: torch.Tensor, target: torch.Tensor) -> None:
+        """
+        This function adds a batch of predictions and ground truths to the metrics.
+
+        Args:
+            prediction (torch.Tensor): The predictions of the batch, one per sample.
+            target (torch.Tensor): The ground truths of the batch, one per sample.
+        """
+        assert len(prediction) == len(
+            target
+        ), "Predictions and ground truth must be of same length"
+        self.stats_module.update_overall_stats(
+            self.calculators,
+            prediction.to(self.device),
+            target.to(self.device),
+            self.params,
+        )
+
+    def compute(self) -> Dict[str, Union[float, list]]:
+        """
+        This function computes the metrics over all batches since the last reset.
+
+        Returns:
+            Dict[str, Union[float, list]]: A dictionary of metrics.
+        """
+        return {
+            metric_name: get_accumulated_output_from_calculator(calculator)
+            for metric_name, calculator in self.calculators.items()
+        }
+
+    def reset(self) -> None:
+        """
+        This function clears the accumulated batches, which is done at the start of each epoch.
+        """
+        for calculator in self.calculators.values():
+            calculator.reset()
@@ -1,13 +1,13 @@
 """
 All the metrics are to be called from here
 """
-from typing import Union
+from typing import Dict, Union
 
 import torch
 from sklearn.metrics import balanced_accuracy_score
 import numpy as np
 import torchmetrics as tm
-from ..utils import get_output_from_calculator
+from ..utils import get_accumulated_output_from_calculator
 
 
 def classification_accuracy(
@@ -83,6 +83,56 @@ def per_label_accuracy(
         return balanced_acc_score(prediction, target, params)
 
 
+def get_overall_stats_calculators(params: dict) -> Dict[str, tm.Metric]:
+    """
+    Instantiates the calculators of the metrics on the overall predictions and ground truths, which can be updated across batches.
+
+    Args:
+        params (dict): The parameter dictionary containing training and data information.
+
+    Returns:
+        Dict[str, tm.Metric]: The calculator of each metric.
+    """
+    calculators = {}
+    reduction_types_keys = {"mean": "mean", "sum": "sum", "none": "none"}
+    # metrics that need the "reduction" parameter
+    for reduction_type, reduction_type_key in reduction_types_keys.items():
+        calculators[f"cosinesimilarity_{reduction_type}"] = tm.CosineSimilarity(
+            reduction=reduction_type_key
+        )
+    # metrics that do not have any "reduction" parameter
+    calculators.update(
+        {
+            "mse": tm.MeanSquaredError(),
+            "mae": tm.MeanAbsoluteError(),
+            "pearson": tm.PearsonCorrCoef(),
+            "spearman": tm.SpearmanCorrCoef(),
+        }
+    )
+    return calculators
+
+
+def update_overall_stats(
+    calculators: Dict[str, tm.Metric],
+    prediction: torch.Tensor,
+    target: torch.Tensor,
+    params: dict,
+) -> None:
+    """
+    Updates the calculators of the overall metrics with a batch of predictions and ground truths.
+
+    Args:
+        calculators (Dict[str, tm.Metric]): The calculators from get_overall_stats_calculators.
+        prediction (torch.Tensor): The prediction of the model.
+        target (torch.Tensor): The ground truth labels.
+        params (dict): The parameter dictionary containing training and data information.
+    """
+    prediction = prediction.detach().type(torch.float)
+    target = target.detach().type(torch.float) * params["scaling_factor"]
+    for calculator in calculators.values():
+        calculator.update(prediction, target)
+
+
 def overall_stats(
     prediction: torch.Tensor, target: torch.Tensor, params: dict
 ) -> dict[str, Union[float, list]]:
@@ -97,34 +147,13 @@ def overall_stats(
     Returns:
         dict: A dictionary of metrics.
     """
-    prediction = prediction.type(torch.float)
-    target = target.type(torch.float) * params["scaling_factor"]
     assert (
         params["problem_type"] == "regression"
     ), "Only regression is supported for these stats"
 
-    output_metrics = {}
-
-    reduction_types_keys = {"mean": "mean", "sum": "sum", "none": "none"}
-    # metrics that need the "reduction" parameter
-    for reduction_type, reduction_type_key in reduction_types_keys.items():
-        calculators = {
-            "cosinesimilarity": tm.CosineSimilarity(reduction=reduction_type_key)
-        }
-        for metric_name, calculator in calculators.items():
-            output_metrics[
-                f"{metric_name}_{reduction_type}"
-            ] = get_output_from_calculator(prediction, target, calculator)
-    # metrics that do not have any "reduction" parameter
-    calculators = {
-        "mse": tm.MeanSquaredError(),
-        "mae": tm.MeanAbsoluteError(),
-        "pearson": tm.PearsonCorrCoef(),
-        "spearman": tm.SpearmanCorrCoef(),
+    calculators = get_overall_stats_calculators(params)
+    update_overall_stats(calculators, prediction, target, params)
+    return {
+        metric_name: get_accumulated_output_from_calculator(calculator)
+        for metric_name, calculator in calculators.items()
     }
-    for metric_name, calculator in calculators.items():
-        output_metrics[metric_name] = get_output_from_calculator(
-            prediction, target, calculator
-        )
-
-    return output_metrics
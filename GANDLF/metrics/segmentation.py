@@ -2,18 +2,23 @@
 All the segmentation metrics are to be called from here
 """
 
-from typing import List, Optional, Tuple, Union
-import sys
+from typing import Dict, List, Optional, Tuple, Union
+import sys, concurrent.futures
 import torch
 import numpy as np
-from GANDLF.losses.segmentation import dice
+from functools import partial
+from GANDLF.losses.segmentation import get_class_statistics, dice_from_statistics
 from scipy.ndimage import _ni_support
+from scipy.spatial import cKDTree
 from scipy.ndimage.morphology import (
     distance_transform_edt,
     binary_erosion,
     generate_binary_structure,
 )
 
+# surfaces with less than 1/_kdtree_surface_ratio of the voxels of their bounding box are queried with a KD-tree
+_kdtree_surface_ratio = 16
+
 
 def _convert_tensor_to_int_label_array(input_tensor: torch.Tensor) -> np.ndarray:
     """
@@ -34,6 +39,189 @@ def _convert_tensor_to_int_label_array(input_tensor: torch.Tensor) -> np.ndarray
     return result_array.astype(np.int64)
 
 
+def get_segmentation_statistics(prediction: torch.Tensor, target: torch.Tensor) -> dict:
+    """
+    This function computes the statistics from which the overlap metrics of all classes are derived, in a single pass on the device of the tensors.
+
+    Args:
+        prediction (torch.Tensor): The input prediction containing objects, with classes in dim 1.
+        target (torch.Tensor): The input ground truth containing objects, with classes in dim 1.
+
+    Returns:
+        dict: The "soft" true positives, false positives, false negatives and true negatives of each class for the (unthresholded) dice, and the "confusion" tensor of shape (batch, class, 4) with the true positives, false positives, false negatives and true negatives of the thresholded objects.
+    """
+    prediction, target = prediction.detach(), target.detach()
+    # threshold to binary: background where < 0.5, object everywhere else
+    prediction_binary = prediction >= 0.5
+    target_binary = target >= 0.5
+    spatial_dims = list(range(2, prediction.dim()))
+    true_positives = (prediction_binary & target_binary).sum(dim=spatial_dims)
+    false_positives = prediction_binary.sum(dim=spatial_dims) - true_positives
+    false_negatives = target_binary.sum(dim=spatial_dims) - true_positives
+    true_negatives = (
+        prediction[0, 0, ...].numel()
+        - true_positives
+        - false_positives
+        - false_negatives
+    )
+    return {
+        "soft": get_class_statistics(prediction, target),
+        "confusion": torch.stack(
+            [true_positives, false_positives, false_negatives, true_negatives], dim=-1
+        ),
+    }
+
+
+def _get_validation_classes(params: dict) -> List[int]:
+    """
+    This function returns the classes for which the metrics are computed.
+
+    Args:
+        params (dict): The parameter dictionary containing training and data information.
+
+    Returns:
+        List[int]: The classes, without the label ignored during validation.
+    """
+    return [
+        i
+        for i in range(0, params["model"]["num_classes"])
+        if i != params["model"]["ignore_label_validation"]
+    ]
+
+
+def _dice_from_statistics(
+    statistics: dict, params: dict, per_label: Optional[bool] = False
+) -> torch.Tensor:
+    """
+    This function computes the multi-class dice from the segmentation statistics.
+
+    Args:
+        statistics (dict): The output of get_segmentation_statistics.
+        params (dict): The parameter dictionary containing training and data information.
+        per_label (Optional[bool], optional): Whether to return per-label scores. Defaults to False.
+
+    Returns:
+        torch.Tensor: The multi-class dice score or the per-label dice scores.
+    """
+    classes = _get_validation_classes(params)
+    dice_scores = dice_from_statistics(*statistics["soft"])[classes]
+    return dice_scores if per_label else dice_scores.mean()
+
+
+def _jaccard_from_statistics(
+    statistics: dict, params: dict, per_label: Optional[bool] = False
+) -> torch.Tensor:
+    """
+    This function computes the Jaccard score from the segmentation statistics.
+
+    Args:
+        statistics (dict): The output of get_segmentation_statistics.
+        params (dict): The parameter dictionary containing training and data information.
+        per_label (Optional[bool], optional): Whether to return per-label scores. Defaults to False.
+
+    Returns:
+        torch.Tensor: The Jaccard score or the per-label Jaccard scores.
+    """
+    classes = _get_validation_classes(params)
+    # the dice of the thresholded objects over the whole batch
+    confusion = statistics["confusion"].sum(dim=0)[classes].double()
+    dice_score = dice_from_statistics(*confusion.unbind(dim=-1))
+    # https://en.wikipedia.org/wiki/S%C3%B8rensen%E2%80%93Dice_coefficient#Difference_from_Jaccard
+    j_score = (dice_score / (2 - dice_score)).float()
+    return j_score if per_label else j_score.mean()
+
+
+def _ratio_from_statistics(
+    statistics: dict, params: dict, ratio: str, per_label: Optional[bool] = False
+) -> torch.Tensor:
+    """
+    This function computes the sensitivity, specificity or precision of each sample and class from the segmentation statistics.
+
+    Args:
+        statistics (dict): The output of get_segmentation_statistics.
+        params (dict): The parameter dictionary containing training and data information.
+        ratio (str): Either "sensitivity", "specificity" or "precision".
+        per_label (Optional[bool], optional): Whether to return the scores of each sample and label. Defaults to False.
+
+    Returns:
+        torch.Tensor: The average score, or the scores of each sample and label.
+    """
+    classes = _get_validation_classes(params)
+    confusion = statistics["confusion"][:, classes, :].double()
+    tp, fp, fn, tn = confusion.unbind(dim=-1)
+    if ratio == "specificity":
+        score = tn / (tn + fp + sys.float_info.min)
+    else:
+        if ratio == "sensitivity":
+            score = tp / (tp + fn + sys.float_info.min)
+        else:
+            score = tp / (tp + fp + sys.float_info.min)
+        # Make Changes if both input and reference are 0 for the tissue type
+        score = torch.where((tp + fp == 0) & (tp + fn == 0), 1.0, score)
+    score = score.float()
+    return score.flatten() if per_label else score.mean()
+
+
+def get_label_overlap_measures(confusion: torch.Tensor) -> Dict[str, List[float]]:
+    """
+    This function computes the measures of sitk.LabelOverlapMeasuresImageFilter for the binary object of each class, with the ground truth as the source image and the prediction as the target image, from a single confusion tensor.
+
+    Args:
+        confusion (torch.Tensor): The (class, 4) true positives, false positives, false negatives and true negatives of a single sample, from get_segmentation_statistics.
+
+    Returns:
+        Dict[str, List[float]]: The "falseNegativeError", "falsePositiveError", "meanOverlap", "unionOverlap" and "volumeSimilarity" of each class.
+    """
+    tp, fp, fn, tn = confusion.detach().cpu().double().unbind(dim=-1)
+    # the sizes of the objects in the ground truth and prediction
+    target_size, prediction_size = tp + fn, tp + fp
+    measures = {
+        "falseNegativeError": (fp, prediction_size),
+        "falsePositiveError": (fn, fn + tn),
+        "meanOverlap": (2 * tp, target_size + prediction_size),
+        "unionOverlap": (tp, tp + fp + fn),
+        "volumeSimilarity": (2 * (fn - fp), target_size + prediction_size),
+    }
+    # the filter returns the largest value for undefined measures, and for all measures when both objects are empty (i.e., there are no labels)
+    no_labels = (target_size == 0) & (prediction_size == 0)
+    output = {}
+    for measure, (numerator, denominator) in measures.items():
+        value = torch.where(
+            (denominator == 0) | no_labels, sys.float_info.max, numerator / denominator
+        )
+        if measure == "meanOverlap":
+            value[no_labels] = float("inf")
+        output[measure] = value.tolist()
+    return output
+
+
+# these metrics are derived from the output of get_segmentation_statistics, which only needs to be computed once for all of them
+segmentation_statistics_metrics = {
+    "dice": partial(_dice_from_statistics, per_label=False),
+    "dice_per_label": partial(_dice_from_statistics, per_label=True),
+    "jaccard": partial(_jaccard_from_statistics, per_label=False),
+    "jaccard_per_label": partial(_jaccard_from_statistics, per_label=True),
+    "sensitivity": partial(
+        _ratio_from_statistics, ratio="sensitivity", per_label=False
+    ),
+    "sensitivity_per_label": partial(
+        _ratio_from_statistics, ratio="sensitivity", per_label=True
+    ),
+    "specificity_segmentation": partial(
+        _ratio_from_statistics, ratio="specificity", per_label=False
+    ),
+    "specificity_segmentation_per_label": partial(
+        _ratio_from_statistics, ratio="specificity", per_label=True
+    ),
+    "precision_segmentation": partial(
+        _ratio_from_statistics, ratio="precision", per_label=False
+    ),
+    "precision_segmentation_per_label": partial(
+        _ratio_from_statistics, ratio="precision", per_label=True
+    ),
+}
+
+
 def multi_class_dice(
     prediction: torch.Tensor,
     target: torch.Tensor,
@@ -52,23 +240,9 @@ def multi_class_dice(
     Returns:
         Union[torch.Tensor, List[float]]: The multi-class dice score or the list of per-label dice scores.
     """
-    total_dice = 0
-    avg_counter = 0
-    per_label_dice = []
-    for i in range(0, params["model"]["num_classes"]):
-        # this check should only happen during validation
-        if i != params["model"]["ignore_label_validation"]:
-            current_dice = dice(prediction[:, i, ...], target[:, i, ...])
-            total_dice += current_dice
-            per_label_dice.append(current_dice.item())
-            avg_counter += 1
-        # currentDiceLoss = 1 - currentDice # subtract from 1 because this is a loss
-    total_dice /= avg_counter
-
-    if per_label:
-        return torch.tensor(per_label_dice)
-    else:
-        return total_dice
+    return _dice_from_statistics(
+        get_segmentation_statistics(prediction, target), params, per_label
+    )
 
 
 def multi_class_dice_per_label(
@@ -88,24 +262,25 @@ def multi_class_dice_per_label(
     return multi_class_dice(prediction, target, params, per_label=True)
 
 
-def __surface_distances(
-    prediction: torch.Tensor,
-    target: torch.Tensor,
+def _get_surface_distances(
+    prediction: np.ndarray,
+    target: np.ndarray,
     voxel_spacing: Optional[Tuple[float]] = None,
     connectivity: Optional[int] = 1,
-) -> float:
+    use_kdtree: Optional[bool] = None,
+) -> Tuple[Union[np.ndarray, int], Union[np.ndarray, int]]:
     """
-    The distances between the surface voxel of binary objects in result and their
-    nearest partner surface voxel of a binary object in reference. Adapted from https://github.com/loli/medpy/blob/39131b94f0ab5328ab14a874229320efc2f74d98/medpy/metric/binary.py#L1195.
+    The distances between the surface voxels of binary objects in prediction and their nearest partner surface voxel of a binary object in target, and vice versa. Adapted from https://github.com/loli/medpy/blob/39131b94f0ab5328ab14a874229320efc2f74d98/medpy/metric/binary.py#L1195.
 
     Args:
-        prediction (torch.Tensor): Input prediction containing objects. Can be any type but will be converted into binary: background where 0, object everywhere else.
-        target (torch.Tensor): Input ground truth containing objects. Can be any type but will be converted into binary: background where 0, object everywhere else.
+        prediction (np.ndarray): Input prediction containing objects. Can be any type but will be converted into binary: background where 0, object everywhere else.
+        target (np.ndarray): Input ground truth containing objects. Can be any type but will be converted into binary: background where 0, object everywhere else.
         voxel_spacing (Optional[Tuple[float]], optional): The voxel spacing. Defaults to None.
         connectivity (Optional[int], optional): The voxel connectivity. Defaults to 1.
+        use_kdtree (Optional[bool], optional): Whether to query a KD-tree of the surface voxels instead of computing distance transforms; if None, the KD-tree is used for surfaces that are sparse in their bounding box. Defaults to None.
 
     Returns:
-        float: The symmetric Hausdorff Distance between the object(s) in ```result``` and the object(s) in ```reference```. The distance unit is the same as for the spacing of elements along each dimension, which is usually given in mm.
+        Tuple[Union[np.ndarray, int], Union[np.ndarray, int]]: The surface distances from prediction to target and from target to prediction, or 0 for both if either is empty. The distance unit is the same as for the spacing of elements along each dimension, which is usually given in mm.
     """
     result = np.atleast_1d(prediction.astype(bool))
     reference = np.atleast_1d(target.astype(bool))
@@ -115,28 +290,50 @@ def __surface_distances(
         if not voxel_spacing.flags.contiguous:
             voxel_spacing = voxel_spacing.copy()
 
-    # binary structure
-    footprint = generate_binary_structure(result.ndim, connectivity)
-
     # test for emptiness
-    if 0 == np.count_nonzero(result):
-        return 0
-    if 0 == np.count_nonzero(reference):
-        return 0
+    if not result.any() or not reference.any():
+        return 0, 0
+
+    # only the bounding box of both objects is needed, since everything outside it is background
+    union = result | reference
+    bounding_box = []
+    for axis in range(union.ndim):
+        other_axes = tuple(other for other in range(union.ndim) if other != axis)
+        indices = np.flatnonzero(union.any(axis=other_axes))
+        bounding_box.append(slice(indices[0], indices[-1] + 1))
+    result = result[tuple(bounding_box)]
+    reference = reference[tuple(bounding_box)]
 
     # extract only 1-pixel border line of objects
+    footprint = generate_binary_structure(result.ndim, connectivity)
     result_border = result ^ binary_erosion(result, structure=footprint, iterations=1)
     reference_border = reference ^ binary_erosion(
         reference, structure=footprint, iterations=1
     )
 
-    # compute average surface distance
-    # Note: scipys distance transform is calculated only inside the borders of the
-    #       foreground objects, therefore the input has to be reversed
-    dt = distance_transform_edt(~reference_border, sampling=voxel_spacing)
-    sds = dt[result_border]
+    if use_kdtree is None:
+        surface_size = np.count_nonzero(result_border) + np.count_nonzero(
+            reference_border
+        )
+        use_kdtree = surface_size * _kdtree_surface_ratio < result.size
+
+    if use_kdtree:
+        sampling = 1 if voxel_spacing is None else voxel_spacing
+        result_points = np.argwhere(result_border) * sampling
+        reference_points = np.argwhere(reference_border) * sampling
+        result_to_reference = cKDTree(reference_points).query(result_points)[0]
+        reference_to_result = cKDTree(result_points).query(reference_points)[0]
+    else:
+        # Note: scipys distance transform is calculated only inside the borders of the
+        #       foreground objects, therefore the input has to be reversed
+        result_to_reference = distance_transform_edt(
+            ~reference_border, sampling=voxel_spacing
+        )[result_border]
+        reference_to_result = distance_transform_edt(
+            ~result_border, sampling=voxel_spacing
+        )[reference_border]
 
-    return sds
+    return result_to_reference, reference_to_result
 
 
 def _nsd_base(a_to_b: np.ndarray, b_to_a: np.ndarray, threshold: float) -> float:
@@ -167,6 +364,33 @@ def _nsd_base(a_to_b: np.ndarray, b_to_a: np.ndarray, threshold: float) -> float
     return dc
 
 
+def _get_surface_distance_metrics(
+    prediction: np.ndarray,
+    target: np.ndarray,
+    voxel_spacing: Optional[Tuple[float]],
+    threshold: float,
+) -> Tuple[float, float, float]:
+    """
+    This function computes all surface distance metrics from a single set of surface distances.
+
+    Args:
+        prediction (np.ndarray): Input prediction containing objects. Can be any type but will be converted into binary: background where 0, object everywhere else.
+        target (np.ndarray): Input ground truth containing objects. Can be any type but will be converted into binary: background where 0, object everywhere else.
+        voxel_spacing (Optional[Tuple[float]]): The voxel spacing.
+        threshold (float): The threshold of the Normalized Surface Dice, in mm.
+
+    Returns:
+        Tuple[float, float, float]: The Normalized Surface Dice, 100th percentile Hausdorff Distance, and the 95th percentile Hausdorff Distance.
+    """
+    a_to_b, b_to_a = _get_surface_distances(prediction, target, voxel_spacing)
+    distances = np.hstack((a_to_b, b_to_a))
+    return (
+        _nsd_base(a_to_b, b_to_a, threshold),
+        np.percentile(distances, 100),
+        np.percentile(distances, 95),
+    )
+
+
 def _calculator_jaccard(
     prediction: torch.Tensor,
     target: torch.Tensor,
@@ -174,7 +398,7 @@ def _calculator_jaccard(
     per_label: Optional[bool] = False,
 ) -> torch.Tensor:
     """
-    This function returns sensitivity and specificity.
+    This function returns the Jaccard score.
 
     Args:
         prediction (torch.Tensor): Input prediction containing objects. Can be any type but will be converted into binary: background where 0, object everywhere else.
@@ -185,26 +409,9 @@ def _calculator_jaccard(
     Returns:
         float: The Jaccard score between the object(s) in ```inp``` and the object(s) in ```target```.
     """
-    result_array = _convert_tensor_to_int_label_array(prediction)
-    target_array = _convert_tensor_to_int_label_array(target)
-
-    jaccard, avg_counter = 0, 0
-    jaccard_per_label = []
-    for i in range(0, params["model"]["num_classes"]):
-        # this check should only happen during validation
-        if i != params["model"]["ignore_label_validation"]:
-            dice_score = dice(result_array[:, i, ...], target_array[:, i, ...])
-            # https://en.wikipedia.org/wiki/S%C3%B8rensen%E2%80%93Dice_coefficient#Difference_from_Jaccard
-            j_score = dice_score / (2 - dice_score)
-            jaccard += j_score
-            if per_label:
-                jaccard_per_label.append(jaccard)
-            avg_counter += 1
-
-    if per_label:
-        return torch.tensor(jaccard_per_label)
-    else:
-        return torch.tensor(jaccard / avg_counter)
+    return _jaccard_from_statistics(
+        get_segmentation_statistics(prediction, target), params, per_label
+    )
 
 
 def _calculator_sensitivity_specificity(
@@ -225,57 +432,11 @@ def _calculator_sensitivity_specificity(
     Returns:
         float, float: The sensitivity and specificity between the object(s) in ```inp``` and the object(s) in ```target```.
     """
-    # inMask is mask of input array equal to a certain tissue (ie. all one's in tumor core)
-    # Ref mask is mask of certain tissue in ground truth (ie. all one's in reference core )
-    # overlap is mask where the two equal each other
-    # They are of the total number of voxels of the ground truth brain mask
-
-    def get_sensitivity_and_specificity(result_array, target_array):
-        iC = np.sum(result_array)
-        rC = np.sum(target_array)
-
-        overlap = np.where((result_array == target_array), 1, 0)
-
-        # Where they agree are both equal to that value
-        TP = overlap[result_array == 1].sum()
-        FP = iC - TP
-        FN = rC - TP
-        TN = np.count_nonzero((result_array != 1) & (target_array != 1))
-
-        Sens = 1.0 * TP / (TP + FN + sys.float_info.min)
-        Spec = 1.0 * TN / (TN + FP + sys.float_info.min)
-
-        # Make Changes if both input and reference are 0 for the tissue type
-        if (iC == 0) and (rC == 0):
-            Sens = 1.0
-
-        return Sens, Spec
-
-    result_array = _convert_tensor_to_int_label_array(prediction)
-    target_array = _convert_tensor_to_int_label_array(target)
-
-    sensitivity, specificity, avg_counter = 0, 0, 0
-    sensitivity_per_label, specificity_per_label = [], []
-    for b in range(0, result_array.shape[0]):
-        for i in range(0, params["model"]["num_classes"]):
-            if i != params["model"]["ignore_label_validation"]:
-                s, p = get_sensitivity_and_specificity(
-                    result_array[b, i, ...], target_array[b, i, ...]
-                )
-                sensitivity += s
-                specificity += p
-                if per_label:
-                    sensitivity_per_label.append(s)
-                    specificity_per_label.append(p)
-                avg_counter += 1
-
-    if per_label:
-        return torch.tensor(sensitivity_per_label), torch.tensor(specificity_per_label)
-    else:
-        return (
-            torch.tensor(sensitivity / avg_counter),
-            torch.tensor(specificity / avg_counter),
-        )
+    statistics = get_segmentation_statistics(prediction, target)
+    return (
+        _ratio_from_statistics(statistics, params, "sensitivity", per_label),
+        _ratio_from_statistics(statistics, params, "specificity", per_label),
+    )
 
 
 def _calculator_generic_all_surface_distances(
@@ -299,39 +460,35 @@ def _calculator_generic_all_surface_distances(
     """
     result_array = _convert_tensor_to_int_label_array(prediction)
     target_array = _convert_tensor_to_int_label_array(target)
+    threshold = max(min(params["subject_spacing"][0]).item(), 1)
+
+    def get_metrics(sample_and_class: Tuple[int, int]) -> Tuple[float, float, float]:
+        b, i = sample_and_class
+        return _get_surface_distance_metrics(
+            result_array[b, i, ...],
+            target_array[b, i, ...],
+            params["subject_spacing"][b],
+            threshold,
+        )
 
-    avg_counter = 0
-    if per_label:
-        return_hd100, return_hd95, return_nsd = [], [], []
+    samples_and_classes = [
+        (b, i)
+        for b in range(0, result_array.shape[0])
+        for i in _get_validation_classes(params)
+    ]
+    # older parameter files might not have this option
+    surface_distance_workers = params.get("surface_distance_workers", 0)
+    if surface_distance_workers > 0 and len(samples_and_classes) > 1:
+        with concurrent.futures.ThreadPoolExecutor(
+            surface_distance_workers
+        ) as executor:
+            all_metrics = list(executor.map(get_metrics, samples_and_classes))
     else:
-        return_hd100, return_hd95, return_nsd = 0, 0, 0
-    for b in range(0, result_array.shape[0]):
-        for i in range(0, params["model"]["num_classes"]):
-            if i != params["model"]["ignore_label_validation"]:
-                hd1 = __surface_distances(
-                    result_array[b, i, ...],
-                    target_array[b, i, ...],
-                    params["subject_spacing"][b],
-                )
-                hd2 = __surface_distances(
-                    target_array[b, i, ...],
-                    result_array[b, i, ...],
-                    params["subject_spacing"][b],
-                )
-                threshold = max(min(params["subject_spacing"][0]), 1).item()
-                temp_nsd = _nsd_base(hd1, hd2, threshold)
-                temp_hd100 = np.percentile(np.hstack((hd1, hd2)), 100)
-                temp_hd95 = np.percentile(np.hstack((hd1, hd2)), 95)
-                if per_label:
-                    return_nsd.append(temp_nsd)
-                    return_hd100.append(temp_hd100)
-                    return_hd95.append(temp_hd95)
-                else:
-                    return_nsd += temp_nsd
-                    return_hd100 += temp_hd100
-                    return_hd95 += temp_hd95
-                    avg_counter += 1
+        all_metrics = [get_metrics(current) for current in samples_and_classes]
 
+    return_nsd, return_hd100, return_hd95 = (
+        np.array(metric_values, dtype=np.float64) for metric_values in zip(*all_metrics)
+    )
     if per_label:
         return (
             torch.tensor(return_nsd),
@@ -340,9 +497,9 @@ def _calculator_generic_all_surface_distances(
         )
     else:
         return (
-            torch.tensor(return_nsd / avg_counter),
-            torch.tensor(return_hd100 / avg_counter),
-            torch.tensor(return_hd95 / avg_counter),
+            torch.tensor(return_nsd.mean()),
+            torch.tensor(return_hd100.mean()),
+            torch.tensor(return_hd95.mean()),
         )
 
 
@@ -594,3 +751,44 @@ def jaccard_per_label(
     """
     j = _calculator_jaccard(prediction, target, params, per_label=True)
     return j
+
+
+def precision_segmentation(
+    prediction: torch.Tensor, target: torch.Tensor, params: dict
+) -> torch.Tensor:
+    """
+    This function returns the precision.
+
+    Args:
+        prediction (torch.Tensor): Input prediction containing objects. Can be any type but will be converted into binary: background where 0, object everywhere else.
+        target (torch.Tensor): Input ground truth containing objects. Can be any type but will be converted into binary: binary: background where 0, object everywhere else.
+        params (dict): The parameter dictionary containing training and data information.
+
+    Returns:
+        torch.Tensor: The precision.
+    """
+    return _ratio_from_statistics(
+        get_segmentation_statistics(prediction, target), params, "precision"
+    )
+
+
+def precision_segmentation_per_label(
+    prediction: torch.Tensor, target: torch.Tensor, params: dict
+) -> List[float]:
+    """
+    This function returns the per-label precision.
+
+    Args:
+        prediction (torch.Tensor): Input prediction containing objects. Can be any type but will be converted into binary: background where 0, object everywhere else.
+        target (torch.Tensor): Input ground truth containing objects. Can be any type but will be converted into binary: binary: background where 0, object everywhere else.
+        params (dict): The parameter dictionary containing training and data information.
+
+    Returns:
+        List[float]: The list of per-label precision scores.
+    """
+    return _ratio_from_statistics(
+        get_segmentation_statistics(prediction, target),
+        params,
+        "precision",
+        per_label=True,
+    )
@@ -3,12 +3,16 @@ import SimpleITK as sitk
 import PIL.Image
 import numpy as np
 import torch
-from torchmetrics import (
-    StructuralSimilarityIndexMeasure,
-    MeanSquaredError,
-    MeanSquaredLogError,
-    MeanAbsoluteError,
-    PeakSignalNoiseRatio,
+
+# the functional interface is used, since these metrics are computed for each subject separately and do not need to be accumulated
+from torchmetrics.functional.image import (
+    structural_similarity_index_measure,
+    peak_signal_noise_ratio as _peak_signal_noise_ratio,
+)
+from torchmetrics.functional.regression import (
+    mean_squared_error as _mean_squared_error,
+    mean_squared_log_error as _mean_squared_log_error,
+    mean_absolute_error as _mean_absolute_error,
 )
 from GANDLF.utils import get_image_from_tensor
 
@@ -27,8 +31,9 @@ def structural_similarity_index(
     Returns:
         torch.Tensor: The structural similarity index.
     """
-    ssim = StructuralSimilarityIndexMeasure(return_full_image=True)
-    _, ssim_idx_full_image = ssim(preds=prediction, target=target)
+    _, ssim_idx_full_image = structural_similarity_index_measure(
+        preds=prediction, target=target, return_full_image=True
+    )
     mask = torch.ones_like(ssim_idx_full_image) if mask is None else mask
     try:
         ssim_idx = ssim_idx_full_image[mask]
@@ -50,8 +55,7 @@ def mean_squared_error(prediction: torch.Tensor, target: torch.Tensor) -> torch.
     Returns:
         torch.Tensor: The mean squared error or its square root.
     """
-    mse = MeanSquaredError(squared=True)
-    return mse(preds=prediction, target=target)
+    return _mean_squared_error(preds=prediction, target=target, squared=True)
 
 
 def root_mean_squared_error(
@@ -67,8 +71,7 @@ def root_mean_squared_error(
     Returns:
         torch.Tensor: The mean squared error or its square root.
     """
-    mse = MeanSquaredError(squared=False)
-    return mse(preds=prediction, target=target)
+    return _mean_squared_error(preds=prediction, target=target, squared=False)
 
 
 def peak_signal_noise_ratio(
@@ -90,12 +93,16 @@ def peak_signal_noise_ratio(
         torch.Tensor: The peak signal to noise ratio.
     """
     if epsilon == None:
-        psnr = (
-            PeakSignalNoiseRatio()
-            if data_range == None
-            else PeakSignalNoiseRatio(data_range=data_range[1] - data_range[0])
+        if data_range == None:
+            # the data range is computed like torchmetrics.PeakSignalNoiseRatio, where the min value is 0 if all values are positive
+            psnr_data_range = (
+                torch.max(target) - torch.clamp(torch.min(target), max=0)
+            ).item()
+        else:
+            psnr_data_range = data_range[1] - data_range[0]
+        return _peak_signal_noise_ratio(
+            preds=prediction, target=target, data_range=psnr_data_range
         )
-        return psnr(preds=prediction, target=target)
     else:  # implementation of PSNR that does not give 'inf'/'nan' when 'mse==0'
         mse = mean_squared_error(target, prediction)
         if data_range is None:  # compute data_range like torchmetrics if not given
@@ -120,8 +127,7 @@ def mean_squared_log_error(
     Returns:
         torch.Tensor: The mean squared log error.
     """
-    mle = MeanSquaredLogError()
-    return mle(preds=prediction, target=target)
+    return _mean_squared_log_error(preds=prediction, target=target)
 
 
 def mean_absolute_error(prediction: torch.Tensor, target: torch.Tensor) -> torch.Tensor:
@@ -135,8 +141,7 @@ def mean_absolute_error(prediction: torch.Tensor, target: torch.Tensor) -> torch
     Returns:
         torch.Tensor: The mean absolute error.
     """
-    mae = MeanAbsoluteError()
-    return mae(preds=prediction, target=target)
+    return _mean_absolute_error(preds=prediction, target=target)
 
 
 def _get_ncc_image(prediction: torch.Tensor, target: torch.Tensor) -> sitk.Image:
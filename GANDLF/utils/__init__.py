@@ -5,6 +5,8 @@ os.environ["TORCHIO_HIDE_CITATION_PROMPT"] = "1"
 
 from .imaging import (
     resize_image,
+    get_resized_image_file,
+    get_label_histogram,
     resample_image,
     perform_sanity_check_on_subject,
     write_training_patches,
@@ -24,6 +26,7 @@ from .tensor import (
     print_model_summary,
     get_ground_truths_and_predictions_tensor,
     get_output_from_calculator,
+    get_accumulated_output_from_calculator,
     get_tensor_from_image,
     get_image_from_tensor,
 )
@@ -34,6 +37,7 @@ from .write_parse import (
     parseTestingCSV,
     get_dataframe,
     convert_relative_paths_in_dataframe,
+    PredictionsWriter,
 )
 
 from .parameter_processing import (
@@ -67,5 +71,20 @@ from .modelio import (
     optimize_and_save_model,
 )
 
+from .header_index import (
+    ImageHeaderIndex,
+    get_header_index,
+    get_header_index_file,
+    index_headers_in_csv,
+)
+
+from .zarr_io import (
+    is_zarr_array,
+    write_image_to_zarr,
+    get_zarr_header,
+    read_zarr_image,
+    read_zarr_region,
+)
+
 from .data_splitter import split_data
 from .gandlf_logging import logger_setup, InfoOnlyFilter
@@ -266,10 +266,19 @@ def print_and_format_metrics(
 
     output_metrics_dict = deepcopy(cohort_level_metrics)
     for metric in metrics_dict_from_parameters:
-        if isinstance(sample_level_metrics[metric], np.ndarray):
-            to_print = (sample_level_metrics[metric] / length_of_dataloader).tolist()
+        sample_level_metric = sample_level_metrics[metric]
+        # metrics that are kept on the device during the epoch are only synchronized here
+        if isinstance(sample_level_metric, torch.Tensor):
+            sample_level_metric = sample_level_metric.cpu()
+            sample_level_metric = (
+                sample_level_metric.item()
+                if sample_level_metric.numel() == 1
+                else sample_level_metric.numpy()
+            )
+        if isinstance(sample_level_metric, np.ndarray):
+            to_print = (sample_level_metric / length_of_dataloader).tolist()
         else:
-            to_print = sample_level_metrics[metric] / length_of_dataloader
+            to_print = sample_level_metric / length_of_dataloader
         output_metrics_dict[metric] = to_print
     for metric, metric_val in output_metrics_dict.items():
         print("     Epoch Final   " + mode + " " + metric + " : ", metric_val)
@@ -0,0 +1,262 @@
+from typing import List, Optional
+import os, json, hashlib, sqlite3, threading
+import SimpleITK as sitk
+from tqdm import tqdm
+
+from .write_parse import parseTrainingCSV
+
+# the index is kept next to the data CSV so that all loaders and tools working on the same data share it
+header_index_filename = "gandlf_header_index.sqlite"
+
+
+def get_header_index_file(data_csv: str) -> str:
+    """
+    This function returns the location of the header index for a data CSV.
+
+    Args:
+        data_csv (str): The data CSV; if multiple comma-separated CSVs are passed, the first one is used.
+
+    Returns:
+        str: The path to the header index.
+    """
+    first_csv = data_csv.split(",")[0]
+    return os.path.join(
+        os.path.dirname(os.path.abspath(first_csv)), header_index_filename
+    )
+
+
+def get_header_index(parameters: dict) -> Optional["ImageHeaderIndex"]:
+    """
+    This function returns the header index defined in the parameters.
+
+    Args:
+        parameters (dict): The parameters dictionary.
+
+    Returns:
+        Optional[ImageHeaderIndex]: The header index, or None if it is not enabled.
+    """
+    if parameters.get("header_index_file") is None:
+        return None
+    return ImageHeaderIndex(parameters["header_index_file"])
+
+
+def index_headers_in_csv(data_csv: str) -> str:
+    """
+    This function populates the header index for all images and labels in a data CSV.
+
+    Args:
+        data_csv (str): The data CSV.
+
+    Returns:
+        str: The path to the header index.
+    """
+    index_file = get_header_index_file(data_csv)
+    header_index = ImageHeaderIndex(index_file)
+    data_full, headers = parseTrainingCSV(data_csv, train=False)
+    columns_with_images = list(headers["channelHeaders"])
+    if headers["labelHeader"] is not None:
+        columns_with_images.append(headers["labelHeader"])
+    for _, row in tqdm(
+        data_full.iterrows(), total=data_full.shape[0], desc="Indexing headers"
+    ):
+        for column in columns_with_images:
+            file_path = str(row.iloc[column])
+            if os.path.isfile(file_path):
+                header_index.get_header(file_path)
+    return index_file
+
+
+class ImageHeaderIndex:
+    """
+    Persistent SQLite index of image headers (size, spacing, origin and direction), of label histograms, and of the subjects whose images have been checked for consistency.
+
+    Entries are only re-used as long as the size and modification time of the file are unchanged. The index can be shared across threads, and is re-opened in every process it is sent to.
+    """
+
+    def __init__(self, index_file: str):
+        """
+        Args:
+            index_file (str): The path to the SQLite file.
+        """
+        self.index_file = index_file
+        self._connection, self._pid = None, None
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # connections and locks cannot be pickled, they get re-created on first use
+        return {"index_file": self.index_file}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["index_file"])
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """
+        This function returns the connection for the current process, creating the tables if needed.
+
+        Returns:
+            sqlite3.Connection: The SQLite connection.
+        """
+        if (self._connection is None) or (self._pid != os.getpid()):
+            self._connection = sqlite3.connect(
+                self.index_file, timeout=60, check_same_thread=False
+            )
+            self._pid = os.getpid()
+            with self._connection:
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS headers (path TEXT PRIMARY KEY, file_size INTEGER, mtime_ns INTEGER, header TEXT)"
+                )
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS consistent_subjects (files_key TEXT PRIMARY KEY)"
+                )
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS label_histograms (path TEXT PRIMARY KEY, file_size INTEGER, mtime_ns INTEGER, histogram TEXT)"
+                )
+        return self._connection
+
+    @staticmethod
+    def _get_file_stat(file_path: str) -> tuple:
+        """
+        Helper function to get the absolute path, size and modification time of a file.
+
+        Args:
+            file_path (str): The path to the file.
+
+        Returns:
+            tuple: The absolute path, size in bytes and modification time in nanoseconds.
+        """
+        stat = os.stat(file_path)
+        return os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns
+
+    def get_header(self, file_path: str) -> dict:
+        """
+        This function returns the header of an image, and only reads it from disk if the file has changed since it was indexed.
+
+        Args:
+            file_path (str): The path to the image.
+
+        Returns:
+            dict: The "dimension", "size", "spacing", "origin" and "direction" of the image.
+        """
+        path, file_size, mtime_ns = self._get_file_stat(file_path)
+        with self._lock:
+            row = (
+                self._get_connection()
+                .execute(
+                    "SELECT header FROM headers WHERE path = ? AND file_size = ? AND mtime_ns = ?",
+                    (path, file_size, mtime_ns),
+                )
+                .fetchone()
+            )
+        if row is not None:
+            return json.loads(row[0])
+
+        file_reader = sitk.ImageFileReader()
+        file_reader.SetFileName(file_path)
+        file_reader.ReadImageInformation()
+        header = {
+            "dimension": file_reader.GetDimension(),
+            "size": list(file_reader.GetSize()),
+            "spacing": list(file_reader.GetSpacing()),
+            "origin": list(file_reader.GetOrigin()),
+            "direction": list(file_reader.GetDirection()),
+        }
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO headers VALUES (?, ?, ?, ?)",
+                    (path, file_size, mtime_ns, json.dumps(header)),
+                )
+        return header
+
+    def _get_files_key(self, file_paths: List[str]) -> str:
+        """
+        Helper function to get a key that changes whenever any of the files changes.
+
+        Args:
+            file_paths (List[str]): The paths to the files.
+
+        Returns:
+            str: The hex digest of the paths, sizes and modification times.
+        """
+        files_stat = sorted(self._get_file_stat(file_path) for file_path in file_paths)
+        return hashlib.sha256(json.dumps(files_stat).encode("utf-8")).hexdigest()
+
+    def is_consistent(self, file_paths: List[str]) -> bool:
+        """
+        This function checks if the images of a subject have previously passed the consistency check without changing since.
+
+        Args:
+            file_paths (List[str]): The paths to the images of the subject.
+
+        Returns:
+            bool: True if the consistency check can be skipped.
+        """
+        files_key = self._get_files_key(file_paths)
+        with self._lock:
+            row = (
+                self._get_connection()
+                .execute(
+                    "SELECT 1 FROM consistent_subjects WHERE files_key = ?",
+                    (files_key,),
+                )
+                .fetchone()
+            )
+        return row is not None
+
+    def set_consistent(self, file_paths: List[str]) -> None:
+        """
+        This function records that the images of a subject have passed the consistency check.
+
+        Args:
+            file_paths (List[str]): The paths to the images of the subject.
+        """
+        files_key = self._get_files_key(file_paths)
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                connection.execute(
+                    "INSERT OR IGNORE INTO consistent_subjects VALUES (?)", (files_key,)
+                )
+
+    def get_label_histogram(self, file_path: str) -> Optional[dict]:
+        """
+        This function returns the histogram of a label image, if it has been indexed since the file last changed.
+
+        Args:
+            file_path (str): The path to the label image.
+
+        Returns:
+            Optional[dict]: The number of voxels of each label value, or None if it needs to be computed.
+        """
+        path, file_size, mtime_ns = self._get_file_stat(file_path)
+        with self._lock:
+            row = (
+                self._get_connection()
+                .execute(
+                    "SELECT histogram FROM label_histograms WHERE path = ? AND file_size = ? AND mtime_ns = ?",
+                    (path, file_size, mtime_ns),
+                )
+                .fetchone()
+            )
+        if row is None:
+            return None
+        # json only stores string keys
+        return {float(value): count for value, count in json.loads(row[0]).items()}
+
+    def set_label_histogram(self, file_path: str, histogram: dict) -> None:
+        """
+        This function records the histogram of a label image.
+
+        Args:
+            file_path (str): The path to the label image.
+            histogram (dict): The number of voxels of each label value.
+        """
+        path, file_size, mtime_ns = self._get_file_stat(file_path)
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO label_histograms VALUES (?, ?, ?, ?)",
+                    (path, file_size, mtime_ns, json.dumps(histogram)),
+                )
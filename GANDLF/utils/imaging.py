@@ -1,5 +1,5 @@
 from typing import List, Optional, Tuple, Union
-import os, pathlib, math, copy
+import os, pathlib, math, copy, json, hashlib, uuid
 from enum import Enum
 import numpy as np
 import SimpleITK as sitk
@@ -7,6 +7,8 @@ import torchio
 import cv2
 
 from .generic import get_filename_extension_sanitized
+from .header_index import ImageHeaderIndex
+from .zarr_io import is_zarr_array, get_zarr_header, read_zarr_image
 
 
 def resample_image(
@@ -95,6 +97,89 @@ def resize_image(
     return resample_image(input_image, outputSpacing, interpolator=interpolator)
 
 
+def get_resized_image_file(
+    input_image: torchio.Image,
+    output_size: Union[np.ndarray, list, tuple],
+    cache_dir: str,
+    interpolator: Optional[Enum] = sitk.sitkLinear,
+) -> str:
+    """
+    This function resizes an image and writes it to a cache that is shared across data loaders, folds and runs, so that every resize is only computed once.
+
+    Args:
+        input_image (torchio.Image): The image to be resized, which needs to be read from a file.
+        output_size (Union[np.ndarray, list, tuple]): The desired output size for the resized image.
+        cache_dir (str): The directory of the cache.
+        interpolator (Optional[Enum], optional): The desired interpolator. Defaults to sitk.sitkLinear.
+
+    Returns:
+        str: The path to the resized image.
+    """
+    input_file = os.path.abspath(str(input_image.path))
+    # the size and modification time ensure that modified inputs are resized again
+    stat = os.stat(input_file)
+    key_to_hash = [
+        input_file,
+        stat.st_size,
+        stat.st_mtime_ns,
+        np.array(output_size).tolist(),
+        int(interpolator),
+    ]
+    key = hashlib.sha256(json.dumps(key_to_hash).encode("utf-8")).hexdigest()
+    # Zarr arrays do not have an extension
+    ext = get_filename_extension_sanitized(input_file) or ".nii.gz"
+    resized_file = os.path.join(cache_dir, key + ext)
+    if not os.path.isfile(resized_file):
+        pathlib.Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        resized_image = resize_image(input_image.as_sitk(), output_size, interpolator)
+        # write to a temporary file first so that concurrent loaders never read partial files
+        temp_file = os.path.join(cache_dir, key + "_" + uuid.uuid4().hex + ext)
+        sitk.WriteImage(resized_image, temp_file)
+        os.replace(temp_file, resized_file)
+    return resized_file
+
+
+def get_label_histogram(
+    label_file: str, header_index: Optional[ImageHeaderIndex] = None
+) -> dict:
+    """
+    This function counts the voxels of each value in a label image; for multi-channel labels, only the first channel is used.
+
+    Args:
+        label_file (str): The path to the label image.
+        header_index (Optional[ImageHeaderIndex], optional): The persistent header index used to skip recounting unchanged files. Defaults to None.
+
+    Returns:
+        dict: The number of voxels of each label value.
+    """
+    if header_index is not None:
+        histogram = header_index.get_label_histogram(label_file)
+        if histogram is not None:
+            return histogram
+
+    if is_zarr_array(label_file):
+        label_array = read_zarr_image(label_file)[0][0]
+    else:
+        label_image = sitk.ReadImage(label_file)
+        label_array = sitk.GetArrayViewFromImage(label_image)
+        if label_image.GetNumberOfComponentsPerPixel() > 1:
+            label_array = label_array[..., 0]
+    label_array = np.ravel(label_array)
+
+    if (label_array.dtype.kind in "ui") and (label_array.min() >= 0):
+        # a single pass for the usual case of non-negative integer labels
+        counts = np.bincount(label_array)
+        values = np.flatnonzero(counts)
+        counts = counts[values]
+    else:
+        values, counts = np.unique(label_array, return_counts=True)
+    histogram = {float(value): int(count) for value, count in zip(values, counts)}
+
+    if header_index is not None:
+        header_index.set_label_histogram(label_file, histogram)
+    return histogram
+
+
 def softer_sanity_check(
     base_property: Union[np.ndarray, List[float], Tuple[float]],
     new_property: Union[np.ndarray, List[float], Tuple[float]],
@@ -122,56 +207,75 @@ def softer_sanity_check(
     return result
 
 
-def perform_sanity_check_on_subject(subject: torchio.Subject, parameters: dict) -> bool:
+def perform_sanity_check_on_subject(
+    subject: torchio.Subject,
+    parameters: dict,
+    header_index: Optional[ImageHeaderIndex] = None,
+) -> bool:
     """
     This function performs a sanity check on the image modalities in input subject to ensure that they are consistent.
 
     Args:
         subject (torchio.Subject): The input subject.
         parameters (dict): The parameters passed by the user yaml.
+        header_index (Optional[ImageHeaderIndex], optional): The persistent header index; if present, headers are only read and checked when the files have changed. Defaults to None.
 
     Returns:
         bool: True if the sanity check passes.
     """
     # read the first image and save that for comparison
-    file_reader_base = None
+    properties_base = None
 
     list_for_comparison = copy.deepcopy(parameters["headers"]["channelHeaders"])
     if parameters["headers"]["labelHeader"] is not None:
         list_for_comparison.append("label")
 
-    def _get_itkimage_or_filereader(
-        subject_str_key: Union[str, sitk.Image]
-    ) -> Union[sitk.ImageFileReader, sitk.Image]:
+    # the index can only be used if all images are read from files
+    files_for_comparison = [subject[str(key)]["path"] for key in list_for_comparison]
+    if header_index is not None and "" in files_for_comparison:
+        header_index = None
+    if header_index is not None:
+        if header_index.is_consistent(files_for_comparison):
+            return True
+
+    def _get_image_properties(subject_str_key: torchio.Image) -> dict:
         """
-        Helper function to get the itk image or file reader from the subject.
+        Helper function to get the geometric properties of an image in the subject.
 
         Args:
-            subject_str_key (Union[str, sitk.Image]): The subject string key or itk image.
+            subject_str_key (torchio.Image): The image in the subject.
 
         Returns:
-            Union[sitk.ImageFileReader, sitk.Image]: The itk image or file reader.
+            dict: The "dimension", "origin", "direction" and "spacing" of the image.
         """
         if subject_str_key["path"] != "":
+            if is_zarr_array(subject_str_key["path"]):
+                return get_zarr_header(subject_str_key["path"])
+            if header_index is not None:
+                return header_index.get_header(subject_str_key["path"])
             file_reader = sitk.ImageFileReader()
             file_reader.SetFileName(subject_str_key["path"])
             file_reader.ReadImageInformation()
-            return file_reader
         else:
             # this case is required if any tensor/imaging operation has been applied in dataloader
             file_reader = subject_str_key.as_sitk()
+        return {
+            "dimension": file_reader.GetDimension(),
+            "origin": file_reader.GetOrigin(),
+            "direction": file_reader.GetDirection(),
+            "spacing": file_reader.GetSpacing(),
+        }
 
     if len(list_for_comparison) > 1:
         for key in list_for_comparison:
-            if file_reader_base is None:
-                file_reader_base = _get_itkimage_or_filereader(subject[str(key)])
+            if properties_base is None:
+                properties_base = _get_image_properties(subject[str(key)])
             else:
-                file_reader_current = _get_itkimage_or_filereader(subject[str(key)])
+                properties_current = _get_image_properties(subject[str(key)])
 
                 # this check needs to be absolute
                 assert (
-                    file_reader_base.GetDimension()
-                    == file_reader_current.GetDimension()
+                    properties_base["dimension"] == properties_current["dimension"]
                 ), (
                     "Dimensions for Subject '"
                     + subject["subject_id"]
@@ -180,7 +284,7 @@ def perform_sanity_check_on_subject(subject: torchio.Subject, parameters: dict)
 
                 # other checks can be softer
                 assert softer_sanity_check(
-                    file_reader_base.GetOrigin(), file_reader_current.GetOrigin()
+                    properties_base["origin"], properties_current["origin"]
                 ), (
                     "Origin for Subject '"
                     + subject["subject_id"]
@@ -188,7 +292,7 @@ def perform_sanity_check_on_subject(subject: torchio.Subject, parameters: dict)
                 )
 
                 assert softer_sanity_check(
-                    file_reader_base.GetDirection(), file_reader_current.GetDirection()
+                    properties_base["direction"], properties_current["direction"]
                 ), (
                     "Orientation for Subject '"
                     + subject["subject_id"]
@@ -196,13 +300,16 @@ def perform_sanity_check_on_subject(subject: torchio.Subject, parameters: dict)
                 )
 
                 assert softer_sanity_check(
-                    file_reader_base.GetSpacing(), file_reader_current.GetSpacing()
+                    properties_base["spacing"], properties_current["spacing"]
                 ), (
                     "Spacing for Subject '"
                     + subject["subject_id"]
                     + "' are not consistent."
                 )
 
+    if header_index is not None:
+        header_index.set_consistent(files_for_comparison)
+
     return True
 
 
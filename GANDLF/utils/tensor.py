@@ -1,4 +1,5 @@
-import os, sys
+import os, sys, concurrent.futures
+from functools import lru_cache, partial
 from typing import List, Optional, Tuple, Union
 from pandas.util import hash_pandas_object
 import numpy as np
@@ -6,17 +7,66 @@ import SimpleITK as sitk
 import pandas as pd
 import torch
 import torch.nn as nn
-from torch.utils.data import DataLoader
-import torchio
 import torchmetrics
 from tqdm import tqdm
 from torchinfo import summary
 from GANDLF.utils.generic import get_array_from_image_or_tensor
+from GANDLF.utils.header_index import get_header_index
+from GANDLF.utils.imaging import get_label_histogram
 
 # global definition for both one_hot and reverse_one_hot
 special_cases_to_check = ["||"]
 
 
+def _get_class_values(_class: Union[int, str]) -> List[int]:
+    """
+    This function returns the label values that are combined into a single class.
+
+    Args:
+        _class (Union[int, str]): The class, which can combine multiple label values using the special cases.
+
+    Returns:
+        List[int]: The label values of the class.
+    """
+    if isinstance(_class, str):
+        for case in special_cases_to_check:
+            if case in _class:
+                return [int(value) for value in _class.split(case)]
+    return [int(_class)]
+
+
+@lru_cache(maxsize=32)
+def _get_one_hot_tables(
+    class_list: Tuple[Union[int, str], ...], device: torch.device
+) -> Tuple[torch.Tensor, Optional[Tuple[torch.Tensor, torch.Tensor]], int]:
+    """
+    This function builds the tables that map every label value to its classes, so that the encoding is a single lookup.
+
+    Args:
+        class_list (Tuple[Union[int, str], ...]): The list of classes based on which one-hot encoding needs to happen.
+        device (torch.device): The device of the tables.
+
+    Returns:
+        torch.Tensor: The encoding table, where row "value - offset" holds the encoding of the label value; the last row is empty and is used for values that are not in any class.
+        Optional[Tuple[torch.Tensor, torch.Tensor]]: The class index and the value to scatter for each row of the encoding table; None if a label value is part of multiple classes.
+        int: The offset of the encoding table, which is only non-zero for negative label values.
+    """
+    class_values = [_get_class_values(_class) for _class in class_list]
+    all_values = [value for values in class_values for value in values]
+    offset = min(min(all_values), 0)
+    table = torch.zeros(
+        max(all_values) - offset + 2, len(class_list), dtype=torch.float32
+    )
+    for class_idx, values in enumerate(class_values):
+        for value in values:
+            table[value - offset, class_idx] = 1
+    scatter_tables = None
+    # a label value can be part of multiple classes, such as "1||2" and "2"
+    if table.sum(dim=1).max() <= 1:
+        scatter_tables = (table.argmax(dim=1).to(device), table.amax(dim=1).to(device))
+    return table.to(device), scatter_tables, offset
+
+
 def one_hot(
     segmask_tensor: torch.Tensor, class_list: Union[List[int], List[str]]
 ) -> torch.Tensor:
@@ -30,58 +80,39 @@ def one_hot(
     Returns:
         torch.Tensor: The one-hot encoded torch.Tensor
     """
-    batch_size = segmask_tensor.shape[0]
-
-    def_shape = segmask_tensor.shape
-    if len(def_shape) == 4:
-        # special case for sdnet
-        batch_stack = torch.zeros(
-            def_shape[0],
-            len(class_list),
-            def_shape[2],
-            def_shape[3],
-            dtype=torch.float32,
-            device=segmask_tensor.device,
-        )
-    else:
-        batch_stack = torch.zeros(
-            def_shape[0],
-            len(class_list),
-            def_shape[2],
-            def_shape[3],
-            def_shape[4],
-            dtype=torch.float32,
-            device=segmask_tensor.device,
-        )
-
-    for b in range(batch_size):
-        # since the input tensor is 5D, with [batch_size, modality, x, y, z], we do not need to consider the modality dimension for labels
-        segmask_array_iter = segmask_tensor[b, 0, ...]
-        bin_mask = segmask_array_iter == 0  # initialize bin_mask
-
-        # this implementation allows users to combine logical operands
-        class_idx = 0
-        for _class in class_list:
-            if isinstance(_class, str):
-                for case in special_cases_to_check:
-                    if case in _class:
-                        special_class_split = _class.split(case)
-                        bin_mask = segmask_array_iter == int(special_class_split[0])
-                        for i in range(1, len(special_class_split)):
-                            bin_mask = torch.logical_or(
-                                bin_mask,
-                                (segmask_array_iter == int(special_class_split[i])),
-                            )
-                    else:
-                        # assume that it is a simple int
-                        bin_mask = segmask_array_iter == int(_class)
-            else:
-                bin_mask = segmask_array_iter == int(_class)
-            # we always ensure the append happens in dim 0
-            batch_stack[b, class_idx, ...] = bin_mask.long().unsqueeze(0)
-            class_idx += 1
-
-    return batch_stack
+    table, scatter_tables, offset = _get_one_hot_tables(
+        tuple(class_list), segmask_tensor.device
+    )
+    # since the input tensor is 5D, with [batch_size, modality, x, y, z], we do not need to consider the modality dimension for labels
+    segmask_tensor = segmask_tensor[:, 0, ...]
+    # the index is modified in-place, so it is always a copy
+    table_index = segmask_tensor.to(torch.long, copy=True)
+    is_not_integer = None
+    if segmask_tensor.is_floating_point():
+        is_not_integer = table_index != segmask_tensor
+    if offset != 0:
+        table_index.sub_(offset)
+    # values outside the table are mapped to the empty last row, which is also indexed by -1
+    table_index.clamp_(-1, table.shape[0] - 1)
+    if is_not_integer is not None:
+        table_index.masked_fill_(is_not_integer, -1)
+
+    batch_stack = torch.zeros(
+        (segmask_tensor.shape[0], len(class_list)) + segmask_tensor.shape[1:],
+        dtype=torch.float32,
+        device=segmask_tensor.device,
+    )
+    if scatter_tables is None:
+        # classes overlap, so each class is looked up from its column of the table
+        for class_idx in range(len(class_list)):
+            batch_stack[:, class_idx, ...] = table[:, class_idx][table_index]
+        return batch_stack
+
+    # each voxel is part of at most one class, so the encoding is a single scatter, where voxels without a class scatter a 0
+    class_index, class_value = scatter_tables
+    return batch_stack.scatter_(
+        1, class_index[table_index].unsqueeze(1), class_value[table_index].unsqueeze(1)
+    )
 
 
 def reverse_one_hot(
@@ -97,7 +128,12 @@ def reverse_one_hot(
     Returns:
         numpy.array: The final mask as numpy array.
     """
-    predmask_array = get_array_from_image_or_tensor(predmask_tensor)
+    if isinstance(predmask_tensor, torch.Tensor):
+        predmask_tensor = predmask_tensor.detach()
+    else:
+        predmask_tensor = torch.from_numpy(
+            get_array_from_image_or_tensor(predmask_tensor)
+        )
     special_case_detected = False
 
     for _class in class_list:
@@ -107,9 +143,6 @@ def reverse_one_hot(
                     special_case_detected = True
                     break
 
-    final_mask = np.zeros(predmask_array[0, ...].shape).astype(np.int16)
-    predmask_array_bool = predmask_array >= 0.5
-
     # for special case, do not use '0' to initialize any value in final_mask in case it is absent
     zero_present = False
     if special_case_detected:
@@ -117,18 +150,30 @@ def reverse_one_hot(
             if (_class == "0") or (_class == 0):
                 zero_present = True
                 break
+    # the first entry is for voxels that do not belong to any class
+    output_values = [0]
     for idx, i in enumerate(class_list):
-        output_value = i
-        # for special case, use the index as value
-        if special_case_detected:
-            output_value = idx
-            # if zero is not present, then don't use '0' as output value
-            if not (zero_present):
-                output_value += 1
+        output_value = int(i) if not special_case_detected else idx
+        # for special case, if zero is not present, then don't use '0' as output value
+        if special_case_detected and not (zero_present):
+            output_value += 1
+        output_values.append(output_value)
+    output_values = torch.tensor(
+        np.array(output_values).astype(np.int16), device=predmask_tensor.device
+    )
 
-        final_mask[predmask_array_bool[idx, ...]] = output_value
+    # later classes take precedence, so each voxel gets the last class that it belongs to
+    class_numbers = torch.arange(
+        1,
+        len(class_list) + 1,
+        dtype=torch.uint8 if len(class_list) < 256 else torch.int16,
+        device=predmask_tensor.device,
+    ).view([-1] + [1] * (predmask_tensor.dim() - 1))
+    last_class = ((predmask_tensor[: len(class_list)] >= 0.5) * class_numbers).amax(
+        dim=0
+    )
 
-    return final_mask
+    return output_values[last_class.long()].cpu().numpy()
 
 
 def send_model_to_device(
@@ -298,13 +343,14 @@ def get_class_imbalance_weights_classification(
 
 
 def get_class_imbalance_weights_segmentation(
-    training_data_loader: DataLoader, parameters: dict
+    training_df: pd.DataFrame, parameters: dict
 ) -> Tuple[dict, dict, dict]:
     """
-    This function calculates the penalty that is used for validation loss in multi-class problems
+    This function calculates the penalty that is used for validation loss in multi-class problems.
+    The voxels of each class are counted from the histograms of the label files, which are persisted in the header index (if enabled) so that only new or changed labels are read.
 
     Args:
-        training_data_loader (torch.utils.data.DataLoader): The training data loader.
+        training_df (pd.DataFrame): The training data frame.
         parameters (dict): The parameters passed by the user yaml.
 
     Returns:
@@ -321,25 +367,45 @@ def get_class_imbalance_weights_segmentation(
             abs_dict[i] = 0
             penalty_dict[i] = 0
 
-    penalty_loader = training_data_loader
+    label_files = [
+        str(label_file)
+        for label_file in training_df.iloc[:, parameters["headers"]["labelHeader"]]
+    ]
+    get_histogram = partial(
+        get_label_histogram, header_index=get_header_index(parameters)
+    )
+    # older parameter files might not have these options
+    histogram_workers = parameters.get("subject_construction_workers", 0)
+    progress_description = "Counting label voxels for penalty calculation"
+    if histogram_workers > 0:
+        executor_class = (
+            concurrent.futures.ProcessPoolExecutor
+            if parameters.get("subject_construction_backend", "thread") == "process"
+            else concurrent.futures.ThreadPoolExecutor
+        )
+        with executor_class(histogram_workers) as executor:
+            histograms = list(
+                tqdm(
+                    executor.map(get_histogram, label_files),
+                    total=len(label_files),
+                    desc=progress_description,
+                )
+            )
+    else:
+        histograms = [
+            get_histogram(label_file)
+            for label_file in tqdm(label_files, desc=progress_description)
+        ]
 
     # get the weights for use for dice loss
     total_counter = 0
-
-    # For regression dice penalty need not be taken account
-    # For classification this should be calculated on the basis of predicted labels and mask
-    # iterate through full penalty data
-    for _, (subject) in enumerate(
-        tqdm(penalty_loader, desc="Looping over training data for penalty calculation")
-    ):
-        # accumulate dice weights for each label
-        mask = subject["label"][torchio.DATA]
-        one_hot_mask = one_hot(mask, parameters["model"]["class_list"])
-        for i in range(0, len(parameters["model"]["class_list"])):
-            currentNumber = torch.nonzero(one_hot_mask[:, i, ...], as_tuple=False).size(
-                0
-            )
+    class_values = [
+        _get_class_values(_class) for _class in parameters["model"]["class_list"]
+    ]
+    for histogram in histograms:
+        for i, values in enumerate(class_values):
             # class-specific non-zero voxels
+            currentNumber = sum(histogram.get(value, 0) for value in values)
             abs_dict[i] += currentNumber
             # total number of non-zero voxels to be considered
             total_counter += currentNumber
@@ -411,23 +477,11 @@ def get_class_imbalance_weights(
                     class_weights,
                 ) = get_class_imbalance_weights_classification(training_df, params)
             elif params["problem_type"] == "segmentation":
-                # Set up the dataloader for penalty calculation
-                from GANDLF.data.ImagesFromDataFrame import ImagesFromDataFrame
-
-                penalty_data = ImagesFromDataFrame(
-                    training_df, parameters=params, train=False, loader_type="penalty"
-                )
-
-                penalty_loader = DataLoader(
-                    penalty_data, batch_size=1, shuffle=True, pin_memory=False
-                )
-
                 (
                     penalty_weights,
                     sampling_weights,
                     class_weights,
-                ) = get_class_imbalance_weights_segmentation(penalty_loader, params)
-                del penalty_data, penalty_loader
+                ) = get_class_imbalance_weights_segmentation(training_df, params)
         else:
             print("Using weights from config file")
 
@@ -533,7 +587,34 @@ def get_output_from_calculator(
     Returns:
         float: The output from the calculator.
     """
-    temp_output = calculator(prediction, target)
+    return _get_output_from_metric_tensor(calculator(prediction, target))
+
+
+def get_accumulated_output_from_calculator(
+    calculator: torchmetrics.Metric,
+) -> Union[float, list]:
+    """
+    Helper function to get the output of a calculator over all of its updates.
+
+    Args:
+        calculator (torchmetrics.Metric): The calculator to use.
+
+    Returns:
+        float: The output from the calculator.
+    """
+    return _get_output_from_metric_tensor(calculator.compute())
+
+
+def _get_output_from_metric_tensor(temp_output: torch.Tensor) -> Union[float, list]:
+    """
+    Helper function to convert the output of a calculator to python types.
+
+    Args:
+        temp_output (torch.Tensor): The output of the calculator.
+
+    Returns:
+        float: The converted output.
+    """
     if temp_output.dim() > 0:
         temp_output = temp_output.cpu().tolist()
     else:
@@ -1,7 +1,7 @@
 import os
 import pathlib
 import sys
-from typing import Optional, Tuple, Union
+from typing import Any, List, Optional, Sequence, Tuple, Union
 
 import pandas as pd
 
@@ -224,3 +224,116 @@ def convert_relative_paths_in_dataframe(
                                 start_path.joinpath(this_path)
                             )
     return input_dataframe
+
+
+class PredictionsWriter:
+    """
+    Buffered writer of prediction rows, which appends the rows to the output file in chunks as they are produced, so that the rows written before an interruption are kept.
+
+    The output can be a CSV file ("csv"), or a columnar Parquet ("parquet") or Arrow IPC stream ("arrow") file, which require pyarrow. Each chunk of a Parquet file is a row group, and the file is only readable once it is closed; an Arrow IPC stream is readable up to the last chunk. Columnar files are only created once the first chunk is written, since the types of the columns are inferred from it.
+    """
+
+    def __init__(
+        self,
+        output_file: str,
+        columns: List[str],
+        output_format: Optional[str] = "csv",
+        chunk_size: Optional[int] = 10000,
+    ):
+        """
+        Args:
+            output_file (str): The path to the output file, which is overwritten.
+            columns (List[str]): The names of the columns.
+            output_format (Optional[str], optional): The format of the output file, one of "csv", "parquet" or "arrow". Defaults to "csv".
+            chunk_size (Optional[int], optional): The number of rows buffered before they are appended to the file. Defaults to 10000.
+        """
+        assert output_format in [
+            "csv",
+            "parquet",
+            "arrow",
+        ], f"The output format of the predictions is not recognized: {output_format}"
+        self.output_file = output_file
+        self.columns = list(columns)
+        self.output_format = output_format
+        self.chunk_size = chunk_size
+        self._rows = []
+        self._writer = None
+        if output_format == "csv":
+            self._file = open(output_file, "w")
+            self._file.write(",".join(self.columns) + "\n")
+            self._file.flush()
+        else:
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ImportError(
+                    "pyarrow is required to write the predictions as " + output_format
+                )
+
+    def write_row(self, row: Sequence[Any]) -> None:
+        """
+        This function adds a row, which is written once the chunk is full.
+
+        Args:
+            row (Sequence[Any]): The values of the row, in the order of the columns.
+        """
+        self._rows.append(row)
+        if len(self._rows) >= self.chunk_size:
+            self.flush()
+
+    def write_rows(self, rows: Sequence[Sequence[Any]]) -> None:
+        """
+        This function adds several rows, which are written once the chunk is full.
+
+        Args:
+            rows (Sequence[Sequence[Any]]): The rows, each with the values in the order of the columns.
+        """
+        for row in rows:
+            self.write_row(row)
+
+    def flush(self) -> None:
+        """
+        This function appends the buffered rows to the file.
+        """
+        if not self._rows:
+            return
+        if self.output_format == "csv":
+            self._file.write(
+                "".join(
+                    ",".join(str(value) for value in row) + "\n" for row in self._rows
+                )
+            )
+            self._file.flush()
+        else:
+            import pyarrow as pa
+
+            table = pa.Table.from_pydict(
+                dict(zip(self.columns, map(list, zip(*self._rows))))
+            )
+            if self._writer is None:
+                # the types of the columns are inferred from the first chunk
+                self._schema = table.schema
+                if self.output_format == "parquet":
+                    import pyarrow.parquet as pq
+
+                    self._writer = pq.ParquetWriter(self.output_file, self._schema)
+                else:
+                    self._writer = pa.ipc.new_stream(self.output_file, self._schema)
+            self._writer.write_table(table.cast(self._schema))
+        self._rows = []
+
+    def close(self) -> None:
+        """
+        This function writes the remaining rows and closes the file.
+        """
+        self.flush()
+        if self.output_format == "csv":
+            self._file.close()
+        elif self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self) -> "PredictionsWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -0,0 +1,125 @@
+from typing import List, Optional, Tuple, Union
+import os
+import numpy as np
+import SimpleITK as sitk
+import torchio
+
+# zarr (and numcodecs) are only imported when Zarr arrays are used, so that importing GANDLF.utils does not depend on them
+
+
+def is_zarr_array(path: str) -> bool:
+    """
+    This function checks if a path points to a Zarr array stored as a directory.
+
+    Args:
+        path (str): The path to check.
+
+    Returns:
+        bool: True if the path is a Zarr array.
+    """
+    return os.path.isfile(os.path.join(str(path), ".zarray"))
+
+
+def write_image_to_zarr(
+    image: sitk.Image, zarr_file: str, name: str, chunk_size: Optional[int] = 64
+) -> str:
+    """
+    This function writes an image as a chunked and compressed array into a Zarr group, along with its geometry.
+
+    Args:
+        image (sitk.Image): The image to write.
+        zarr_file (str): The Zarr group of the subject, which is created if it does not exist.
+        name (str): The name of the array in the group.
+        chunk_size (Optional[int], optional): The size of the chunks along each spatial axis. Defaults to 64.
+
+    Returns:
+        str: The path to the array, which can be used in place of an image file.
+    """
+    import zarr
+    from numcodecs import Blosc
+
+    # bit-shuffling works well for both intensities and labels
+    compressor = Blosc(cname="zstd", clevel=3, shuffle=Blosc.BITSHUFFLE)
+    # use the same (C, W, H, D) layout as torchio so that arrays can be read without transposing
+    tio_image = torchio.ScalarImage.from_sitk(image)
+    array = tio_image.numpy()
+    chunks = (array.shape[0],) + tuple(
+        min(chunk_size, shape) for shape in array.shape[1:]
+    )
+    group = zarr.open_group(zarr_file, mode="a")
+    zarr_array = group.create_dataset(
+        name, data=array, chunks=chunks, compressor=compressor, overwrite=True
+    )
+    zarr_array.attrs.update(
+        {
+            "affine": tio_image.affine.tolist(),
+            "dimension": image.GetDimension(),
+            "size": list(image.GetSize()),
+            "spacing": list(image.GetSpacing()),
+            "origin": list(image.GetOrigin()),
+            "direction": list(image.GetDirection()),
+        }
+    )
+    return os.path.join(zarr_file, name)
+
+
+def get_zarr_header(path: str) -> dict:
+    """
+    This function returns the header of an image stored as a Zarr array without reading any chunks.
+
+    Args:
+        path (str): The path to the Zarr array.
+
+    Returns:
+        dict: The "dimension", "size", "spacing", "origin" and "direction" of the image, along with the "affine" and "shape" of the array.
+    """
+    import zarr
+
+    zarr_array = zarr.open_array(str(path), mode="r")
+    header = dict(zarr_array.attrs)
+    header["shape"] = list(zarr_array.shape)
+    return header
+
+
+def read_zarr_image(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    This function reads a full image stored as a Zarr array, and can be used as a reader for torchio images.
+
+    Args:
+        path (str): The path to the Zarr array.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The (C, W, H, D) array and the affine matrix.
+    """
+    import zarr
+
+    zarr_array = zarr.open_array(str(path), mode="r")
+    return zarr_array[...], np.array(zarr_array.attrs["affine"])
+
+
+def read_zarr_region(
+    path: str,
+    index_ini: Union[List[int], np.ndarray],
+    index_fin: Union[List[int], np.ndarray],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    This function reads a region of an image stored as a Zarr array, so that only the chunks touched by the region are read and decompressed.
+
+    Args:
+        path (str): The path to the Zarr array.
+        index_ini (Union[List[int], np.ndarray]): The first voxel index of the region along each spatial axis.
+        index_fin (Union[List[int], np.ndarray]): The voxel index after the end of the region along each spatial axis.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The (C, W, H, D) array of the region and its affine matrix.
+    """
+    import zarr
+
+    zarr_array = zarr.open_array(str(path), mode="r")
+    region = (slice(None),) + tuple(
+        slice(int(start), int(end)) for start, end in zip(index_ini, index_fin)
+    )
+    affine = np.array(zarr_array.attrs["affine"])
+    # shift the origin to the first voxel of the region
+    affine[:3, 3] = affine[:3, :3] @ np.asarray(index_ini, dtype=float) + affine[:3, 3]
+    return zarr_array[region], affine
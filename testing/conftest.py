@@ -1,4 +1,11 @@
-import os, pathlib, pytest
+import os, pathlib, pytest, sys
+
+# `python -m pytest` run from this directory puts it on sys.path, where the local
+# `entrypoints` test package shadows the PyPI one that numcodecs (zarr) imports
+_testing_dir = pathlib.Path(__file__).parent.resolve()
+sys.path[:] = [
+    path for path in sys.path if pathlib.Path(path or ".").resolve() != _testing_dir
+]
 
 from click.testing import CliRunner
 from pytest import fixture
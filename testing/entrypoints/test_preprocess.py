@@ -43,6 +43,7 @@ test_cases = [
             "label_pad_mode": "constant",
             "applyaugs": True,
             "apply_zero_crop": True,
+            "output_zarr": False,
         },
     ),
     CliCase(
@@ -64,6 +65,7 @@ test_cases = [
             "label_pad_mode": "constant",
             "applyaugs": False,
             "apply_zero_crop": False,
+            "output_zarr": False,
         },
     ),
     CliCase(
@@ -80,6 +82,7 @@ test_cases = [
             "label_pad_mode": "mean",
             "applyaugs": False,
             "apply_zero_crop": False,
+            "output_zarr": False,
         },
     ),
     CliCase(
@@ -96,6 +99,24 @@ test_cases = [
             "label_pad_mode": "constant",
             "applyaugs": False,
             "apply_zero_crop": False,
+            "output_zarr": False,
+        },
+    ),
+    CliCase(
+        should_succeed=True,
+        new_way_lines=[
+            # tests --output-zarr
+            "-c config.yaml -i input.csv -o output/ --output-zarr"
+        ],
+        old_way_lines=[],
+        expected_args={
+            "config_file": "config.yaml",
+            "data_csv": "input.csv",
+            "output_dir": "output/",
+            "label_pad_mode": "constant",
+            "applyaugs": False,
+            "apply_zero_crop": False,
+            "output_zarr": True,
         },
     ),
     CliCase(
@@ -1,6 +1,7 @@
 from pathlib import Path
-import gdown, zipfile, os, csv, random, copy, shutil, yaml, torch, pytest
+import gdown, zipfile, os, csv, random, copy, shutil, yaml, torch, pytest, json
 import SimpleITK as sitk
+import torchio
 import numpy as np
 import pandas as pd
 import logging
@@ -9,6 +10,9 @@ from pydicom.data import get_testdata_file
 import cv2
 
 from GANDLF.data.ImagesFromDataFrame import ImagesFromDataFrame
+from GANDLF.data import get_validation_loader
+from GANDLF.data.subject_cache import InMemorySubjectsDataset
+from GANDLF.data.zarr_images import ZarrScalarImage, UniformSampler
 from GANDLF.utils import *
 from GANDLF.utils import parseTestingCSV, get_tensor_from_image
 from GANDLF.data.preprocessing import global_preprocessing_dict
@@ -2218,6 +2222,8 @@ def test_train_inference_segmentation_histology_2d(device):
         inputDir + "/train_2d_histo_segmentation.csv", train=False
     )
     inference_data.drop(index=inference_data.index[-1], axis=0, inplace=True)
+    # pass several patches of a slide through the model together
+    parameters["histopath_batch_size"] = 4
     InferenceManager(
         dataframe=inference_data,
         modelDir=modelDir,
@@ -3108,6 +3114,38 @@ def test_generic_cli_function_metrics_cli_rad_nd():
             assert os.path.isfile(
                 output_file
             ), "Metrics output file was not generated for single-csv input"
+            if problem_type != "classification":
+                with open(output_file) as file:
+                    expected_metrics = json.load(file)
+                assert list(expected_metrics.keys()) == list(
+                    training_data["SubjectID"].astype(str)
+                ), "Metrics output file does not contain all subjects"
+
+                # the output of the completed subjects is valid if a later subject fails
+                failing_data = training_data.copy()
+                failing_data.loc[failing_data.index[-1], "prediction"] = os.path.join(
+                    outputDir, "missing.nii.gz"
+                )
+                failing_data.to_csv(temp_infer_csv, index=False)
+                with pytest.raises(Exception):
+                    generate_metrics_dict(temp_infer_csv, temp_config, output_file)
+                with open(output_file) as file:
+                    output_metrics = json.load(file)
+                assert list(output_metrics.keys()) == list(
+                    training_data["SubjectID"].astype(str)[:-1]
+                ), "Metrics output file is not valid after a failed subject"
+
+                # the subjects processed in parallel give the same output
+                training_data.to_csv(temp_infer_csv, index=False)
+                parallel_parameters = copy.deepcopy(parameters)
+                parallel_parameters["metrics_num_workers"] = 2
+                generate_metrics_dict(
+                    temp_infer_csv,
+                    write_temp_config_path(parallel_parameters),
+                    output_file,
+                )
+                with open(output_file) as file:
+                    assert json.load(file) == expected_metrics
 
             # # comma-separated input
             temp_infer_csv_gt = os.path.join(outputDir, "temp_csv_gt.csv")
@@ -3417,3 +3455,1483 @@ def test_differential_privacy_simple_classification_rad_2d(device):
     sanitize_outputDir()
 
     print("passed")
+
+
+def test_generic_preprocessing_cache():
+    print("56: Starting test for the preprocessed subject cache")
+    sanitize_outputDir()
+    parameters = ConfigManager(
+        testingDir + "/config_segmentation.yaml", version_check_flag=False
+    )
+    training_data, parameters["headers"] = parseTrainingCSV(
+        inputDir + "/train_2d_rad_segmentation.csv"
+    )
+    parameters["patch_size"] = patch_size["2D"]
+    parameters["model"]["dimension"] = 2
+    parameters["data_preprocessing"] = {"normalize": None}
+    dataset_uncached = ImagesFromDataFrame(
+        training_data.copy(), parameters, False, loader_type="cache_test"
+    )
+
+    # first pass populates the cache, second pass reads from it
+    parameters["preprocessing_cache_dir"] = os.path.join(outputDir, "cache")
+    _ = ImagesFromDataFrame(
+        training_data.copy(), parameters, False, loader_type="cache_test"
+    )
+    assert len(os.listdir(parameters["preprocessing_cache_dir"])) == len(
+        training_data
+    ), "cache was not populated"
+    dataset_cached = ImagesFromDataFrame(
+        training_data.copy(), parameters, False, loader_type="cache_test"
+    )
+    assert len(dataset_cached) == len(dataset_uncached)
+    for subject_uncached, subject_cached in zip(dataset_uncached, dataset_cached):
+        for key in parameters["headers"]["channelHeaders"] + ["label"]:
+            key = str(key)
+            assert torch.equal(
+                subject_uncached[key][torchio.DATA], subject_cached[key][torchio.DATA]
+            ), "cached subject differs from uncached subject"
+
+    # changing the preprocessing configuration should invalidate the cache
+    parameters["data_preprocessing"] = {"normalize_nonZero": None}
+    _ = ImagesFromDataFrame(
+        training_data.copy(), parameters, False, loader_type="cache_test"
+    )
+    assert len(os.listdir(parameters["preprocessing_cache_dir"])) == 2 * len(
+        training_data
+    ), "cache was not invalidated"
+
+    # with augmentations, only the loaded subjects are cached, and the normalization is still applied after the augmentations
+    parameters["data_augmentation"] = {"gamma": {"probability": 1}}
+    for _ in range(2):
+        patches_queue = ImagesFromDataFrame(
+            training_data.copy(), parameters, True, loader_type="cache_test"
+        )
+        transforms = patches_queue.subjects_dataset._transform.transforms
+        assert len(transforms) == 2
+        assert isinstance(transforms[0], torchio.transforms.RandomGamma)
+    assert len(os.listdir(parameters["preprocessing_cache_dir"])) == 3 * len(
+        training_data
+    ), "cache was not populated with the loaded subjects"
+    parameters["data_augmentation"] = {}
+
+    # subjects that fail the sanity check are not cached
+    faulty_label = os.path.join(outputDir, "faulty_label.nii.gz")
+    label_image = sitk.ReadImage(training_data.iloc[0, -1])
+    label_image.SetOrigin([origin - 5 for origin in label_image.GetOrigin()])
+    sitk.WriteImage(label_image, faulty_label)
+    faulty_data = training_data.iloc[:1].copy()
+    faulty_data.iloc[0, -1] = faulty_label
+    parameters["data_preprocessing"] = {"normalize_standardize": None}
+    dataset_faulty = ImagesFromDataFrame(
+        faulty_data.copy(), parameters, False, loader_type="cache_test"
+    )
+    assert len(os.listdir(parameters["preprocessing_cache_dir"])) == 3 * len(
+        training_data
+    ), "subject that failed the sanity check was cached"
+    # subjects that are not cached are still preprocessed
+    parameters["preprocessing_cache_dir"] = None
+    dataset_faulty_uncached = ImagesFromDataFrame(
+        faulty_data.copy(), parameters, False, loader_type="cache_test"
+    )
+    assert torch.equal(
+        dataset_faulty[0]["1"].data, dataset_faulty_uncached[0]["1"].data
+    )
+
+    sanitize_outputDir()
+
+    print("passed")
+
+
+def test_generic_parallel_subject_construction():
+    print("57: Starting test for parallel subject construction")
+    parameters = ConfigManager(
+        testingDir + "/config_segmentation.yaml", version_check_flag=False
+    )
+    training_data, parameters["headers"] = parseTrainingCSV(
+        inputDir + "/train_2d_rad_segmentation.csv"
+    )
+    parameters["patch_size"] = patch_size["2D"]
+    parameters["model"]["dimension"] = 2
+
+    dataset_serial = ImagesFromDataFrame(
+        training_data.copy(), parameters, False, loader_type="parallel_test"
+    )
+    subject_ids_serial = [
+        subject["subject_id"] for subject in dataset_serial.dry_iter()
+    ]
+    parameters["subject_construction_workers"] = 2
+    for backend in ["thread", "process"]:
+        parameters["subject_construction_backend"] = backend
+        dataset_parallel = ImagesFromDataFrame(
+            training_data.copy(), parameters, False, loader_type="parallel_test"
+        )
+        subject_ids_parallel = [
+            subject["subject_id"] for subject in dataset_parallel.dry_iter()
+        ]
+        assert (
+            subject_ids_serial == subject_ids_parallel
+        ), f"order of subjects is not preserved for '{backend}' backend"
+
+    sanitize_outputDir()
+
+    print("passed")
+
+
+def test_generic_header_index():
+    print("58: Starting test for the persistent image header index")
+    sanitize_outputDir()
+    parameters = ConfigManager(
+        testingDir + "/config_segmentation.yaml", version_check_flag=False
+    )
+    data_csv = inputDir + "/train_3d_rad_segmentation.csv"
+    training_data, parameters["headers"] = parseTrainingCSV(data_csv)
+    parameters["patch_size"] = patch_size["3D"]
+    parameters["model"]["dimension"] = 3
+    parameters["header_index_file"] = os.path.join(outputDir, "header_index.sqlite")
+
+    header_index = ImageHeaderIndex(parameters["header_index_file"])
+    image_file = training_data.iloc[0, parameters["headers"]["channelHeaders"][0]]
+    header = header_index.get_header(image_file)
+    file_reader = sitk.ImageFileReader()
+    file_reader.SetFileName(image_file)
+    file_reader.ReadImageInformation()
+    assert header["spacing"] == list(file_reader.GetSpacing()), "spacing mismatch"
+    assert header["size"] == list(file_reader.GetSize()), "size mismatch"
+
+    # subjects are only marked as consistent after the first check
+    dataset = ImagesFromDataFrame(
+        training_data.copy(), parameters, False, loader_type="index_test"
+    )
+    for subject in dataset.dry_iter():
+        files = [
+            subject[str(key)]["path"]
+            for key in parameters["headers"]["channelHeaders"] + ["label"]
+        ]
+        assert header_index.is_consistent(files), "subject not marked as consistent"
+
+    # headers are re-read when the file changes
+    temp_file = os.path.join(outputDir, "temp_image.nii.gz")
+    shutil.copyfile(image_file, temp_file)
+    _ = header_index.get_header(temp_file)
+    sitk.WriteImage(
+        sitk.Image([5, 5, 5], sitk.sitkUInt8), temp_file, useCompression=True
+    )
+    assert header_index.get_header(temp_file)["size"] == [5, 5, 5]
+
+    sanitize_outputDir()
+
+    print("passed")
+
+
+def test_generic_batched_inference(device):
+    print("59: Starting test for batched patch inference")
+    parameters = ConfigManager(
+        testingDir + "/config_segmentation.yaml", version_check_flag=False
+    )
+    training_data, parameters["headers"] = parseTrainingCSV(
+        inputDir + "/train_3d_rad_segmentation.csv"
+    )
+    parameters["modality"] = "rad"
+    parameters["patch_size"] = patch_size["3D"]
+    parameters["model"]["dimension"] = 3
+    parameters["model"]["class_list"] = [0, 1]
+    parameters["model"]["num_channels"] = len(parameters["headers"]["channelHeaders"])
+    parameters["model"]["onnx_export"] = False
+    parameters["model"]["print_summary"] = False
+    parameters["model"]["architecture"] = "unet"
+    parameters["inference_mechanism"]["patch_overlap"] = 16
+    parameters["inference_mechanism"]["batch_size"] = 4
+    parameters["inference_mechanism"]["num_workers"] = 1
+    parameters["nested_training"]["testing"] = -5
+    parameters["nested_training"]["validation"] = -5
+    parameters = populate_header_in_parameters(parameters, parameters["headers"])
+    sanitize_outputDir()
+    TrainingManager(
+        dataframe=training_data,
+        outputDir=outputDir,
+        parameters=parameters,
+        device=device,
+        resume=False,
+        reset=True,
+    )
+
+    parameters = ConfigManager(
+        testingDir + "/config_classification.yaml", version_check_flag=False
+    )
+    training_data, parameters["headers"] = parseTrainingCSV(
+        inputDir + "/train_2d_rad_classification.csv"
+    )
+    parameters["modality"] = "rad"
+    parameters["patch_size"] = patch_size["2D"]
+    parameters["model"]["dimension"] = 2
+    parameters["model"]["num_channels"] = 3
+    parameters["model"]["onnx_export"] = False
+    parameters["model"]["print_summary"] = False
+    parameters["model"]["architecture"] = "densenet121"
+    parameters["inference_mechanism"]["batch_size"] = 3
+    parameters["nested_training"]["testing"] = -5
+    parameters["nested_training"]["validation"] = -5
+    parameters = populate_header_in_parameters(parameters, parameters["headers"])
+    sanitize_outputDir()
+    TrainingManager(
+        dataframe=training_data,
+        outputDir=outputDir,
+        parameters=parameters,
+        device=device,
+        resume=False,
+        reset=True,
+    )
+
+    sanitize_outputDir()
+
+    print("passed")
+
+
+def test_generic_evaluation_loader_workers():
+    print("60: Starting test for worker-parallel validation loader")
+    parameters = ConfigManager(
+        testingDir + "/config_segmentation.yaml", version_check_flag=False
+    )
+    training_data, parameters["headers"] = parseTrainingCSV(
+        inputDir + "/train_2d_rad_segmentation.csv"
+    )
+    parameters["patch_size"] = patch_size["2D"]
+    parameters["model"]["dimension"] = 2
+    parameters["validation_data"] = training_data
+
+    subject_ids_serial = [
+        subject["subject_id"][0] for subject in get_validation_loader(parameters)
+    ]
+    parameters["eval_num_workers"] = 2
+    parameters["eval_prefetch_factor"] = 1
+    parameters["eval_persistent_workers"] = True
+    val_loader = get_validation_loader(parameters)
+    assert val_loader.num_workers == 2, "workers were not used"
+    # persistent workers are re-used across epochs and the order is preserved
+    for _ in range(2):
+        subject_ids_parallel = [subject["subject_id"][0] for subject in val_loader]
+        assert subject_ids_serial == subject_ids_parallel, "order of subjects changed"
+
+    sanitize_outputDir()
+
+    print("passed")
+
+
+def test_generic_validation_subject_memory_cache():
+    print("61: Starting test for in-memory validation subject cache")
+    parameters = ConfigManager(
+        testingDir + "/config_segmentation.yaml", version_check_flag=False
+    )
+    training_data, parameters["headers"] = parseTrainingCSV(
+        inputDir + "/train_2d_rad_segmentation.csv"
+    )
+    parameters["patch_size"] = patch_size["2D"]
+    parameters["model"]["dimension"] = 2
+    dataset = ImagesFromDataFrame(
+        training_data, parameters, False, loader_type="cache_test"
+    )
+    subject_size = InMemorySubjectsDataset._get_subject_size(dataset[0])
+
+    # budget for exactly two subjects
+    cached_dataset = InMemorySubjectsDataset(dataset, 2 * subject_size)
+    assert len(cached_dataset) == len(dataset), "length mismatch"
+    first_subject = cached_dataset[0]
+    assert cached_dataset[0] is first_subject, "subject was not re-used"
+    assert torch.equal(first_subject["1"].data, dataset[0]["1"].data)
+    _, _ = cached_dataset[1], cached_dataset[0]
+    # the least recently used subject is evicted
+    _ = cached_dataset[2]
+    assert list(cached_dataset._cache.keys()) == [0, 2], "incorrect eviction"
+    assert cached_dataset.memory_used <= cached_dataset.memory_budget
+
+    # subjects larger than the budget are not cached
+    cached_dataset = InMemorySubjectsDataset(dataset, subject_size - 1)
+    _ = cached_dataset[0]
+    assert len(cached_dataset._cache) == 0, "subject larger than budget was cached"
+
+    parameters["validation_data"] = training_data
+    parameters["validation_cache_memory_gb"] = 1
+    val_loader = get_validation_loader(parameters)
+    assert isinstance(val_loader.dataset, InMemorySubjectsDataset)
+    for _ in range(2):
+        for _ in val_loader:
+            pass
+
+    sanitize_outputDir()
+
+    print("passed")
+
+
+def test_generic_shared_memory_subjects():
+    print("62: Starting test for shared-memory in_memory mode")
+    from GANDLF.data.subject_cache import SharedMemorySubjectsDataset
+
+    parameters = ConfigManager(
+        testingDir + "/config_segmentation.yaml", version_check_flag=False
+    )
+    training_data, parameters["headers"] = parseTrainingCSV(
+        inputDir + "/train_2d_rad_segmentation.csv"
+    )
+    parameters["patch_size"] = patch_size["2D"]
+    parameters["model"]["dimension"] = 2
+    parameters["in_memory"] = "shared"
+    parameters["q_num_workers"] = 2
+    queue = ImagesFromDataFrame(
+        training_data, parameters, True, loader_type="shared_test"
+    )
+    subjects_dataset = queue.subjects_dataset
+    assert isinstance(subjects_dataset, SharedMemorySubjectsDataset)
+    subjects = subjects_dataset._subjects
+    for subject in subjects:
+        for image in subject.get_images(intensity_only=False):
+            assert image.data.is_shared(), "image is not in shared memory"
+
+    # the subjects are not copied when they are accessed, and the transforms do not modify the shared tensors
+    original_data = subjects[0]["1"].data
+    expected_data = original_data.clone()
+    assert (
+        SharedMemorySubjectsDataset(subjects)[0]["1"].data.data_ptr()
+        == original_data.data_ptr()
+    ), "subject was copied"
+    _ = subjects_dataset[0]
+    assert torch.equal(subjects[0]["1"].data, expected_data), "shared data modified"
+
+    # the workers read the shared tensors as well
+    def check_shared(subject):
+        subject["shared"] = all(
+            image.data.is_shared() for image in subject.get_images(intensity_only=False)
+        )
+        return subject
+
+    loader = torch.utils.data.DataLoader(
+        SharedMemorySubjectsDataset(subjects, transform=check_shared),
+        batch_size=2,
+        num_workers=2,
+        multiprocessing_context="fork",
+        collate_fn=lambda batch: [subject["shared"] for subject in batch],
+    )
+    assert all(shared for batch in loader for shared in batch)
+
+    # the queue workers are able to sample patches from the shared subjects
+    patch = next(iter(torch.utils.data.DataLoader(queue, batch_size=1)))
+    assert patch["1"][torchio.DATA].shape[0] == 1, "patch was not sampled"
+
+    sanitize_outputDir()
+
+    print("passed")
+
+
+def test_generic_preprocess_zarr_output(device):
+    print("63: Starting test for Zarr output of preprocessing")
+    sanitize_outputDir()
+    parameters = ConfigManager(
+        testingDir + "/config_segmentation.yaml", version_check_flag=False
+    )
+    parameters["modality"] = "rad"
+    parameters["patch_size"] = patch_size["3D"]
+    parameters["model"]["dimension"] = 3
+    parameters["model"]["class_list"] = [0, 1]
+    parameters["model"]["architecture"] = "unet"
+    parameters["model"]["onnx_export"] = False
+    parameters["model"]["print_summary"] = False
+    parameters["data_preprocessing"] = {}
+    file_config_temp = write_temp_config_path(parameters)
+    input_csv = inputDir + "/train_3d_rad_segmentation.csv"
+
+    preprocess_and_save(input_csv, file_config_temp, outputDir, output_zarr=True)
+    training_data, parameters["headers"] = parseTrainingCSV(
+        outputDir + "/data_processed.csv"
+    )
+    input_data, input_headers = parseTrainingCSV(input_csv, train=False)
+    assert len(training_data) == len(input_data), "number of subjects changed"
+
+    # each subject points to its own arrays, which hold the same data and geometry as the input
+    first_row = training_data.iloc[0]
+    zarr_file = first_row.iloc[parameters["headers"]["channelHeaders"][0]]
+    assert is_zarr_array(zarr_file), "output is not a Zarr array"
+    assert len(
+        set(training_data.iloc[:, parameters["headers"]["channelHeaders"][0]])
+    ) == len(training_data), "subjects share the same output"
+    subject_id = str(first_row.iloc[parameters["headers"]["subjectIDHeader"]])
+    input_row = input_data[
+        input_data.iloc[:, input_headers["subjectIDHeader"]].astype(str) == subject_id
+    ].iloc[0]
+    input_image = torchio.ScalarImage(
+        input_row.iloc[input_headers["channelHeaders"][0]]
+    )
+    zarr_image = ZarrScalarImage(zarr_file)
+    assert zarr_image.shape == input_image.shape, "shape mismatch"
+    assert np.allclose(zarr_image.affine, input_image.affine), "affine mismatch"
+    assert torch.equal(zarr_image.data, input_image.data), "data mismatch"
+
+    # patches only read the region they touch, and match the full image
+    zarr_image = ZarrScalarImage(zarr_file)
+    subject = torchio.Subject({"1": zarr_image})
+    for patch in UniformSampler(patch_size["3D"])(subject, num_patches=2):
+        assert zarr_image.is_lazy, "full image was read"
+        i0, j0, k0, i1, j1, k1 = patch[torchio.LOCATION].tolist()
+        assert torch.equal(
+            patch["1"].data, input_image.data[:, i0:i1, j0:j1, k0:k1]
+        ), "patch mismatch"
+
+    parameters["model"]["num_channels"] = len(parameters["headers"]["channelHeaders"])
+    parameters = populate_header_in_parameters(parameters, parameters["headers"])
+    parameters["nested_training"]["testing"] = -5
+    parameters["nested_training"]["validation"] = -5
+    parameters["save_output"] = True
+    training_output_dir = os.path.join(outputDir, "training")
+    Path(training_output_dir).mkdir(parents=True, exist_ok=True)
+    TrainingManager(
+        dataframe=training_data,
+        outputDir=training_output_dir,
+        parameters=parameters,
+        device=device,
+        resume=False,
+        reset=True,
+    )
+    # the outputs of Zarr inputs are written as NIfTI
+    assert list(
+        Path(training_output_dir).rglob("*_seg.nii.gz")
+    ), "segmentation outputs were not written"
+
+    sanitize_outputDir()
+
+    print("passed")
+
+
+def test_generic_memory_save_mode_resize_cache():
+    print("64: Starting test for re-using resized images in memory_save_mode")
+    sanitize_outputDir()
+    parameters = ConfigManager(
+        testingDir + "/config_segmentation.yaml", version_check_flag=False
+    )
+    parameters["modality"] = "rad"
+    parameters["patch_size"] = patch_size["2D"]
+    parameters["model"]["dimension"] = 2
+    parameters["model"]["class_list"] = [0, 255]
+    parameters["data_preprocessing"] = {"resize_image": [64, 64]}
+    parameters["memory_save_mode"] = True
+    parameters["output_dir"] = outputDir
+    training_data, parameters["headers"] = parseTrainingCSV(
+        inputDir + "/train_2d_rad_segmentation.csv"
+    )
+    parameters = populate_header_in_parameters(parameters, parameters["headers"])
+
+    # the subjects are read from the resized files
+    data_loader = ImagesFromDataFrame(training_data, parameters, False, "unit_test")
+    resized_images_dir = os.path.join(outputDir, "resized_images")
+    resized_files = sorted(os.listdir(resized_images_dir))
+    assert len(resized_files) == 2 * len(training_data), "resized images not cached"
+    for subject in data_loader.dry_iter():
+        for key in ["1", "label"]:
+            assert (
+                os.path.dirname(str(subject[key].path)) == resized_images_dir
+            ), "subject is not read from the resized image"
+            assert subject[key].shape[1:3] == (64, 64), "image was not resized"
+        assert set(subject["label"].data.unique().tolist()).issubset(
+            {0, 255}
+        ), "label was interpolated"
+    file_times = {
+        file: os.path.getmtime(os.path.join(resized_images_dir, file))
+        for file in resized_files
+    }
+
+    # another loader, such as for validation, re-uses the cached images
+    _ = ImagesFromDataFrame(training_data, parameters, False, "validation")
+    assert sorted(os.listdir(resized_images_dir)) == resized_files, "cache changed"
+    for file, file_time in file_times.items():
+        assert (
+            os.path.getmtime(os.path.join(resized_images_dir, file)) == file_time
+        ), "resized image was written again"
+
+    # a different target size is cached separately
+    parameters["data_preprocessing"]["resize_image"] = [32, 32]
+    _ = ImagesFromDataFrame(training_data, parameters, False, "unit_test")
+    assert len(os.listdir(resized_images_dir)) == 4 * len(
+        training_data
+    ), "resized images for the new size not cached"
+
+    sanitize_outputDir()
+
+    print("passed")
+
+
+def test_generic_one_hot_parity():
+    print("65: Starting one hot parity tests")
+
+    # the previous implementations, which loop over the batch and the classes
+    def one_hot_reference(segmask_tensor, class_list):
+        batch_stack = torch.zeros(
+            (segmask_tensor.shape[0], len(class_list)) + segmask_tensor.shape[2:],
+            dtype=torch.float32,
+        )
+        for b in range(segmask_tensor.shape[0]):
+            segmask_array_iter = segmask_tensor[b, 0, ...]
+            for class_idx, _class in enumerate(class_list):
+                if isinstance(_class, str) and "||" in _class:
+                    special_class_split = _class.split("||")
+                    bin_mask = segmask_array_iter == int(special_class_split[0])
+                    for i in range(1, len(special_class_split)):
+                        bin_mask = torch.logical_or(
+                            bin_mask,
+                            (segmask_array_iter == int(special_class_split[i])),
+                        )
+                else:
+                    bin_mask = segmask_array_iter == int(_class)
+                batch_stack[b, class_idx, ...] = bin_mask.long()
+        return batch_stack
+
+    def reverse_one_hot_reference(predmask_tensor, class_list):
+        predmask_array = predmask_tensor.numpy()
+        special_case_detected = any(
+            isinstance(_class, str) and "||" in _class for _class in class_list
+        )
+        zero_present = any((_class == "0") or (_class == 0) for _class in class_list)
+        final_mask = np.zeros(predmask_array[0, ...].shape).astype(np.int16)
+        for idx, i in enumerate(class_list):
+            output_value = i
+            if special_case_detected:
+                output_value = idx if zero_present else idx + 1
+            final_mask[predmask_array[idx, ...] >= 0.5] = output_value
+        return final_mask
+
+    class_lists = [
+        [0, 1, 2, 3, 4],
+        ["0", "1", "4"],
+        ["0", "1||2||3", 4],
+        [0, "1||2", "2", "3||0"],
+        ["1||2||3", 4],
+        [-1, 1, 255],
+    ]
+    # labels also contain values outside the classes and non-integer values
+    label_values = np.array([-1, 0, 1, 2, 3, 4, 7, 255, 0.5])
+    for shape in [(2, 1, 16, 16), (2, 1, 8, 8, 8)]:
+        for dtype in [torch.float32, torch.float16, torch.int64]:
+            segmask = torch.from_numpy(np.random.choice(label_values, size=shape))
+            segmask = segmask.to(dtype)
+            for class_list in class_lists:
+                segmask_oh = one_hot(segmask, class_list)
+                assert segmask_oh.dtype == torch.float32, "dtype mismatch"
+                assert torch.equal(
+                    segmask_oh, one_hot_reference(segmask, class_list)
+                ), "one_hot mismatch for {}".format(class_list)
+
+    for shape in [(16, 16), (8, 8, 8)]:
+        for class_list in class_lists:
+            # overlapping predictions, where later classes take precedence
+            predmask = torch.rand((len(class_list),) + shape)
+            predmask_rev = reverse_one_hot(predmask, class_list)
+            expected = reverse_one_hot_reference(predmask, class_list)
+            assert predmask_rev.dtype == np.int16, "dtype mismatch"
+            assert np.array_equal(
+                predmask_rev, expected
+            ), "reverse_one_hot mismatch for {}".format(class_list)
+
+    print("passed")
+
+
+def test_generic_segmentation_class_weights():
+    print("66: Starting test for class imbalance weights of segmentation")
+    sanitize_outputDir()
+    parameters = ConfigManager(
+        testingDir + "/config_segmentation.yaml", version_check_flag=False
+    )
+    training_data, parameters["headers"] = parseTrainingCSV(
+        inputDir + "/train_3d_rad_segmentation.csv"
+    )
+    parameters["problem_type"] = "segmentation"
+    parameters["model"]["class_list"] = [0, "1||2", 1]
+    parameters["header_index_file"] = os.path.join(outputDir, "header_index.sqlite")
+
+    # the counts match the one-hot encoded labels
+    expected_counts = np.zeros(len(parameters["model"]["class_list"]))
+    for label_file in training_data.iloc[:, parameters["headers"]["labelHeader"]]:
+        label = torchio.LabelMap(label_file).data.unsqueeze(0)
+        one_hot_label = one_hot(label, parameters["model"]["class_list"])
+        expected_counts += one_hot_label.sum(dim=(0, 2, 3, 4)).numpy()
+    expected_weights = expected_counts / expected_counts.sum()
+    for workers in [0, 2]:
+        parameters["subject_construction_workers"] = workers
+        _, _, class_weights = get_class_imbalance_weights_segmentation(
+            training_data, parameters
+        )
+        assert np.allclose(
+            list(class_weights.values()), expected_weights
+        ), "class weights mismatch"
+
+    # the histograms are persisted, and only changed labels are counted again
+    header_index = ImageHeaderIndex(parameters["header_index_file"])
+    label_file = training_data.iloc[0, parameters["headers"]["labelHeader"]]
+    assert header_index.get_label_histogram(label_file) is not None
+    temp_file = os.path.join(outputDir, "temp_label.nii.gz")
+    shutil.copyfile(label_file, temp_file)
+    _ = get_label_histogram(temp_file, header_index)
+    sitk.WriteImage(
+        sitk.Image([5, 5, 5], sitk.sitkUInt8), temp_file, useCompression=True
+    )
+    assert header_index.get_label_histogram(temp_file) is None, "stale histogram"
+    assert get_label_histogram(temp_file, header_index) == {0.0: 125}
+
+    sanitize_outputDir()
+
+    print("passed")
+
+
+def test_generic_class_wise_segmentation_losses():
+    print("67: Starting test for class-wise segmentation losses")
+    from GANDLF.losses.segmentation import (
+        generic_loss_calculator,
+        dice,
+        mcc,
+        tversky_loss,
+        MCT_loss,
+        FocalLoss,
+    )
+    from GANDLF.losses.regression import CCE_Generic, CE
+    from GANDLF.losses.segmentation_new import (
+        MulticlassDiceLoss,
+        MulticlassMCCLoss,
+        MulticlassTverskyLoss,
+        MulticlassFocalLoss,
+    )
+
+    class_list = [0, 1, 2, 3]
+    num_classes = len(class_list)
+    params = {
+        "model": {"class_list": class_list},
+        "loss_function": "dc",
+        "penalty_weights": {0: 0.1, 1: 0.2, 2: 0.3, 3: 0.4},
+    }
+    label = torch.randint(0, num_classes, (2, 1, 16, 16, 8)).float()
+    target = one_hot(label, class_list)
+    prediction = torch.softmax(torch.rand(2, num_classes, 16, 16, 8), dim=1)
+
+    # the previous implementations, which compute one class at a time
+    for criteria in [dice, mcc]:
+        for weights, ignore_class in [(None, None), (params["penalty_weights"], 2)]:
+            expected = 0
+            for i in range(num_classes):
+                if i != ignore_class:
+                    class_loss = 1 - criteria(prediction[:, i, ...], target[:, i, ...])
+                    expected += class_loss * (1 if weights is None else weights[i])
+            if weights is None:
+                expected /= num_classes
+            output = generic_loss_calculator(
+                prediction, target, num_classes, criteria, weights, ignore_class, 1
+            )
+            assert torch.allclose(output, expected, atol=1e-5), "loss mismatch"
+
+    expected = sum(
+        tversky_loss(prediction[:, i, ...], target[:, i, ...])
+        * params["penalty_weights"][i]
+        for i in range(num_classes)
+    )
+    assert torch.allclose(MCT_loss(prediction, target, params), expected, atol=1e-5)
+
+    ce_loss = torch.nn.CrossEntropyLoss(reduction="none")
+    expected = sum(
+        ((1 - torch.exp(-loss)) ** 2 * loss).mean() * params["penalty_weights"][i]
+        for i, loss in enumerate(
+            ce_loss(prediction[:, i, ...], target[:, i, ...])
+            for i in range(num_classes)
+        )
+    )
+    assert torch.allclose(FocalLoss(prediction, target, params), expected, atol=1e-5)
+
+    # the hybrid losses use the one-hot encoded target as is
+    expected = sum(
+        CE(prediction[:, i, ...], target[:, i, ...]) * params["penalty_weights"][i]
+        for i in range(num_classes)
+    )
+    assert torch.allclose(CCE_Generic(prediction, target, params, CE), expected)
+
+    # the hybrid losses share the one-hot encoded target and the class statistics between their terms
+    from GANDLF.losses.segmentation import MCD_loss
+    from GANDLF.losses.hybrid import DCCE, DC_Focal
+
+    for hybrid_loss, second_loss in [
+        (DCCE, lambda p, t, params: CCE_Generic(p, t, params, CE)),
+        (DC_Focal, FocalLoss),
+    ]:
+        expected = MCD_loss(prediction, target, params) + second_loss(
+            prediction, target, params
+        )
+        for hybrid_target in [target, label]:
+            assert torch.allclose(
+                hybrid_loss(prediction, hybrid_target, params), expected, atol=1e-5
+            ), "loss mismatch for {}".format(hybrid_loss.__name__)
+
+    # deep supervision resamples the one-hot encoded target into "soft" labels
+    from GANDLF.compute.loss_and_metric import get_loss_and_metrics
+
+    deep_params = {
+        "model": {
+            "class_list": class_list,
+            "num_classes": num_classes,
+            "dimension": 3,
+            "architecture": "deep_unet",
+        },
+        "problem_type": "segmentation",
+        "penalty_weights": params["penalty_weights"],
+        "metrics": [],
+    }
+    deep_prediction = [
+        torch.softmax(torch.rand(2, num_classes, 16 // s, 16 // s, 8 // s), dim=1)
+        for s in [1, 2, 4, 8]
+    ]
+    for loss_name in ["dcce", "dcce_logits"]:
+        deep_params["loss_function"] = loss_name
+        loss, _ = get_loss_and_metrics(label, label, deep_prediction, deep_params)
+        assert torch.isfinite(loss), "deep supervision loss is not finite"
+
+    for loss_class in [
+        MulticlassDiceLoss,
+        MulticlassMCCLoss,
+        MulticlassTverskyLoss,
+        MulticlassFocalLoss,
+    ]:
+        loss_function = loss_class(params)
+        expected = (
+            sum(
+                loss_function._optional_loss_operations(
+                    loss_function._compute_single_class_loss(prediction, target, i)
+                )
+                * params["penalty_weights"][i]
+                for i in range(num_classes)
+            )
+            / num_classes
+        )
+        assert torch.allclose(
+            loss_function(prediction, target), expected, atol=1e-5
+        ), "loss mismatch for {}".format(loss_class.__name__)
+
+    print("passed")
+
+
+def test_generic_fused_segmentation_metrics():
+    print("68: Starting test for fused segmentation metrics")
+    from GANDLF.losses.segmentation import dice
+    from GANDLF.metrics import global_metrics_dict, segmentation_statistics_metrics
+    from GANDLF.compute.loss_and_metric import get_loss_and_metrics
+
+    num_classes = 3
+    params = {
+        "model": {
+            "num_classes": num_classes,
+            "class_list": list(range(num_classes)),
+            "ignore_label_validation": 0,
+            "dimension": 3,
+            "architecture": "unet",
+        },
+        "problem_type": "segmentation",
+        "loss_function": "dc",
+        "penalty_weights": None,
+        "metrics": list(segmentation_statistics_metrics.keys()),
+    }
+    prediction = torch.rand(2, num_classes, 16, 16, 8)
+    label = torch.randint(0, num_classes - 1, (2, 1, 16, 16, 8))
+    target = one_hot(label, params["model"]["class_list"])
+    # an empty class in both the thresholded prediction and the target
+    prediction[:, 2, ...] *= 0.1
+    classes = [1, 2]
+
+    # reference implementations computing each class separately
+    def get_ratios(predicted, ground_truth):
+        predicted, ground_truth = predicted >= 0.5, ground_truth >= 0.5
+        tp = (predicted & ground_truth).sum().item()
+        fp = (predicted & ~ground_truth).sum().item()
+        fn = (~predicted & ground_truth).sum().item()
+        tn = (~predicted & ~ground_truth).sum().item()
+        sensitivity = 1.0 if tp + fp + fn == 0 else tp / (tp + fn)
+        precision = 1.0 if tp + fp + fn == 0 else tp / (tp + fp)
+        return sensitivity, tn / (tn + fp), precision
+
+    expected = {}
+    expected["dice_per_label"] = torch.stack(
+        [dice(prediction[:, i, ...], target[:, i, ...]) for i in classes]
+    )
+    expected["dice"] = expected["dice_per_label"].mean()
+    binary_dice = torch.stack(
+        [
+            dice(
+                (prediction[:, i, ...] >= 0.5).double(),
+                (target[:, i, ...] >= 0.5).double(),
+            )
+            for i in classes
+        ]
+    )
+    expected["jaccard_per_label"] = binary_dice / (2 - binary_dice)
+    expected["jaccard"] = expected["jaccard_per_label"].mean()
+    ratios = torch.tensor(
+        [
+            get_ratios(prediction[b, i, ...], target[b, i, ...])
+            for b in range(prediction.shape[0])
+            for i in classes
+        ]
+    )
+    for index, name in enumerate(
+        ["sensitivity", "specificity_segmentation", "precision_segmentation"]
+    ):
+        expected[name + "_per_label"] = ratios[:, index]
+        expected[name] = ratios[:, index].mean()
+
+    # the metric functions and the shared statistics in the training loop give the same results
+    _, metric_output = get_loss_and_metrics(None, label, prediction, params)
+    for metric in params["metrics"]:
+        output = global_metrics_dict[metric](prediction, target, params)
+        for current_output in [output, metric_output[metric]]:
+            assert torch.allclose(
+                current_output.float(), expected[metric].float(), atol=1e-5
+            ), "metric mismatch for {}".format(metric)
+
+    print("passed")
+
+
+def test_generic_surface_distance_metrics():
+    print("69: Starting test for surface distance metrics")
+    from scipy.ndimage import binary_erosion, distance_transform_edt
+    from GANDLF.metrics.segmentation import (
+        _get_surface_distances,
+        _calculator_generic_all_surface_distances,
+        _nsd_base,
+    )
+
+    # reference implementation computing the distance transforms of the full image
+    def get_surface_distances(prediction, target, spacing):
+        if not prediction.any() or not target.any():
+            return 0
+        prediction_border = prediction ^ binary_erosion(prediction)
+        target_border = target ^ binary_erosion(target)
+        return distance_transform_edt(~target_border, sampling=spacing)[
+            prediction_border
+        ]
+
+    def get_metrics(prediction, target, spacing, threshold):
+        a_to_b = get_surface_distances(prediction, target, spacing)
+        b_to_a = get_surface_distances(target, prediction, spacing)
+        distances = np.hstack((a_to_b, b_to_a))
+        return (
+            _nsd_base(a_to_b, b_to_a, threshold),
+            np.percentile(distances, 100),
+            np.percentile(distances, 95),
+        )
+
+    generator = np.random.default_rng(0)
+    spacing = np.array([1.0, 0.5, 2.0])
+    for _ in range(5):
+        prediction = np.zeros((48, 40, 32), dtype=bool)
+        target = np.zeros_like(prediction)
+        # small structures, one of which touches the border of the image
+        for array in [prediction, target]:
+            for _ in range(2):
+                start = generator.integers(0, 40, 3)
+                size = generator.integers(2, 8, 3)
+                array[tuple(slice(a, a + b) for a, b in zip(start, size))] = True
+        expected = [
+            np.sort(get_surface_distances(prediction, target, spacing)),
+            np.sort(get_surface_distances(target, prediction, spacing)),
+        ]
+        for use_kdtree in [False, True]:
+            distances = _get_surface_distances(
+                prediction, target, spacing, use_kdtree=use_kdtree
+            )
+            for current, current_expected in zip(distances, expected):
+                assert np.allclose(np.sort(current), current_expected)
+
+    # empty structures give zero for all metrics
+    distances = _get_surface_distances(prediction, np.zeros_like(target), spacing)
+    assert distances == (0, 0)
+
+    # the metrics of all samples and classes, with and without workers
+    num_classes = 3
+    label = torch.from_numpy(generator.integers(0, num_classes, (2, 1, 24, 20, 16)))
+    prediction = one_hot(label, list(range(num_classes)))
+    label[:, :, 4:8, ...] = 0
+    target = one_hot(label, list(range(num_classes)))
+    params = {
+        "model": {"num_classes": num_classes, "ignore_label_validation": 0},
+        "subject_spacing": torch.Tensor([[1.0, 0.5, 2.0], [2.0, 1.0, 1.0]]),
+    }
+    threshold = max(min(params["subject_spacing"][0]).item(), 1)
+    expected = torch.tensor(
+        [
+            get_metrics(
+                prediction[b, i, ...].numpy().astype(bool),
+                target[b, i, ...].numpy().astype(bool),
+                params["subject_spacing"][b].numpy(),
+                threshold,
+            )
+            for b in range(2)
+            for i in range(1, num_classes)
+        ],
+        dtype=torch.float64,
+    )
+    for workers in [0, 2]:
+        params["surface_distance_workers"] = workers
+        per_label = _calculator_generic_all_surface_distances(
+            prediction, target, params, per_label=True
+        )
+        average = _calculator_generic_all_surface_distances(prediction, target, params)
+        for index in range(3):
+            assert torch.allclose(per_label[index], expected[:, index])
+            assert torch.allclose(average[index], expected[:, index].mean())
+
+    print("passed")
+
+
+def test_generic_overall_stats_calculator():
+    print("70: Starting test for overall stats calculators")
+    import torchmetrics
+    from GANDLF.metrics import OverallStatsCalculator, overall_stats
+    from GANDLF.metrics.synthesis import (
+        mean_squared_error,
+        root_mean_squared_error,
+        peak_signal_noise_ratio,
+        mean_squared_log_error,
+        mean_absolute_error,
+    )
+
+    generator = torch.Generator().manual_seed(0)
+    for problem_type, num_classes in [
+        ("classification", 2),
+        ("classification", 3),
+        ("regression", 1),
+    ]:
+        params = {
+            "problem_type": problem_type,
+            "model": {"num_classes": num_classes},
+            "scaling_factor": 2,
+        }
+        prediction = torch.randint(0, num_classes + 1, (20,), generator=generator)
+        target = torch.randint(0, num_classes + 1, (20,), generator=generator)
+        if problem_type == "classification":
+            prediction, target = prediction % num_classes, target % num_classes
+        prediction, target = prediction.float(), target.float()
+        expected = overall_stats(prediction, target, params)
+
+        # the calculators are only instantiated once and accumulate across batches and epochs
+        calculator = OverallStatsCalculator(params)
+        assert calculator.metric_names == list(expected.keys())
+        for _ in range(2):
+            calculator.reset()
+            for batch in range(0, 20, 3):
+                calculator.update(
+                    prediction[batch : batch + 3], target[batch : batch + 3]
+                )
+            output = calculator.compute()
+            for metric in expected:
+                assert np.allclose(
+                    output[metric], expected[metric], atol=1e-5, equal_nan=True
+                ), "mismatch for {} of {}".format(metric, problem_type)
+
+    # the synthesis metrics give the same results as the torchmetrics objects
+    prediction = torch.rand(1, 1, 16, 16, generator=generator) * 10
+    target = torch.rand(1, 1, 16, 16, generator=generator) * 10
+    for function, metric in [
+        (mean_squared_error, torchmetrics.MeanSquaredError()),
+        (root_mean_squared_error, torchmetrics.MeanSquaredError(squared=False)),
+        (mean_squared_log_error, torchmetrics.MeanSquaredLogError()),
+        (mean_absolute_error, torchmetrics.MeanAbsoluteError()),
+    ]:
+        assert torch.allclose(function(prediction, target), metric(prediction, target))
+    for current_target in [target, target - 5]:
+        assert torch.allclose(
+            peak_signal_noise_ratio(current_target, prediction),
+            torchmetrics.PeakSignalNoiseRatio()(prediction, current_target),
+        )
+    assert torch.allclose(
+        peak_signal_noise_ratio(target, prediction, data_range=(0, 5)),
+        torchmetrics.PeakSignalNoiseRatio(data_range=5)(prediction, target),
+    )
+
+    print("passed")
+
+
+def test_generic_label_overlap_measures():
+    print("71: Starting test for label overlap measures from the confusion tensor")
+    from GANDLF.metrics.segmentation import (
+        get_segmentation_statistics,
+        get_label_overlap_measures,
+    )
+
+    generator = torch.Generator().manual_seed(0)
+    label = torch.randint(0, 3, (1, 1, 16, 16, 8), generator=generator)
+    prediction = label.clone()
+    prediction[..., :4] = torch.randint(0, 3, (1, 1, 16, 16, 4), generator=generator)
+    # class 3 is empty in both, class 4 only in the prediction, class 5 only in the target
+    prediction[..., 0, 0, 0] = 4
+    label[..., 1, 1, 1] = 5
+    class_list = [0, 1, 2, 3, 4, 5]
+    label_one_hot = one_hot(label, class_list)
+    prediction_one_hot = one_hot(prediction, class_list)
+
+    statistics = get_segmentation_statistics(prediction_one_hot, label_one_hot)
+    output = get_label_overlap_measures(statistics["confusion"][0])
+    for class_index, _ in enumerate(class_list):
+        label_overlap_filter = sitk.LabelOverlapMeasuresImageFilter()
+        label_overlap_filter.Execute(
+            sitk.GetImageFromArray(label_one_hot[0, class_index].long()),
+            sitk.GetImageFromArray(prediction_one_hot[0, class_index].long()),
+        )
+        for measure, values in output.items():
+            assert np.isclose(
+                values[class_index],
+                getattr(
+                    label_overlap_filter, "Get" + measure[0].upper() + measure[1:]
+                )(),
+            ), "mismatch for {} of class {}".format(measure, class_index)
+
+    print("passed")
+
+
+def test_generic_predictions_writer():
+    print("72: Starting test for streaming predictions writer")
+    from GANDLF.utils import PredictionsWriter
+
+    file_to_write = os.path.join(outputDir, "predictions.csv")
+    columns = ["SubjectID", "x_coords", "y_coords", "output"]
+    rows = [["subject", i, 2 * i, np.float32(i / 3)] for i in range(25)]
+    with PredictionsWriter(file_to_write, columns, chunk_size=10) as writer:
+        writer.write_rows(rows[:5])
+        # only full chunks are written
+        assert len(open(file_to_write).read().splitlines()) == 1
+        writer.write_rows(rows[5:])
+        assert len(open(file_to_write).read().splitlines()) == 21
+    output = pd.read_csv(file_to_write)
+    assert list(output.columns) == columns
+    assert output.shape[0] == len(rows)
+    assert np.allclose(output["output"], [row[-1] for row in rows])
+
+    with pytest.raises(AssertionError):
+        PredictionsWriter(file_to_write, columns, output_format="xlsx")
+
+    sanitize_outputDir()
+
+    print("passed")
+
+
+def test_generic_patch_coordinates_in_mask():
+    print(
+        "73: Starting test for patch coordinates from the summed-area table of a mask"
+    )
+    from GANDLF.data.inference_dataloader_histopath import get_patch_coordinates_in_mask
+
+    mask = np.zeros((90, 120), dtype=np.uint8)
+    mask[20:35, 70:100] = 1
+    mask[60, 10] = 1
+    patch_size, stride_size = (16, 12), (8, 6)
+
+    # the same as checking each patch of the mask at the resolution of the level
+    expected = []
+    for row in range(
+        0, mask.shape[0] - (patch_size[0] + stride_size[0]), stride_size[0]
+    ):
+        for col in range(
+            0, mask.shape[1] - (patch_size[1] + stride_size[1]), stride_size[1]
+        ):
+            if np.any(mask[row : row + patch_size[0], col : col + patch_size[1]]):
+                expected.append([col, row])
+    points = get_patch_coordinates_in_mask(mask, mask.shape, patch_size, stride_size)
+    assert np.array_equal(points, np.array(expected))
+
+    # a lower resolution mask keeps every patch that contains tissue
+    points_low_resolution = get_patch_coordinates_in_mask(
+        mask.reshape(30, 3, 40, 3).max(axis=(1, 3)), mask.shape, patch_size, stride_size
+    )
+    assert {tuple(point) for point in expected} <= {
+        tuple(point) for point in points_low_resolution
+    }
+
+    # all patches are returned without a mask
+    points = get_patch_coordinates_in_mask(None, mask.shape, patch_size, stride_size)
+    assert points.shape == (len(range(0, 66, 8)) * len(range(0, 102, 6)), 2)
+
+    print("passed")
+
+
+def test_generic_tissue_mask_cache():
+    print("74: Starting test for tissue mask cache")
+    from GANDLF.data.patch_miner.opm.tissue_cache import TissueMaskCache
+    from GANDLF.data.inference_dataloader_histopath import InferTumorSegDataset
+
+    sanitize_outputDir()
+    cache_dir = os.path.join(outputDir, "tissue_cache")
+    slide_path = os.path.join(inputDir, "2d_histo_segmentation", "1", "image.tiff")
+    tissue_cache = TissueMaskCache(cache_dir)
+
+    # masks and coordinates are only generated once per slide and parameters
+    generated = []
+    mask = np.random.default_rng(0).random((37, 53)) > 0.5
+
+    def generate_mask():
+        generated.append("mask")
+        return mask
+
+    for _ in range(2):
+        cached_mask = tissue_cache.get_mask(slide_path, {"scale": 16}, generate_mask)
+        assert np.array_equal(cached_mask, mask)
+        # the cached mask can be modified without affecting the cache
+        cached_mask[:] = False
+    tissue_cache.get_mask(slide_path, {"scale": 8}, generate_mask)
+    assert generated == ["mask", "mask"]
+
+    # the inference dataset gives the same patches with and without the cache
+    expected = InferTumorSegDataset(slide_path, [64, 64], None, 0, 0)._points
+    for _ in range(2):
+        points = InferTumorSegDataset(
+            slide_path, [64, 64], None, 0, 0, tissue_cache_dir=cache_dir
+        )._points
+        assert np.array_equal(points, expected)
+
+    # the fallback to the entire image is not cached if the mask cannot be computed
+    import GANDLF.data.inference_dataloader_histopath as inference_dataloader
+
+    def failing_tissue_mask(image):
+        raise ValueError("tissue mask failure")
+
+    fallback_cache_dir = os.path.join(outputDir, "tissue_cache_fallback")
+    original_tissue_mask = inference_dataloader.tissue_mask
+    inference_dataloader.tissue_mask = failing_tissue_mask
+    try:
+        fallback_dataset = InferTumorSegDataset(
+            slide_path, [64, 64], None, 0, 0, tissue_cache_dir=fallback_cache_dir
+        )
+    finally:
+        inference_dataloader.tissue_mask = original_tissue_mask
+    assert np.array_equal(
+        fallback_dataset._points, fallback_dataset._get_patch_coordinates(None)
+    )
+    assert not any(
+        files for _, _, files in os.walk(fallback_cache_dir)
+    ), "fallback mask was cached"
+    points = InferTumorSegDataset(
+        slide_path, [64, 64], None, 0, 0, tissue_cache_dir=fallback_cache_dir
+    )._points
+    assert np.array_equal(points, expected)
+
+    sanitize_outputDir()
+
+    print("passed")
+
+
+def test_generic_tiled_slide_reader():
+    print("75: Starting test for tiled slide reader")
+    import openslide
+    from GANDLF.data.patch_miner.opm.slide_reader import TiledSlideReader
+
+    slide_path = os.path.join(inputDir, "2d_histo_segmentation", "1", "image.tiff")
+    slide = openslide.open_slide(slide_path)
+    # a small cache of unaligned tiles, so that regions span several tiles and tiles are evicted
+    reader = TiledSlideReader(slide, cache_mb=0.05, tile_size=37)
+    assert reader._max_tiles > 0
+    # attributes of the slide are delegated
+    assert reader.dimensions == slide.dimensions
+
+    rng = np.random.default_rng(0)
+    width, height = slide.dimensions
+    for _ in range(20):
+        size = tuple(int(s) for s in rng.integers(1, 100, size=2))
+        # regions may extend beyond the slide
+        location = (
+            int(rng.integers(0, width - size[0] // 2)),
+            int(rng.integers(0, height - size[1] // 2)),
+        )
+        expected = np.asarray(slide.read_region(location, 0, size).convert("RGB"))
+        for _ in range(2):
+            assert np.array_equal(reader.read_rgb_region(location, 0, size), expected)
+    assert len(reader._tiles) <= reader._max_tiles
+
+    # regions are read directly if the cache is disabled
+    reader = TiledSlideReader(slide)
+    expected = np.asarray(slide.read_region((10, 20), 0, (64, 32)).convert("RGB"))
+    assert np.array_equal(reader.read_rgb_region((10, 20), 0, (64, 32)), expected)
+    assert len(reader._tiles) == 0
+
+    print("passed")
+
+
+def test_generic_slide_readers():
+    print("76: Starting test for slide reader backends")
+    import openslide, tifffile
+    from GANDLF.data.patch_miner.opm.slide_reader import (
+        TiledSlideReader,
+        get_slide_property,
+        open_slide,
+    )
+
+    sanitize_outputDir()
+    image = np.asarray(
+        openslide.open_slide(
+            os.path.join(inputDir, "2d_histo_segmentation", "1", "image.tiff")
+        )
+        .read_region((0, 0), 0, (300, 200))
+        .convert("RGB")
+    )
+    # a tiled and compressed pyramid, and a plain grayscale TIFF with strips
+    pyramid_path = os.path.join(outputDir, "pyramid.tiff")
+    with tifffile.TiffWriter(pyramid_path) as tiff_writer:
+        tiff_writer.write(
+            image,
+            tile=(64, 64),
+            compression="zlib",
+            photometric="rgb",
+            resolution=(2000, 2000),
+            resolutionunit="CENTIMETER",
+        )
+        tiff_writer.write(
+            cv2.resize(image, (150, 100), interpolation=cv2.INTER_AREA),
+            tile=(64, 64),
+            compression="zlib",
+            photometric="rgb",
+            subfiletype=1,
+        )
+    plain_path = os.path.join(outputDir, "plain.tiff")
+    tifffile.imwrite(plain_path, image[..., 0], rowsperstrip=7)
+
+    for slide_path in [pyramid_path, plain_path]:
+        expected_slide = open_slide(slide_path, "openslide")
+        slide = open_slide(slide_path, "tifffile")
+        assert slide.level_dimensions == expected_slide.level_dimensions
+        assert slide.level_downsamples == expected_slide.level_downsamples
+        for axis in ["mpp-x", "mpp-y"]:
+            expected_mpp = get_slide_property(expected_slide, axis)
+            mpp = get_slide_property(slide, axis)
+            assert (mpp is None and expected_mpp is None) or (
+                float(mpp) == float(expected_mpp)
+            )
+        for downsample in [0.5, 1, 1.5, 2, 100]:
+            assert slide.get_best_level_for_downsample(
+                downsample
+            ) == expected_slide.get_best_level_for_downsample(downsample)
+        assert np.array_equal(
+            np.asarray(slide.get_thumbnail((64, 64))),
+            np.asarray(expected_slide.get_thumbnail((64, 64))),
+        )
+
+        rng = np.random.default_rng(0)
+        for _ in range(20):
+            level = int(rng.integers(0, slide.level_count))
+            downsample = int(slide.level_downsamples[level])
+            width, height = slide.level_dimensions[level]
+            size = tuple(int(s) for s in rng.integers(1, 100, size=2))
+            # regions may extend beyond the slide
+            location = (
+                int(rng.integers(-20, width)) * downsample,
+                int(rng.integers(-20, height)) * downsample,
+            )
+            assert np.array_equal(
+                np.asarray(slide.read_region(location, level, size)),
+                np.asarray(expected_slide.read_region(location, level, size)),
+            )
+        # the tiled reader works with any backend
+        assert np.array_equal(
+            TiledSlideReader(slide, cache_mb=1, tile_size=32).read_rgb_region(
+                (64, 32), 0, (100, 90)
+            ),
+            np.asarray(
+                expected_slide.read_region((64, 32), 0, (100, 90)).convert("RGB")
+            ),
+        )
+        slide.close()
+
+    # forked workers of a DataLoader share the slide, and with it the offset of the file
+    class RegionDataset(torch.utils.data.Dataset):
+        def __init__(self, slide, locations):
+            self.slide = slide
+            self.locations = locations
+
+        def __len__(self):
+            return len(self.locations)
+
+        def __getitem__(self, index):
+            return torch.from_numpy(
+                np.asarray(self.slide.read_region(self.locations[index], 0, (96, 96)))
+            )
+
+    slide = open_slide(pyramid_path, "tifffile")
+    expected_slide = open_slide(pyramid_path, "openslide")
+    locations = [(x, y) for x in range(0, 300, 16) for y in range(0, 200, 16)] * 4
+    loader = torch.utils.data.DataLoader(
+        RegionDataset(slide, locations),
+        batch_size=8,
+        num_workers=4,
+        multiprocessing_context="fork",
+    )
+    for batch_index, regions in enumerate(loader):
+        for index, region in enumerate(regions):
+            location = locations[batch_index * 8 + index]
+            assert np.array_equal(
+                region.numpy(),
+                np.asarray(expected_slide.read_region(location, 0, (96, 96))),
+            ), "region mismatch in forked workers"
+    slide.close()
+
+    with pytest.raises(Exception) as exc_info:
+        open_slide(plain_path, "unknown")
+    print("Exception raised:", exc_info.value)
+
+    sanitize_outputDir()
+
+    print("passed")
+
+
+def test_generic_tiled_heatmaps():
+    print("77: Starting test for tiled heatmaps")
+    import openslide, tifffile
+    from GANDLF.compute.inference_loop import _read_overview_image, _write_tiled_image
+
+    sanitize_outputDir()
+    image = np.random.default_rng(0).integers(0, 256, (100, 130, 3), dtype=np.uint8)
+
+    def render_region(region):
+        return image[region]
+
+    # the png is rendered tile by tile
+    png_path = os.path.join(outputDir, "heatmap.png")
+    _write_tiled_image(png_path, image.shape[:2], render_region, "png", tile_size=32)
+    assert np.array_equal(cv2.imread(png_path), image)
+
+    # the tiff is a pyramid with levels that fit in a tile, and is stored in RGB
+    tiff_path = os.path.join(outputDir, "heatmap.tiff")
+    _write_tiled_image(tiff_path, image.shape[:2], render_region, "tiff", tile_size=32)
+    with tifffile.TiffFile(tiff_path) as tiff:
+        levels = [page.asarray() for page in tiff.pages]
+    assert len(levels) == 4
+    for level, downsample in enumerate([1, 2, 4, 8]):
+        assert np.array_equal(levels[level], image[::downsample, ::downsample, ::-1])
+    assert openslide.open_slide(tiff_path).level_count == 4
+
+    # the overview image is the same when the slide level is read in bands
+    slide = openslide.open_slide(
+        os.path.join(inputDir, "2d_histo_segmentation", "1", "image.tiff")
+    )
+    width, height = slide.dimensions
+    expected = np.asarray(slide.read_region((0, 0), 0, (width, height)).convert("RGB"))
+    overview_image = _read_overview_image(
+        slide, 0, (height, width), 1, outputDir, band_height=64
+    )
+    assert np.array_equal(overview_image, expected[..., ::-1])
+    overview_image = _read_overview_image(slide, 0, (50, 40), 8)
+    assert overview_image.shape == (50, 40, 3)
+    overview_image = None
+
+    sanitize_outputDir()
+
+    print("passed")
+
+
+def test_train_inference_segmentation_histology_output_maps(device):
+    print(
+        "78: Starting histology inference tests for downsampled and memory-mapped maps"
+    )
+    from GANDLF.compute.inference_loop import _normalize_inference_maps
+
+    # the normalization in bands gives the same maps, and the count image saturates instead of wrapping
+    count_map = np.random.default_rng(0).integers(0, 300, (37, 23)).astype(np.uint16)
+    probs_map = (np.random.default_rng(1).random((2, 37, 23)) * count_map).astype(
+        np.float16
+    )
+    expected_probs_map = probs_map.copy()
+    np.divide(
+        expected_probs_map, count_map, out=expected_probs_map, where=count_map > 0
+    )
+    expected_count_map = np.minimum(count_map.astype(np.int64) * 255, 65535)
+    max_probability = _normalize_inference_maps(probs_map, count_map, band_height=8)
+    assert np.array_equal(probs_map, expected_probs_map)
+    assert np.array_equal(count_map, expected_count_map)
+    assert max_probability == expected_probs_map.max()
+
+    sanitize_outputDir()
+    # a small model is trained on radiology data, since only the inference maps are checked
+    parameters = ConfigManager(
+        testingDir + "/config_segmentation.yaml", version_check_flag=False
+    )
+    training_data, parameters["headers"] = parseTrainingCSV(
+        inputDir + "/train_2d_rad_segmentation.csv"
+    )
+    parameters["patch_size"] = patch_size["2D"]
+    parameters["modality"] = "rad"
+    parameters["model"]["dimension"] = 2
+    parameters["model"]["class_list"] = [0, 255]
+    parameters["model"]["num_channels"] = 3
+    parameters["model"]["architecture"] = "unet"
+    parameters["model"]["onnx_export"] = False
+    parameters["model"]["print_summary"] = False
+    parameters["nested_training"]["testing"] = 1
+    parameters["nested_training"]["validation"] = -2
+    parameters["num_epochs"] = 1
+    parameters["metrics"] = ["dice"]
+    parameters = populate_header_in_parameters(parameters, parameters["headers"])
+    modelDir = os.path.join(outputDir, "modelDir")
+    Path(modelDir).mkdir(parents=True, exist_ok=True)
+    TrainingManager(
+        dataframe=training_data,
+        outputDir=modelDir,
+        parameters=parameters,
+        device=device,
+        resume=False,
+        reset=True,
+    )
+
+    inference_data, parameters["headers"] = parseTrainingCSV(
+        inputDir + "/train_2d_histo_segmentation.csv", train=False
+    )
+    inference_data = inference_data.iloc[:1]
+    subject_id = str(inference_data.iloc[0]["SubjectID"])
+    parameters["modality"] = "histo"
+    parameters["histopath_batch_size"] = 4
+    outputs = {}
+    for output_downsample in [1, 2]:
+        for memmap in [False, True]:
+            inference_dir = os.path.join(
+                outputDir, "inference_{}_{}".format(output_downsample, memmap)
+            )
+            parameters["histopath_output_downsample"] = output_downsample
+            parameters["histopath_memmap_dir"] = (
+                os.path.join(outputDir, "memmap") if memmap else None
+            )
+            InferenceManager(
+                dataframe=inference_data,
+                modelDir=modelDir,
+                outputDir=inference_dir,
+                parameters=parameters,
+                device=device,
+            )
+            outputs[(output_downsample, memmap)] = {
+                image_name: cv2.imread(
+                    os.path.join(inference_dir, subject_id, image_name),
+                    cv2.IMREAD_UNCHANGED,
+                )
+                for image_name in [
+                    subject_id + "_count.png",
+                    "seg_map_1.png",
+                    "probability_map1_jet.png",
+                    "probability_map_blended_1_jet.png",
+                ]
+            }
+
+    for output_downsample in [1, 2]:
+        # the memory-mapped maps give the same outputs as the maps in memory
+        for image_name, image in outputs[(output_downsample, False)].items():
+            assert np.array_equal(
+                image, outputs[(output_downsample, True)][image_name]
+            ), ("memory-mapped output mismatch for " + image_name)
+    # the downsampled maps are half the size, and the counts of the patches are the same
+    for image_name, image in outputs[(1, False)].items():
+        downsampled_image = outputs[(2, False)][image_name]
+        assert downsampled_image.shape[:2] == (
+            -(-image.shape[0] // 2),
+            -(-image.shape[1] // 2),
+        ), ("downsampled output shape mismatch for " + image_name)
+    count_image = outputs[(1, False)][subject_id + "_count.png"]
+    assert np.array_equal(
+        count_image[::2, ::2], outputs[(2, False)][subject_id + "_count.png"]
+    )
+    # the segmentation of the downsampled maps mostly agrees with the full resolution one
+    seg_map = outputs[(1, False)]["seg_map_1.png"][::2, ::2]
+    assert np.mean(seg_map == outputs[(2, False)]["seg_map_1.png"]) > 0.9
+
+    sanitize_outputDir()
+
+    print("passed")